@@ -72,7 +72,14 @@ class CodeModificationMixin:
             file_context.add_test_file(file_path)
         elif self._code_index:
             # If the file is not a test file, find test files that might be related to the file
-            search_results = self._code_index.find_test_files(file_path, query=file_path, max_results=2, max_spans=2)
+            # The index is shared by all branches of a search, files created in this branch are passed separately
+            search_results = self._code_index.find_test_files(
+                file_path,
+                query=file_path,
+                max_results=2,
+                max_spans=2,
+                created_files=file_context.get_created_files(),
+            )
 
             for search_result in search_results:
                 file_context.add_test_file(search_result.file_path)
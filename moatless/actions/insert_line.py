@@ -125,7 +125,7 @@ class InsertLine(Action, CodeActionValueMixin, CodeModificationMixin):
         snippet = "\n".join(snippet_lines)
 
         diff = do_diff(str(path), file_text, new_file_text)
-        context_file.apply_changes(new_file_text)
+        context_file.apply_changes(new_file_text, replaced_lines=(args.insert_line, args.insert_line))
 
         # Format the snippet with line numbers
         snippet_with_lines = "\n".join(
@@ -322,13 +322,16 @@ class StringReplace(Action, CodeActionValueMixin, CodeModificationMixin):
             logger.info(f"Do targeted replacement on line {start_pos}")
 
             new_file_content = file_content[:start_pos] + new_str + file_content[start_pos + len(old_str) :]
+            replaced_start_line = match["start_line"]
         else:
             new_file_content = file_content.replace(args.old_str, args.new_str)
+            replaced_start_line = start_line
 
-        # Generate diff and apply changes
+        # Generate diff and apply changes, only the lines with the replaced string are diffed
+        replaced_lines = (replaced_start_line - 1, replaced_start_line + old_str.count("\n"))
         diff = do_diff(str(path), file_content, new_file_content)
 
-        context_file.apply_changes(new_file_content)
+        context_file.apply_changes(new_file_content, replaced_lines=replaced_lines)
 
         # Create a snippet of the edited section
         snippet_start_line = max(0, start_line - SNIPPET_LINES - 1)
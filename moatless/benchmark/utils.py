@@ -9,6 +9,7 @@ from moatless.loop import AgenticLoop
 from moatless.repository import FileRepository
 from moatless.schema import FileWithSpans
 from moatless.search_tree import SearchTree
+from moatless.utils.trajectory_file import TRAJECTORY_SUFFIX
 
 IGNORED_SPANS = ["docstring", "imports"]
 
@@ -366,6 +367,8 @@ def read_search_trees(dir: str) -> list[SearchTree]:
     search_trees = []
     for root, _, files in os.walk(dir):
         trajectory_path = os.path.join(root, "trajectory.json")
+        if not os.path.exists(trajectory_path):
+            trajectory_path = os.path.join(root, "trajectory" + TRAJECTORY_SUFFIX)
         if not os.path.exists(trajectory_path):
             continue
 
@@ -374,7 +377,7 @@ def read_search_trees(dir: str) -> list[SearchTree]:
                 logger.warning(f"Empty trajectory file: {trajectory_path}")
                 continue
 
-            search_tree = SearchTree.from_file(trajectory_path)
+            search_tree = SearchTree.from_file(trajectory_path, lazy=True)
             search_trees.append(search_tree)
         except Exception as e:
             logger.exception(f"Failed to load trajectory from {trajectory_path}: {e}")
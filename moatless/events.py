@@ -0,0 +1,99 @@
+"""
+Events emitted by search trees and agentic loops to their event handlers.
+
+Event payloads can be passed as a function that creates the payload, which is only called if there are handlers, so
+a search without handlers doesn't dump models or compute statistics for events nobody reads.
+
+Handlers are called on the thread that emits the event by default. With an `EventQueue` the events are created on the
+emitting thread, and dispatched to the handlers on a background thread instead, so a slow handler like a report
+writer doesn't stall the search. The queue is bounded, and the oldest event is dropped when it's full. Lifecycle
+events, like the event a search is completed with, are never dropped.
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+EventPayload = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
+
+LIFECYCLE_EVENT_TYPES = frozenset({"tree_started", "tree_completed", "loop_started", "loop_completed", "loop_error"})
+
+_STOP = object()
+
+
+def create_event(event_type: str, data: EventPayload) -> Dict[str, Any]:
+    if callable(data):
+        data = data()
+
+    return {
+        "event_type": event_type,
+        "data": data,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+class EventQueue:
+    """Dispatches events to the handlers in the order they were put, on a background thread."""
+
+    def __init__(self, handlers: List[Callable], max_size: int = 1000):
+        # The list is shared with the owner, so handlers added later get the events as well
+        self.handlers = handlers
+        self.max_size = max_size
+        self.dropped = 0
+        self._events: deque = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch, name="event-queue", daemon=True)
+        self._thread.start()
+
+    def put(self, event: Dict[str, Any]):
+        """
+        Queue the event. If the queue is full the oldest event that isn't a lifecycle event is dropped, and if there
+        is no such event this waits until an event is dispatched.
+        """
+        with self._condition:
+            while len(self._events) >= self.max_size:
+                index = next((i for i, queued in enumerate(self._events) if _is_droppable(queued)), None)
+                if index is not None:
+                    dropped = self._events[index]
+                    del self._events[index]
+                    self.dropped += 1
+                    logger.warning(f"Event queue is full, dropped event {dropped['event_type']}")
+                    break
+
+                logger.warning(f"Event queue is full of lifecycle events, waiting to queue event {event['event_type']}")
+                self._condition.wait()
+
+            self._events.append(event)
+            self._condition.notify_all()
+
+    def close(self, timeout: Optional[float] = None):
+        """Dispatch the queued events and stop the background thread."""
+        with self._condition:
+            self._events.append(_STOP)
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._events:
+                    self._condition.wait()
+                event = self._events.popleft()
+                self._condition.notify_all()
+
+            if event is _STOP:
+                return
+
+            for handler in list(self.handlers):
+                try:
+                    handler(event)
+                except Exception:
+                    logger.exception(f"Event handler failed on event {event['event_type']}")
+
+
+def _is_droppable(event: Any) -> bool:
+    return event is not _STOP and event["event_type"] not in LIFECYCLE_EVENT_TYPES
@@ -24,9 +24,11 @@ class Expander(BaseModel):
         if not force_expansion and node.is_fully_expanded():
             return None
 
-        # Return the first unexecuted child if one exists
+        # Return the first unexecuted child if one exists, that is not being executed in a parallel search. Duplicates
+        # are not executed and have no observation.
+        stats = node.get_tree_stats()
         for child in node.children:
-            if not child.observation:
+            if not stats.is_in_flight(child.node_id) and not child.observation and not child.is_duplicate:
                 logger.info(f"Found unexecuted child {child.node_id} for node {node.node_id}")
                 return child
 
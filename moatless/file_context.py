@@ -1,13 +1,14 @@
-import difflib
-import io
+import hashlib
 import json
 import logging
 import os
+import threading
+import weakref
+from bisect import bisect_right
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Set, Tuple
 
 from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
-from unidiff import PatchSet
 
 from moatless.codeblocks import CodeBlockType, get_parser_by_path
 from moatless.codeblocks.codeblocks import (
@@ -23,11 +24,23 @@ from moatless.repository.repository import Repository
 from moatless.runtime.runtime import RuntimeEnvironment, TestResult
 from moatless.runtime.runtime import TestStatus
 from moatless.schema import FileWithSpans
+from moatless.utils.blob_store import Blob, get_blob_store
+from moatless.utils.diff import changes_from_hunks, replace_changes, unified_diff
 from moatless.utils.file import is_test
+from moatless.utils.patch import Hunk, parse_patch
 from moatless.utils.tokenizer import count_tokens
 
 logger = logging.getLogger(__name__)
 
+MAX_CACHED_PROMPTS = 16
+
+# Prompt caches are shared by clones of a file, which may render prompts on different threads in a parallel search
+_prompt_cache_lock = threading.Lock()
+
+# Patched contents by base content hash, file path and patch. File contexts in a search tree share most of their
+# patches, so each version of a file is only derived once as long as a file context references it.
+_patched_contents: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
 
 class ContextSpan(BaseModel):
     span_id: str
@@ -73,9 +86,18 @@ class ContextFile(BaseModel):
 
     # Private attributes
     _initial_patch: Optional[str] = PrivateAttr(None)
-    _cached_base_content: Optional[str] = PrivateAttr(None)
-    _cached_content: Optional[str] = PrivateAttr(None)
+    # Contents are interned in the process wide blob store and shared between file contexts
+    _base_blob: Optional[Blob] = PrivateAttr(None)
+    _content_blob: Optional[Blob] = PrivateAttr(None)
     _cached_module: Optional[Module] = PrivateAttr(None)
+    # Rendered prompts by content hash, spans and render options
+    _prompt_cache: Dict[tuple, str] = PrivateAttr(default_factory=dict)
+
+    # Spans by span id and the merged line ranges of the spans, rebuilt when the spans list is replaced or changed
+    _span_index: Dict[str, ContextSpan] = PrivateAttr(default_factory=dict)
+    _indexed_spans: Optional[List[ContextSpan]] = PrivateAttr(None)
+    _indexed_span_count: int = PrivateAttr(0)
+    _line_index: Optional[tuple] = PrivateAttr(None)
 
     _repo: Repository = PrivateAttr()
 
@@ -126,23 +148,23 @@ class ContextFile(BaseModel):
         if not self._repo:
             return None
 
-        if self._cached_base_content is not None:
-            return self._cached_base_content
+        if self._base_blob is not None:
+            return self._base_blob.content
 
         if not self._repo.file_exists(self.file_path):
-            original_content = ""
+            original_blob = get_blob_store().put("")
         else:
-            original_content = self._repo.get_file_content(self.file_path)
+            original_blob = get_blob_store().put(self._repo.get_file_content(self.file_path))
 
         if self._initial_patch:
             try:
-                self._cached_base_content = self.apply_patch_to_content(original_content, self._initial_patch)
+                self._base_blob = self._get_patched_blob(original_blob, self._initial_patch)
             except Exception as e:
                 raise Exception(f"Failed to apply initial patch: {e}")
         else:
-            self._cached_base_content = original_content
+            self._base_blob = original_blob
 
-        return self._cached_base_content
+        return self._base_blob.content
 
     @property
     def module(self) -> Module | None:
@@ -166,27 +188,62 @@ class ContextFile(BaseModel):
         Returns:
             str: The current content of the file.
         """
-        if self._cached_content is not None:
-            return self._cached_content
+        if self._content_blob is not None:
+            return self._content_blob.content
 
         base_content = self.get_base_content()
         if self.patch:
             try:
-                self._cached_content = self.apply_patch_to_content(base_content, self.patch)
+                self._content_blob = self._get_patched_blob(self._base_blob, self.patch)
             except Exception as e:
                 logger.error(f"Failed to apply patch: {self.patch}")
                 raise e
         else:
-            self._cached_content = base_content
+            self._content_blob = self._base_blob
 
-        return self._cached_content
+        return self._content_blob.content if self._content_blob else base_content
+
+    def _get_patched_blob(self, blob: Blob, patch: str) -> Blob:
+        key = (blob.hash, self.file_path, patch)
+        patched_blob = _patched_contents.get(key)
+        if patched_blob is None:
+            patched_blob = get_blob_store().put(self.apply_patch_to_content(blob.content, patch))
+            _patched_contents[key] = patched_blob
+        return patched_blob
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        """Hash of the current content in the blob store."""
+        if self._content_blob is None:
+            self.content
+        return self._content_blob.hash if self._content_blob else None
+
+    def has_same_content(self, other: "ContextFile") -> bool:
+        """
+        Checks if the current content is the same as in another ContextFile of the same file without comparing the
+        contents. Files with the same base and patch are equal without applying the patch.
+        """
+        if self._repo is other._repo and self._initial_patch == other._initial_patch and self.patch == other.patch:
+            return True
+        return self.content_hash == other.content_hash
+
+    def share_content(self, other: "ContextFile"):
+        """Reuses the contents of another ContextFile of the same file with the same base and patch."""
+        if self._initial_patch != other._initial_patch:
+            return
+        self._base_blob = other._base_blob
+        self._prompt_cache = other._prompt_cache
+        if self.patch == other.patch:
+            self._content_blob = other._content_blob
 
-    def apply_changes(self, updated_content: str) -> set[str]:
+    def apply_changes(self, updated_content: str, replaced_lines: Optional[Tuple[int, int]] = None) -> set[str]:
         """
         Applies new content to the ContextFile by generating a patch between the base content and the new content.
 
         Args:
             updated_content (str): The new content to apply to the file.
+            replaced_lines (Optional[Tuple[int, int]]): The 0-based start and end line of the lines in the current
+                content that were replaced, if known. Only the replaced lines are then diffed to update the patch.
 
         Returns:
             set[str]: Set of new span IDs added to context
@@ -194,20 +251,23 @@ class ContextFile(BaseModel):
         self.was_edited = True
 
         base_content = self.get_base_content()
-        new_patch = self.generate_patch(base_content, updated_content)
+        new_patch = None
+        if replaced_lines:
+            new_patch = self._generate_replacement_patch(base_content, updated_content, *replaced_lines)
+        if new_patch is None:
+            new_patch = self.generate_patch(base_content, updated_content)
         self.patch = new_patch
 
         new_span_ids = set()
 
         # Track modified lines from patch
-        patch_set = PatchSet(io.StringIO(new_patch))
-        for patched_file in patch_set:
-            for hunk in patched_file:
+        for patched_file in parse_patch(new_patch):
+            for hunk in patched_file.hunks:
                 # Get the line range for this hunk's changes
                 modified_start = None
                 modified_end = None
 
-                for line in hunk:
+                for line in hunk.lines:
                     if line.is_added or line.is_removed:
                         # Convert to 0-based line numbers
                         current_line = line.target_line_no if line.is_added else line.source_line_no
@@ -222,7 +282,7 @@ class ContextFile(BaseModel):
                     new_span_ids.update(span_ids)
 
         # Invalidate cached content
-        self._cached_content = None
+        self._content_blob = None
         self._cached_module = None
 
         return new_span_ids
@@ -241,10 +301,14 @@ class ContextFile(BaseModel):
         Raises:
             Exception: If the patch does not contain changes for the specified file or if a context mismatch occurs.
         """
-        patch_set = PatchSet(io.StringIO(patch))
-        patched_content = content
+        hunks = self._get_hunks(patch)
+        if hunks is None:
+            raise Exception(f"Patch does not contain changes for file {self.file_path}")
+
+        return self._apply_hunks(content, hunks)
 
-        for patched_file in patch_set:
+    def _get_hunks(self, patch: str) -> Optional[tuple[Hunk, ...]]:
+        for patched_file in parse_patch(patch):
             patched_file_path = patched_file.path
             # Correctly strip 'a/' or 'b/' prefixes
             if patched_file_path.startswith("a/"):
@@ -252,20 +316,18 @@ class ContextFile(BaseModel):
             elif patched_file_path.startswith("b/"):
                 patched_file_path = patched_file_path[2:]
             if os.path.normpath(patched_file_path) == os.path.normpath(self.file_path):
-                patched_content = self._apply_patched_file(patched_content, patched_file)
-                break
-        else:
-            raise Exception(f"Patch does not contain changes for file {self.file_path}")
+                return patched_file.hunks
 
-        return patched_content
+        return None
 
-    def _apply_patched_file(self, content: str, patched_file) -> str:
+    def _apply_hunks(self, content: str, hunks: tuple[Hunk, ...]) -> str:
         """
-        Applies a single patched file's hunks to the content.
+        Applies the hunks of a single patched file to the content. Unchanged lines are copied in slices, so only
+        the lines in the hunks are processed one by one.
 
         Args:
             content (str): The original content.
-            patched_file: The patched file object from the PatchSet.
+            hunks (tuple[Hunk, ...]): The parsed hunks of the patched file.
 
         Returns:
             str: The patched content.
@@ -277,15 +339,15 @@ class ContextFile(BaseModel):
         new_content_lines = []
         line_no = 0
 
-        for hunk in patched_file:
+        for hunk in hunks:
             try:
                 # Copy unchanged lines before the hunk
-                while line_no < hunk.source_start - 1 and line_no < len(content_lines):
-                    new_content_lines.append(content_lines[line_no])
-                    line_no += 1
+                if line_no < hunk.source_start - 1:
+                    new_content_lines.extend(content_lines[line_no : hunk.source_start - 1])
+                    line_no = max(line_no, min(hunk.source_start - 1, len(content_lines)))
 
                 # Apply changes from the hunk
-                for line in hunk:
+                for line in hunk.lines:
                     if line.is_context:
                         if line_no >= len(content_lines):
                             raise Exception(
@@ -349,18 +411,51 @@ class ContextFile(BaseModel):
         if new_lines and not new_lines[-1].endswith("\n"):
             new_lines[-1] += "\n"
 
-        diff_lines = list(
-            difflib.unified_diff(
-                old_lines,
-                new_lines,
+        return "".join(unified_diff(old_lines, new_lines, fromfile="a/" + self.file_path, tofile="b/" + self.file_path))
+
+    def _generate_replacement_patch(
+        self, base_content: str, updated_content: str, start_line: int, end_line: int
+    ) -> Optional[str]:
+        """
+        Generates the patch from the base content to the updated content, where only the lines from start_line to
+        end_line in the current content were replaced, by updating the changes of the current patch.
+
+        Returns:
+            Optional[str]: The patch, or None if the rest of the updated content differs from the current content.
+        """
+        if not updated_content.endswith("\n") or (base_content and not base_content.endswith("\n")):
+            return None
+
+        current_lines = self.content.splitlines(keepends=True)
+        updated_lines = updated_content.splitlines(keepends=True)
+        new_end_line = end_line + len(updated_lines) - len(current_lines)
+        if not 0 <= start_line <= end_line <= len(current_lines) or new_end_line < start_line:
+            return None
+
+        if current_lines[:start_line] != updated_lines[:start_line] or (
+            current_lines[end_line:] != updated_lines[new_end_line:]
+        ):
+            return None
+
+        changes = []
+        if self.patch:
+            hunks = self._get_hunks(self.patch)
+            if hunks is None:
+                return None
+            changes = changes_from_hunks(hunks)
+
+        base_lines = base_content.splitlines(keepends=True)
+        changes = replace_changes(base_lines, updated_lines, changes, start_line, end_line, new_end_line)
+        return "".join(
+            unified_diff(
+                base_lines,
+                updated_lines,
                 fromfile="a/" + self.file_path,
                 tofile="b/" + self.file_path,
-                # lineterm=''
+                changes=changes,
             )
         )
 
-        return "".join(diff_lines)
-
     def model_dump(self, **kwargs):
         data = super().model_dump(**kwargs)
         # Ensure these fields are excluded even if exclude=True is not in kwargs
@@ -373,7 +468,48 @@ class ContextFile(BaseModel):
 
     @property
     def span_ids(self):
-        return {span.span_id for span in self.spans}
+        return set(self._get_span_index())
+
+    def _get_span_index(self) -> Dict[str, ContextSpan]:
+        if self._indexed_spans is not self.spans or self._indexed_span_count != len(self.spans):
+            span_index = {}
+            for span in self.spans:
+                span_index.setdefault(span.span_id, span)
+            self._span_index = span_index
+            self._indexed_spans = self.spans
+            self._indexed_span_count = len(self.spans)
+        return self._span_index
+
+    def _append_span(self, span: ContextSpan):
+        span_index = self._get_span_index()
+        self.spans.append(span)
+        span_index.setdefault(span.span_id, span)
+        self._indexed_span_count += 1
+
+    def _get_line_index(self) -> tuple[list[int], list[int]]:
+        """Returns the sorted start and end lines of the merged line ranges of the spans in context."""
+        span_index = self._get_span_index()
+        key = (self._cached_module, self._indexed_spans, self._indexed_span_count)
+        if self._line_index is not None and self._line_index[0] == key:
+            return self._line_index[1]
+
+        line_ranges = []
+        for span_id in span_index:
+            block_span = self.module.find_span_by_id(span_id)
+            if block_span:
+                line_ranges.append((block_span.start_line, block_span.end_line))
+        line_ranges.sort()
+
+        starts, ends = [], []
+        for start_line, end_line in line_ranges:
+            if starts and start_line <= ends[-1]:
+                ends[-1] = max(ends[-1], end_line)
+            else:
+                starts.append(start_line)
+                ends.append(end_line)
+
+        self._line_index = (key, (starts, ends))
+        return starts, ends
 
     def to_prompt(
         self,
@@ -386,11 +522,55 @@ class ContextFile(BaseModel):
         only_signatures: bool = False,
         max_tokens: Optional[int] = None,
     ):
-        if self.module:
-            if not self.show_all_spans and self.span_ids is not None and len(self.span_ids) == 0:
-                logger.warning(f"No span ids provided for {self.file_path}, return empty")
-                return ""
+        if self.module and not self.show_all_spans and not self.spans:
+            logger.warning(f"No span ids provided for {self.file_path}, return empty")
+            return ""
+
+        cache_key = (
+            self.content_hash,
+            tuple((span.span_id, span.start_line, span.end_line, span.tokens) for span in self.spans),
+            self.show_all_spans,
+            show_span_ids,
+            show_line_numbers,
+            exclude_comments,
+            show_outcommented_code,
+            outcomment_code_comment,
+            show_all_spans,
+            only_signatures,
+            max_tokens,
+        )
+        with _prompt_cache_lock:
+            prompt = self._prompt_cache.get(cache_key)
+        if prompt is None:
+            prompt = self._render_prompt(
+                show_span_ids=show_span_ids,
+                show_line_numbers=show_line_numbers,
+                exclude_comments=exclude_comments,
+                show_outcommented_code=show_outcommented_code,
+                outcomment_code_comment=outcomment_code_comment,
+                show_all_spans=show_all_spans,
+                only_signatures=only_signatures,
+                max_tokens=max_tokens,
+            )
+            with _prompt_cache_lock:
+                if len(self._prompt_cache) >= MAX_CACHED_PROMPTS:
+                    self._prompt_cache.pop(next(iter(self._prompt_cache), None), None)
+                self._prompt_cache[cache_key] = prompt
+
+        return prompt
 
+    def _render_prompt(
+        self,
+        show_span_ids: bool,
+        show_line_numbers: bool,
+        exclude_comments: bool,
+        show_outcommented_code: bool,
+        outcomment_code_comment: str,
+        show_all_spans: bool,
+        only_signatures: bool,
+        max_tokens: Optional[int],
+    ) -> str:
+        if self.module:
             code = self._to_prompt(
                 code_block=self.module,
                 show_span_id=show_span_ids,
@@ -418,17 +598,7 @@ class ContextFile(BaseModel):
         if not codeblock.belongs_to_span:
             return None
 
-        for span in self.spans:
-            if codeblock.belongs_to_span.span_id == span.span_id:
-                return span
-
-        return None
-
-    def _within_span(self, line_no: int) -> Optional[ContextSpan]:
-        for span in self.spans:
-            if span.start_line and span.end_line and span.start_line <= line_no <= span.end_line:
-                return span
-        return None
+        return self._get_span_index().get(codeblock.belongs_to_span.span_id)
 
     def _to_prompt_with_line_spans(self, show_span_id: bool = False) -> str:
         content_lines = self.content.split("\n")
@@ -436,23 +606,30 @@ class ContextFile(BaseModel):
         if not self.span_ids:
             return self.content
 
-        prompt_content = ""
+        # The first span in context covering each line
+        spans_by_line = {}
+        for span in self.spans:
+            if span.start_line and span.end_line:
+                for line_no in range(span.start_line, span.end_line + 1):
+                    spans_by_line.setdefault(line_no, span)
+
+        parts = []
         outcommented = True
         for i, line in enumerate(content_lines):
             line_no = i + 1
 
-            span = self._within_span(line_no)
+            span = spans_by_line.get(line_no)
             if span:
                 if outcommented and show_span_id:
-                    prompt_content += f"<span id={span.span_id}>\n"
+                    parts.append(f"<span id={span.span_id}>\n")
 
-                prompt_content += line + "\n"
+                parts.append(line + "\n")
                 outcommented = False
             elif not outcommented:
-                prompt_content += "... other code\n"
+                parts.append("... other code\n")
                 outcommented = True
 
-        return prompt_content
+        return "".join(parts)
 
     def _to_prompt(
         self,
@@ -468,15 +645,58 @@ class ContextFile(BaseModel):
         max_tokens: Optional[int] = None,
         current_tokens: int = 0,
     ):
-        if current_span is None:
-            current_span = CurrentPromptSpan()
+        parts = []
+        self._render_children(
+            code_block=code_block,
+            parts=parts,
+            current_span=current_span or CurrentPromptSpan(),
+            show_outcommented_code=show_outcommented_code,
+            outcomment_code_comment=outcomment_code_comment,
+            show_span_id=show_span_id,
+            show_line_numbers=show_line_numbers,
+            exclude_comments=exclude_comments,
+            show_all_spans=show_all_spans,
+            only_signatures=only_signatures,
+            max_tokens=max_tokens,
+            current_tokens=current_tokens,
+        )
+        return "".join(parts)
 
-        contents = ""
+    def _render_children(
+        self,
+        code_block: CodeBlock,
+        parts: List[str],
+        current_span: CurrentPromptSpan,
+        show_outcommented_code: bool,
+        outcomment_code_comment: str,
+        show_span_id: bool,
+        show_line_numbers: bool,
+        exclude_comments: bool,
+        show_all_spans: bool,
+        only_signatures: bool,
+        max_tokens: Optional[int],
+        current_tokens: int,
+    ) -> int:
+        """
+        Appends the rendered children of the code block to parts. Tokens are only counted when there is a token
+        budget, rendering stops at the first child block that would exceed it.
+
+        Returns:
+            int: The number of tokens rendered so far.
+        """
         if not code_block.children:
-            return contents
+            return current_tokens
+
+        span_ids = self.span_ids
+
+        def append(block_content: str):
+            nonlocal current_tokens
+            parts.append(block_content)
+            if max_tokens:
+                current_tokens += count_tokens(block_content)
 
         outcommented_block = None
-        for _i, child in enumerate(code_block.children):
+        for child in code_block.children:
             if exclude_comments and child.type.group == CodeBlockTypeGroup.COMMENT:
                 continue
 
@@ -512,9 +732,7 @@ class ContextFile(BaseModel):
 
                     current_span.tokens += child_tokens
 
-            elif (not child.belongs_to_span or child.belongs_to_any_span not in self.spans) and child.has_any_span(
-                self.span_ids
-            ):
+            elif not child.belongs_to_any_span(span_ids) and child.has_any_span(span_ids):
                 show_child = True
 
                 if child.belongs_to_span and current_span.span_id != child.belongs_to_span.span_id:
@@ -529,36 +747,31 @@ class ContextFile(BaseModel):
 
             if show_child:
                 if outcommented_block:
-                    block_content = outcommented_block._to_prompt_string(
-                        show_line_numbers=show_line_numbers,
-                    )
-                    contents += block_content
-                    current_tokens += count_tokens(block_content)
+                    append(outcommented_block._to_prompt_string(show_line_numbers=show_line_numbers))
                     outcommented_block = None
 
-                block_content = child._to_prompt_string(
-                    show_span_id=show_new_span_id,
-                    show_line_numbers=show_line_numbers,
-                    span_marker=SpanMarker.TAG,
+                append(
+                    child._to_prompt_string(
+                        show_span_id=show_new_span_id,
+                        show_line_numbers=show_line_numbers,
+                        span_marker=SpanMarker.TAG,
+                    )
                 )
-                contents += block_content
-                current_tokens += count_tokens(block_content)
 
-                child_content = self._to_prompt(
+                current_tokens = self._render_children(
                     code_block=child,
-                    exclude_comments=exclude_comments,
+                    parts=parts,
+                    current_span=current_span,
                     show_outcommented_code=show_outcommented_code,
                     outcomment_code_comment=outcomment_code_comment,
                     show_span_id=show_span_id,
-                    current_span=current_span,
                     show_line_numbers=show_line_numbers,
+                    exclude_comments=exclude_comments,
                     show_all_spans=show_all_spans,
                     only_signatures=only_signatures,
                     max_tokens=max_tokens,
                     current_tokens=current_tokens,
                 )
-                contents += child_content
-                current_tokens += count_tokens(child_content)
 
             elif (
                 show_outcommented_code
@@ -574,17 +787,13 @@ class ContextFile(BaseModel):
                 outcommented_block.start_line = child.start_line
 
         if show_outcommented_code and outcommented_block:
-            block_content = outcommented_block._to_prompt_string(
-                show_line_numbers=show_line_numbers,
-            )
-            contents += block_content
-            current_tokens += count_tokens(block_content)
+            append(outcommented_block._to_prompt_string(show_line_numbers=show_line_numbers))
 
-        return contents
+        return current_tokens
 
     def set_patch(self, patch: str):
         self.patch = patch
-        self._cached_content = None
+        self._content_blob = None
         self._cached_module = None
         self.was_edited = True
 
@@ -603,7 +812,7 @@ class ContextFile(BaseModel):
             return 0  # TODO: Support context size...
 
     def has_span(self, span_id: str):
-        return span_id in self.span_ids
+        return span_id in self._get_span_index()
 
     def add_spans(
         self,
@@ -625,7 +834,7 @@ class ContextFile(BaseModel):
         add_extra: bool = True,
     ) -> bool:
         self.was_viewed = True
-        existing_span = next((span for span in self.spans if span.span_id == span_id), None)
+        existing_span = self._get_span_index().get(span_id)
 
         if existing_span:
             existing_span.tokens = tokens
@@ -634,7 +843,7 @@ class ContextFile(BaseModel):
         else:
             span = self.module.find_span_by_id(span_id)
             if span:
-                self.spans.append(
+                self._append_span(
                     ContextSpan(
                         span_id=span_id,
                         start_line=start_line,
@@ -668,11 +877,10 @@ class ContextFile(BaseModel):
                 and child.belongs_to_span.span_id
                 and not self.has_span(child.belongs_to_span.span_id)
             ):
-                if child.belongs_to_span.span_id not in self.span_ids:
-                    self.spans.append(ContextSpan(span_id=child.belongs_to_span.span_id))
+                self._append_span(ContextSpan(span_id=child.belongs_to_span.span_id))
 
-        if class_block.belongs_to_span.span_id not in self.span_ids:
-            self.spans.append(ContextSpan(span_id=class_block.belongs_to_span.span_id))
+        if not self.has_span(class_block.belongs_to_span.span_id):
+            self._append_span(ContextSpan(span_id=class_block.belongs_to_span.span_id))
 
     def add_line_span(self, start_line: int, end_line: int | None = None, add_extra: bool = True) -> list[str]:
         self.was_viewed = True
@@ -686,7 +894,7 @@ class ContextFile(BaseModel):
 
         added_spans = []
         for block in blocks:
-            if block.belongs_to_span and block.belongs_to_span.span_id not in self.span_ids:
+            if block.belongs_to_span and not self.has_span(block.belongs_to_span.span_id):
                 added_spans.append(block.belongs_to_span.span_id)
                 self.add_span(
                     block.belongs_to_span.span_id,
@@ -715,23 +923,17 @@ class ContextFile(BaseModel):
         if not self.module:
             return False
 
-        start_covered = False
-        end_covered = False
+        starts, ends = self._get_line_index()
 
-        for span in self.spans:
-            block_span = self.module.find_span_by_id(span.span_id)
-            if block_span:
-                if block_span.start_line <= start_line <= block_span.end_line:
-                    start_covered = True
-                if block_span.start_line <= end_line <= block_span.end_line:
-                    end_covered = True
-                if start_covered and end_covered:
-                    return True
+        def is_covered(line: int) -> bool:
+            i = bisect_right(starts, line) - 1
+            return i >= 0 and line <= ends[i]
 
-        return False
+        return is_covered(start_line) and is_covered(end_line)
 
     def remove_span(self, span_id: str):
-        self.spans = [span for span in self.spans if span.span_id != span_id]
+        if self.has_span(span_id):
+            self.spans = [span for span in self.spans if span.span_id != span_id]
 
     def remove_all_spans(self):
         self.spans = [span for span in self.spans if span.pinned]
@@ -750,20 +952,16 @@ class ContextFile(BaseModel):
     def get_block_span(self, span_id: str) -> Optional[BlockSpan]:
         if not self.module:
             return None
-        for span in self.spans:
-            if span.span_id == span_id:
-                block_span = self.module.find_span_by_id(span_id)
-                if block_span:
-                    return block_span
-                else:
-                    logger.warning(f"Could not find span with id {span_id} in file {self.file_path}")
+        if self.has_span(span_id):
+            block_span = self.module.find_span_by_id(span_id)
+            if block_span:
+                return block_span
+            else:
+                logger.warning(f"Could not find span with id {span_id} in file {self.file_path}")
         return None
 
     def get_span(self, span_id: str) -> Optional[ContextSpan]:
-        for span in self.spans:
-            if span.span_id == span_id:
-                return span
-        return None
+        return self._get_span_index().get(span_id)
 
     def get_patches(self) -> List[str]:
         """
@@ -1165,8 +1363,29 @@ class FileContext(BaseModel):
         dump = self.model_dump(exclude={"files": {"__all__": {"was_edited", "was_viewed"}}})
         cloned_context = FileContext(repo=self._repo, runtime=self._runtime)
         cloned_context.load_files_from_dict(files=dump.get("files", []), test_files=dump.get("test_files", []))
+        for file_path, cloned_file in cloned_context._files.items():
+            cloned_file.share_content(self._files[file_path])
         return cloned_context
 
+    def state_hash(self) -> str:
+        """
+        A hash of the files and spans in context, their contents and the test results. File contexts that show the
+        same code with the same changes have the same hash, regardless of the order files and spans were added in.
+        Patched files are hashed by their content, so different patches with the same result are equal.
+        """
+        files = []
+        for file in sorted(self._files.values(), key=lambda f: f.file_path):
+            spans = sorted((span.span_id, span.start_line or 0, span.end_line or 0) for span in file.spans)
+            files.append([file.file_path, file.content_hash if file.patch else None, file.show_all_spans, spans])
+
+        test_files = [
+            [test_file.file_path, [result.model_dump(mode="json") for result in test_file.test_results]]
+            for test_file in sorted(self._test_files.values(), key=lambda f: f.file_path)
+        ]
+
+        state = json.dumps([files, test_files], separators=(",", ":"), sort_keys=True)
+        return hashlib.sha256(state.encode("utf-8")).hexdigest()
+
     def has_patch(self, ignore_tests: bool = False):
         return any(file.patch for file in self._files.values() if not ignore_tests or not is_test(file.file_path))
 
@@ -1212,7 +1431,7 @@ class FileContext(BaseModel):
                 updated_files.add(file_path)
             else:
                 # Check for content changes
-                if include_patches and current_file.content != old_file.content:
+                if include_patches and not current_file.has_same_content(old_file):
                     updated_files.add(file_path)
                     continue
 
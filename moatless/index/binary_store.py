@@ -0,0 +1,277 @@
+"""Binary storage for the vector store data and the document store.
+
+Variable sized values are written to a blob file as length prefixed records with an offset table stored as a
+numpy array next to it. Metadata dicts are stored column by column to avoid repeating keys for every row.
+"""
+
+import json
+import logging
+import os
+import struct
+import zlib
+from collections.abc import Iterator, MutableMapping
+from typing import Any, Optional
+
+import numpy as np
+from llama_index.core.constants import DATA_KEY, TYPE_KEY
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+
+logger = logging.getLogger(__name__)
+
+BINARY_DOCSTORE_HEADER_FNAME = "docstore.header.json"
+BINARY_DOCSTORE_FNAMES = (
+    BINARY_DOCSTORE_HEADER_FNAME,
+    "docstore.ids.bin",
+    "docstore.texts.bin",
+    "docstore.texts.bin.offsets.npy",
+    "docstore.fields.bin",
+    "docstore.fields.bin.offsets.npy",
+    "docstore.metadata.bin",
+)
+
+_LENGTH_PREFIX = struct.Struct("<I")
+
+
+def write_blobs(path: str, values: list[bytes], compress: bool = False) -> None:
+    """Write values as length prefixed records to `path` and their offsets to `path.offsets.npy`."""
+    offsets = np.empty(len(values), dtype=np.int64)
+    position = 0
+    with open(path, "wb") as f:
+        for i, value in enumerate(values):
+            if compress:
+                value = zlib.compress(value, 1)
+            offsets[i] = position
+            f.write(_LENGTH_PREFIX.pack(len(value)))
+            f.write(value)
+            position += _LENGTH_PREFIX.size + len(value)
+
+    np.save(f"{path}.offsets.npy", offsets)
+
+
+class BlobReader:
+    """Random access to records written by `write_blobs`."""
+
+    def __init__(self, path: str, compressed: bool = False):
+        with open(path, "rb") as f:
+            self._data = f.read()
+        self._offsets = np.load(f"{path}.offsets.npy")
+        self._compressed = compressed
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, row: int) -> bytes:
+        offset = int(self._offsets[row])
+        (length,) = _LENGTH_PREFIX.unpack_from(self._data, offset)
+        start = offset + _LENGTH_PREFIX.size
+        value = self._data[start : start + length]
+        if self._compressed:
+            return zlib.decompress(value)
+        return value
+
+
+def write_strings(path: str, values: list[str]) -> None:
+    """Write a list of strings as length prefixed utf-8 records with the count first, they may contain line breaks."""
+    with open(path, "wb") as f:
+        f.write(_LENGTH_PREFIX.pack(len(values)))
+        for value in values:
+            data = value.encode("utf-8")
+            f.write(_LENGTH_PREFIX.pack(len(data)))
+            f.write(data)
+
+
+def read_strings(path: str) -> list[str]:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    (count,) = _LENGTH_PREFIX.unpack_from(data, 0)
+    position = _LENGTH_PREFIX.size
+    values = []
+    for _ in range(count):
+        (length,) = _LENGTH_PREFIX.unpack_from(data, position)
+        position += _LENGTH_PREFIX.size
+        values.append(data[position : position + length].decode("utf-8"))
+        position += length
+
+    if position != len(data):
+        raise ValueError(f"Unexpected data after {count} strings in {path}")
+    return values
+
+
+def write_columns(path: str, rows: list[dict[str, Any]], compress: bool = False) -> None:
+    """Write a list of dicts column by column. Keys missing in a row are recorded separately from None values."""
+    columns: dict[str, list] = {}
+    missing: dict[str, list[int]] = {}
+    for row_idx, row in enumerate(rows):
+        for key in row:
+            if key not in columns:
+                columns[key] = [None] * row_idx
+                missing[key] = list(range(row_idx))
+        for key, column in columns.items():
+            if key in row:
+                column.append(row[key])
+            else:
+                column.append(None)
+                missing[key].append(row_idx)
+
+    data = json.dumps(
+        {
+            "rows": len(rows),
+            "columns": columns,
+            "missing": {key: rows_ for key, rows_ in missing.items() if rows_},
+        }
+    ).encode("utf-8")
+
+    if compress:
+        data = zlib.compress(data, 1)
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read_columns(path: str, compressed: bool = False) -> list[dict[str, Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if compressed:
+        data = zlib.decompress(data)
+
+    table = json.loads(data)
+    rows = [{} for _ in range(table["rows"])]
+    for key, column in table["columns"].items():
+        missing = set(table["missing"].get(key, []))
+        for row_idx, value in enumerate(column):
+            if row_idx not in missing:
+                rows[row_idx][key] = value
+
+    return rows
+
+
+class LazyNodeMapping(MutableMapping):
+    """
+    Node collection that decodes the serialized node dict for a node id on first access.
+
+    Nodes are split in the text blob, the metadata columns and a blob with the remaining node fields.
+    """
+
+    def __init__(
+        self,
+        node_ids: list[str],
+        types: list[str],
+        texts: BlobReader,
+        fields: BlobReader,
+        metadata: list[dict],
+    ):
+        self._rows = {node_id: row for row, node_id in enumerate(node_ids)}
+        self._types = types
+        self._texts = texts
+        self._fields = fields
+        self._metadata = metadata
+        self._decoded: dict[str, dict] = {}
+
+    def __getitem__(self, node_id: str) -> dict:
+        if node_id in self._decoded:
+            return self._decoded[node_id]
+
+        row = self._rows[node_id]
+        data = json.loads(self._fields.get(row))
+        data["text"] = self._texts.get(row).decode("utf-8")
+        data["metadata"] = self._metadata[row]
+
+        value = {DATA_KEY: data, TYPE_KEY: self._types[row]}
+        self._decoded[node_id] = value
+        return value
+
+    def __setitem__(self, node_id: str, value: dict) -> None:
+        self._decoded[node_id] = value
+        self._rows.setdefault(node_id, -1)
+
+    def __delitem__(self, node_id: str) -> None:
+        del self._rows[node_id]
+        self._decoded.pop(node_id, None)
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def persist_docstore(docstore: KVDocumentStore, persist_dir: str, compress: bool = False) -> None:
+    """
+    Persist a document store in the binary format.
+
+    Node ids and texts are stored as length prefixed records and metadata in a columnar file.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+
+    node_collection = docstore._kvstore.get_all(collection=docstore._node_collection)
+
+    node_ids = []
+    types = []
+    texts = []
+    fields = []
+    metadata = []
+    for node_id, value in node_collection.items():
+        data = dict(value[DATA_KEY])
+        node_ids.append(node_id)
+        types.append(value[TYPE_KEY])
+        texts.append(data.pop("text", "").encode("utf-8"))
+        metadata.append(data.pop("metadata", {}))
+        fields.append(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    write_strings(os.path.join(persist_dir, "docstore.ids.bin"), node_ids)
+    write_blobs(os.path.join(persist_dir, "docstore.texts.bin"), texts, compress=compress)
+    write_blobs(os.path.join(persist_dir, "docstore.fields.bin"), fields, compress=compress)
+    write_columns(os.path.join(persist_dir, "docstore.metadata.bin"), metadata, compress=compress)
+
+    header = {
+        "compressed": compress,
+        "types": types,
+        "metadata_collection": docstore._kvstore.get_all(collection=docstore._metadata_collection),
+        "ref_doc_collection": docstore._kvstore.get_all(collection=docstore._ref_doc_collection),
+    }
+    with open(os.path.join(persist_dir, BINARY_DOCSTORE_HEADER_FNAME), "w") as f:
+        json.dump(header, f, separators=(",", ":"))
+
+    logger.info(f"Persisted {len(node_ids)} nodes to {persist_dir}.")
+
+
+def load_docstore(persist_dir: str, namespace: Optional[str] = None) -> SimpleDocumentStore:
+    """Load a document store persisted with `persist_docstore`. Nodes are decoded when first accessed."""
+    with open(os.path.join(persist_dir, BINARY_DOCSTORE_HEADER_FNAME)) as f:
+        header = json.load(f)
+
+    compressed = header["compressed"]
+    node_mapping = LazyNodeMapping(
+        node_ids=read_strings(os.path.join(persist_dir, "docstore.ids.bin")),
+        types=header["types"],
+        texts=BlobReader(os.path.join(persist_dir, "docstore.texts.bin"), compressed=compressed),
+        fields=BlobReader(os.path.join(persist_dir, "docstore.fields.bin"), compressed=compressed),
+        metadata=read_columns(os.path.join(persist_dir, "docstore.metadata.bin"), compressed=compressed),
+    )
+
+    docstore = SimpleDocumentStore(namespace=namespace)
+    docstore._kvstore._collections_mappings = {
+        docstore._node_collection: node_mapping,
+        docstore._metadata_collection: header["metadata_collection"],
+        docstore._ref_doc_collection: header["ref_doc_collection"],
+    }
+
+    logger.info(f"Loaded {len(node_mapping)} nodes from {persist_dir}.")
+    return docstore
+
+
+def is_binary_docstore(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, BINARY_DOCSTORE_HEADER_FNAME))
+
+
+def remove_binary_docstore(persist_dir: str) -> None:
+    for file_name in BINARY_DOCSTORE_FNAMES:
+        file_path = os.path.join(persist_dir, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
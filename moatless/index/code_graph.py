@@ -0,0 +1,286 @@
+"""Repository wide reference graph between code spans.
+
+Nodes are spans identified by file path and span id. Edges point from the span with a reference to the span with
+the referenced definition, in the same file or resolved through the imports of the file. The graph is stored as
+compressed sparse row arrays for both directions that are memory mapped when loaded.
+"""
+
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+
+from moatless.codeblocks import CodeBlock, CodeBlockType
+from moatless.codeblocks.codeblocks import RelationshipType
+from moatless.index.binary_store import read_strings, write_strings
+
+logger = logging.getLogger(__name__)
+
+CODE_GRAPH_HEADER_FNAME = "code_graph.header.json"
+
+_RELATIONSHIP_TYPES = list(RelationshipType)
+_RELATIONSHIP_TYPE_INDEX = {relationship_type: i for i, relationship_type in enumerate(_RELATIONSHIP_TYPES)}
+
+_DEFINITION_TYPES = (CodeBlockType.CLASS, CodeBlockType.FUNCTION)
+
+_DOTTED_NAME_PATTERN = re.compile(r"(?<![\w.])[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*")
+
+
+class CodeGraph:
+    """Adjacency of spans in CSR format with the relationship type of each edge."""
+
+    def __init__(
+        self,
+        nodes: list[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        edge_types: np.ndarray,
+        reverse_indptr: np.ndarray,
+        reverse_indices: np.ndarray,
+        reverse_edge_types: np.ndarray,
+    ):
+        self._nodes = nodes
+        self._node_index = {node: i for i, node in enumerate(nodes)}
+        self._indptr = indptr
+        self._indices = indices
+        self._edge_types = edge_types
+        self._reverse_indptr = reverse_indptr
+        self._reverse_indices = reverse_indices
+        self._reverse_edge_types = reverse_edge_types
+
+    @classmethod
+    def from_edges(cls, nodes: list[str], edges: list[tuple[int, int, int]]) -> "CodeGraph":
+        edge_array = np.array(edges, dtype=np.int64).reshape(-1, 3)
+        sources, targets, types = edge_array[:, 0], edge_array[:, 1], edge_array[:, 2]
+
+        def to_csr(rows: np.ndarray, columns: np.ndarray):
+            order = np.lexsort((columns, rows))
+            indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=len(nodes)), out=indptr[1:])
+            return indptr, columns[order].astype(np.int32), types[order].astype(np.uint8)
+
+        return cls(nodes, *to_csr(sources, targets), *to_csr(targets, sources))
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._indices)
+
+    def successors(
+        self, file_path: str, span_id: str, relationship_types: Optional[list[RelationshipType]] = None
+    ) -> list[tuple[str, str]]:
+        """Spans referenced by the span."""
+        return self._neighbors(self._indptr, self._indices, self._edge_types, file_path, span_id, relationship_types)
+
+    def predecessors(
+        self, file_path: str, span_id: str, relationship_types: Optional[list[RelationshipType]] = None
+    ) -> list[tuple[str, str]]:
+        """Spans referencing the span."""
+        return self._neighbors(
+            self._reverse_indptr,
+            self._reverse_indices,
+            self._reverse_edge_types,
+            file_path,
+            span_id,
+            relationship_types,
+        )
+
+    def _neighbors(self, indptr, indices, edge_types, file_path, span_id, relationship_types):
+        node = self._node_index.get(f"{file_path}:{span_id}")
+        if node is None:
+            return []
+
+        start, end = indptr[node], indptr[node + 1]
+        neighbors = indices[start:end]
+        if relationship_types:
+            allowed = [_RELATIONSHIP_TYPE_INDEX[relationship_type] for relationship_type in relationship_types]
+            neighbors = neighbors[np.isin(edge_types[start:end], allowed)]
+
+        # The same span may be referenced with more than one relationship type
+        return [_split_node(self._nodes[neighbor]) for neighbor in dict.fromkeys(neighbors.tolist())]
+
+    def persist(self, persist_dir: str) -> None:
+        write_strings(os.path.join(persist_dir, "code_graph.nodes.bin"), self._nodes)
+        for name in ["indptr", "indices", "edge_types", "reverse_indptr", "reverse_indices", "reverse_edge_types"]:
+            np.save(os.path.join(persist_dir, f"code_graph.{name}.npy"), getattr(self, f"_{name}"))
+
+        header = {
+            "nodes": len(self._nodes),
+            "edges": self.edge_count,
+            "relationship_types": [relationship_type.value for relationship_type in _RELATIONSHIP_TYPES],
+        }
+        with open(os.path.join(persist_dir, CODE_GRAPH_HEADER_FNAME), "w") as f:
+            json.dump(header, f)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "CodeGraph":
+        with open(os.path.join(persist_dir, CODE_GRAPH_HEADER_FNAME)) as f:
+            header = json.load(f)
+
+        if header["relationship_types"] != [relationship_type.value for relationship_type in _RELATIONSHIP_TYPES]:
+            raise ValueError(f"The code graph in {persist_dir} was persisted with other relationship types.")
+
+        arrays = {
+            name: np.load(os.path.join(persist_dir, f"code_graph.{name}.npy"), mmap_mode="r")
+            for name in ["indptr", "indices", "edge_types", "reverse_indptr", "reverse_indices", "reverse_edge_types"]
+        }
+        nodes = read_strings(os.path.join(persist_dir, "code_graph.nodes.bin"))
+        logger.info(f"Loaded code graph with {len(nodes)} spans and {header['edges']} references from {persist_dir}.")
+        return cls(nodes, **arrays)
+
+
+def is_code_graph_persisted(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, CODE_GRAPH_HEADER_FNAME))
+
+
+def _split_node(node: str) -> tuple[str, str]:
+    file_path, _, span_id = node.rpartition(":")
+    return file_path, span_id
+
+
+class CodeGraphBuilder:
+    """
+    Collects definitions, imports and references from parsed code blocks and resolves them to a `CodeGraph`.
+
+    Register `add_block` as index callback on the parser, the parser must be created with `enable_code_graph=True`.
+    """
+
+    def __init__(self):
+        self._nodes: dict[str, int] = {}
+        # Span ids of classes and functions by file path and dotted block path
+        self._definitions: dict[str, dict[str, str]] = defaultdict(dict)
+        # Imported module and symbol by file path and local name
+        self._imports: dict[str, dict[str, tuple[str, Optional[str]]]] = defaultdict(dict)
+        self._references: list[tuple[str, str, tuple[str, ...], RelationshipType]] = []
+        self._import_references: list[tuple[str, str, str, Optional[str]]] = []
+
+    def add_block(self, codeblock: CodeBlock):
+        if not codeblock.belongs_to_span or codeblock.type == CodeBlockType.MODULE:
+            return
+
+        file_path = codeblock.module.file_path
+        span_id = codeblock.belongs_to_span.span_id
+        self._nodes.setdefault(f"{file_path}:{span_id}", len(self._nodes))
+
+        if codeblock.type in _DEFINITION_TYPES:
+            self._definitions[file_path][codeblock.path_string()] = span_id
+
+        for relationship in codeblock.relationships:
+            if relationship.type == RelationshipType.IMPORTS and relationship.external_path:
+                module = relationship.external_path[0]
+                symbol = relationship.path[0] if relationship.path else None
+                if relationship.identifier:
+                    self._imports[file_path][relationship.identifier] = (module, symbol)
+                self._import_references.append((file_path, span_id, module, symbol))
+            elif relationship.path:
+                self._references.append((file_path, span_id, tuple(relationship.path), relationship.type))
+
+        # Short functions are not parsed into child blocks, look up the names used in the body instead
+        if codeblock.type in (CodeBlockType.FUNCTION, CodeBlockType.TEST_CASE) and not codeblock.children:
+            class_path = codeblock.parent.full_path() if codeblock.parent.type == CodeBlockType.CLASS else None
+            for name in set(_DOTTED_NAME_PATTERN.findall(codeblock.content)):
+                path = tuple(name.split("."))
+                if path[0] == "self" and class_path:
+                    path = tuple(class_path) + path[1:]
+                self._references.append((file_path, span_id, path, RelationshipType.USES))
+
+    def build(self) -> CodeGraph:
+        module_files = self._module_files()
+
+        edges = set()
+        for file_path, span_id, module, symbol in self._import_references:
+            target = self._resolve_import(file_path, module, symbol, (), module_files)
+            if target:
+                self._add_edge(edges, file_path, span_id, target, RelationshipType.IMPORTS)
+
+        for file_path, span_id, path, relationship_type in self._references:
+            target = self._resolve(file_path, path, module_files)
+            if target:
+                self._add_edge(edges, file_path, span_id, target, relationship_type)
+
+        nodes = sorted(self._nodes, key=self._nodes.get)
+        graph = CodeGraph.from_edges(nodes, sorted(edges))
+        logger.info(f"Built code graph with {len(graph)} spans and {graph.edge_count} references.")
+        return graph
+
+    def _add_edge(self, edges: set, file_path: str, span_id: str, target: tuple[str, str], relationship_type):
+        source = self._nodes[f"{file_path}:{span_id}"]
+        target_node = self._nodes.get(f"{target[0]}:{target[1]}")
+        if target_node is not None and target_node != source:
+            edges.add((source, target_node, _RELATIONSHIP_TYPE_INDEX[relationship_type]))
+
+    def _module_files(self) -> dict[str, str]:
+        """Map dotted module names to file paths. Modules are also registered without their leading packages to
+        support source directories that are not the repository root, files closer to the root take precedence."""
+        file_paths = {node.rpartition(":")[0] for node in self._nodes}
+        module_files = {}
+        for file_path in sorted(file_paths, key=lambda path: (path.count("/"), path)):
+            parts = file_path[: -len(".py")].split("/") if file_path.endswith(".py") else None
+            if not parts:
+                continue
+            if parts[-1] == "__init__":
+                parts = parts[:-1]
+            for i in range(len(parts)):
+                module_files.setdefault(".".join(parts[i:]), file_path)
+        return module_files
+
+    def _resolve(self, file_path: str, path: tuple[str, ...], module_files: dict[str, str]):
+        definition = self._find_definition(file_path, path)
+        if definition:
+            return definition
+
+        imported = self._imports.get(file_path, {}).get(path[0])
+        if imported:
+            module, symbol = imported
+            return self._resolve_import(file_path, module, symbol, path[1:], module_files)
+
+        return None
+
+    def _resolve_import(
+        self, file_path: str, module: str, symbol: Optional[str], path: tuple[str, ...], module_files: dict[str, str]
+    ):
+        module = _absolute_module(file_path, module)
+
+        # The imported symbol may be a submodule of a package
+        if symbol and f"{module}.{symbol}".strip(".") in module_files:
+            module, symbol = f"{module}.{symbol}".strip("."), None
+
+        target_file = module_files.get(module)
+        if not target_file:
+            return None
+
+        target_path = ((symbol,) if symbol else ()) + path
+        if not target_path:
+            return None
+
+        return self._find_definition(target_file, target_path)
+
+    def _find_definition(self, file_path: str, path: tuple[str, ...]):
+        """Find the longest prefix of the path defined in the file."""
+        definitions = self._definitions.get(file_path)
+        if not definitions:
+            return None
+
+        for end in range(len(path), 0, -1):
+            span_id = definitions.get(".".join(path[:end]))
+            if span_id:
+                return file_path, span_id
+
+        return None
+
+
+def _absolute_module(file_path: str, module: str) -> str:
+    if not module.startswith("."):
+        return module
+
+    level = len(module) - len(module.lstrip("."))
+    package = file_path.split("/")[:-1]
+    if level > 1:
+        package = package[: -(level - 1)]
+    return ".".join(package + [part for part in module[level:].split(".") if part])
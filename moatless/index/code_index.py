@@ -4,12 +4,17 @@ import mimetypes
 import os
 import shutil
 import tempfile
+import threading
+from collections import OrderedDict
 from typing import Optional, TYPE_CHECKING
 
+import numpy as np
 import requests
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 from moatless.codeblocks import CodeBlock, CodeBlockType
+from moatless.codeblocks.codeblocks import RelationshipType
+from moatless.index.code_graph import CodeGraph, CodeGraphBuilder, is_code_graph_persisted
 from moatless.index.settings import IndexSettings
 from moatless.index.types import (
     CodeSnippet,
@@ -31,6 +36,7 @@ logger = logging.getLogger(__name__)
 
 # Add constant for persist filename outside TYPE_CHECKING
 DEFAULT_PERSIST_FNAME = "docstore.json"
+TEST_FILES_PERSIST_FNAME = "test_files_by_name.json"
 
 
 def default_vector_store(settings: IndexSettings):
@@ -41,10 +47,22 @@ def default_vector_store(settings: IndexSettings):
             "faiss needs to be installed to set up a default index for CodeIndex. Run 'pip install faiss-cpu'"
         ) from e
 
-    faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(settings.dimensions))
-    from moatless.index.simple_faiss import SimpleFaissVectorStore
+    from moatless.index.simple_faiss import SimpleFaissVectorStore, create_faiss_index
 
-    return SimpleFaissVectorStore(faiss_index)
+    faiss_index = create_faiss_index(
+        settings.dimensions,
+        settings.quantization,
+        pq_m=settings.pq_m,
+        pq_nbits=settings.pq_nbits,
+    )
+
+    return SimpleFaissVectorStore(
+        faiss_index,
+        d=settings.dimensions,
+        rerank_top_k=settings.rerank_top_k,
+        storage_format=settings.storage_format.value,
+        compress=settings.compress_storage,
+    )
 
 
 class CodeIndex:
@@ -57,10 +75,13 @@ class CodeIndex:
         embed_model: "BaseEmbedding | None" = None,
         blocks_by_class_name: Optional[dict] = None,
         blocks_by_function_name: Optional[dict] = None,
+        test_files_by_name: Optional[dict[str, list[str]]] = None,
+        code_graph: CodeGraph | None = None,
         settings: IndexSettings | None = None,
         max_results: int = 25,
         max_hits_without_exact_match: int = 100,
         max_exact_results: int = 5,
+        search_cache_size: int = 256,
     ):
         self._index_name = index_name
         self._settings = settings or IndexSettings()
@@ -74,10 +95,24 @@ class CodeIndex:
         self._blocks_by_class_name = blocks_by_class_name or {}
         self._blocks_by_function_name = blocks_by_function_name or {}
 
+        # Test files by file name, built from the repository on first use if not provided
+        self._test_files_by_name = test_files_by_name
+
+        self._code_graph = code_graph
+
+        # LRU cache of semantic search responses, keys include the index version to never return stale results
+        self._search_cache: OrderedDict[tuple, SearchCodeResponse] = OrderedDict()
+        self._search_cache_size = search_cache_size
+        self._search_cache_hits = 0
+        self._search_cache_misses = 0
+        # Parallel simulations search the same index on different threads
+        self._search_cache_lock = threading.Lock()
+        self._index_version = 0
+
         from moatless.index.embed_model import get_embed_model
         from llama_index.core.storage.docstore import SimpleDocumentStore
 
-        self._embed_model = embed_model or get_embed_model(self._settings.embed_model)
+        self._embed_model = embed_model or get_embed_model(self._settings.embed_model, self._settings.dimensions)
         self._vector_store = vector_store or default_vector_store(self._settings)
         self._docstore = docstore or SimpleDocumentStore()
 
@@ -85,20 +120,30 @@ class CodeIndex:
             f"Initiated CodeIndex {self._index_name} with:\n"
             f" * {len(self._blocks_by_class_name)} classes\n"
             f" * {len(self._blocks_by_function_name)} functions\n"
-            f" * {len(self._docstore.docs)} vectors\n"
-            f"Using file repository at {self._file_repo.repo_dir if self._file_repo else 'None'}\n"
+            f" * {len(self._docstore.get_all_document_hashes())} vectors\n"
+            f"Using file repository at {getattr(self._file_repo, 'repo_dir', None)}\n"
         )
 
     @classmethod
     def from_persist_dir(cls, persist_dir: str, file_repo: Repository | None = None, **kwargs):
+        from moatless.index.binary_store import load_docstore
+        from moatless.index.settings import StorageFormat
         from moatless.index.simple_faiss import SimpleFaissVectorStore
         from llama_index.core.storage.docstore import SimpleDocumentStore
 
-        vector_store = SimpleFaissVectorStore.from_persist_dir(persist_dir)
-        docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
-
         settings = IndexSettings.from_persist_dir(persist_dir)
 
+        # The format the index was last persisted in, files of another format may be left in the directory
+        vector_store = SimpleFaissVectorStore.from_persist_dir(
+            persist_dir, rerank_top_k=settings.rerank_top_k, storage_format=settings.storage_format.value
+        )
+        vector_store.compress = settings.compress_storage
+
+        if settings.storage_format == StorageFormat.BINARY:
+            docstore = load_docstore(persist_dir)
+        else:
+            docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+
         if os.path.exists(os.path.join(persist_dir, "blocks_by_class_name.json")):
             with open(os.path.join(persist_dir, "blocks_by_class_name.json")) as f:
                 blocks_by_class_name = json.load(f)
@@ -111,6 +156,17 @@ class CodeIndex:
         else:
             blocks_by_function_name = {}
 
+        if os.path.exists(os.path.join(persist_dir, TEST_FILES_PERSIST_FNAME)):
+            with open(os.path.join(persist_dir, TEST_FILES_PERSIST_FNAME)) as f:
+                test_files_by_name = json.load(f)
+        else:
+            test_files_by_name = None
+
+        if is_code_graph_persisted(persist_dir):
+            code_graph = CodeGraph.from_persist_dir(persist_dir)
+        else:
+            code_graph = None
+
         return cls(
             file_repo=file_repo,
             vector_store=vector_store,
@@ -118,6 +174,8 @@ class CodeIndex:
             settings=settings,
             blocks_by_class_name=blocks_by_class_name,
             blocks_by_function_name=blocks_by_function_name,
+            test_files_by_name=test_files_by_name,
+            code_graph=code_graph,
             **kwargs,
         )
 
@@ -175,6 +233,23 @@ class CodeIndex:
     def dict(self):
         return {"index_name": self._index_name}
 
+    def invalidate_search_cache(self):
+        """Drop all cached search responses, call this when the indexed files or the index are changed."""
+        with self._search_cache_lock:
+            self._index_version += 1
+            self._search_cache.clear()
+
+    def search_cache_stats(self) -> dict:
+        with self._search_cache_lock:
+            lookups = self._search_cache_hits + self._search_cache_misses
+            return {
+                "hits": self._search_cache_hits,
+                "misses": self._search_cache_misses,
+                "hit_rate": self._search_cache_hits / lookups if lookups else 0.0,
+                "size": len(self._search_cache),
+                "index_version": self._index_version,
+            }
+
     def semantic_search(
         self,
         query: Optional[str] = None,
@@ -191,6 +266,59 @@ class CodeIndex:
         if query is None:
             query = ""
 
+        query = query.strip()
+        if file_pattern:
+            file_pattern = file_pattern.strip()
+
+        search_args = (
+            query,
+            code_snippet,
+            file_pattern or None,
+            category or None,
+            max_results,
+            max_tokens,
+            max_hits_without_exact_match,
+            max_exact_results,
+            max_spans_per_file,
+            exact_match_if_possible,
+        )
+
+        if not self._search_cache_size:
+            return self._semantic_search(*search_args)
+
+        # The search runs outside the lock, so concurrent misses on the same key may both search
+        with self._search_cache_lock:
+            cache_key = (self._index_version, *search_args)
+            response = self._search_cache.get(cache_key)
+            if response is not None:
+                self._search_cache_hits += 1
+                self._search_cache.move_to_end(cache_key)
+            else:
+                self._search_cache_misses += 1
+
+        if response is None:
+            response = self._semantic_search(*search_args)
+            with self._search_cache_lock:
+                self._search_cache[cache_key] = response
+                while len(self._search_cache) > self._search_cache_size:
+                    self._search_cache.popitem(last=False)
+
+        # Return a copy as callers may modify the hits
+        return response.model_copy(deep=True)
+
+    def _semantic_search(
+        self,
+        query: str,
+        code_snippet: Optional[str],
+        file_pattern: Optional[str],
+        category: str | None,
+        max_results: int,
+        max_tokens: int,
+        max_hits_without_exact_match: int,
+        max_exact_results: int,
+        max_spans_per_file: Optional[int],
+        exact_match_if_possible: bool,
+    ) -> SearchCodeResponse:
         message = ""
         if file_pattern:
             if category and category != "test":
@@ -219,7 +347,8 @@ class CodeIndex:
                         hits=[],
                     )
 
-        search_results = self._vector_search(
+        # Results are fetched lazily, files are only parsed for hits that are used before the budget is exhausted
+        search_results = self._iter_vector_search(
             query,
             file_pattern=file_pattern,
             exact_content_match=code_snippet,
@@ -227,6 +356,7 @@ class CodeIndex:
         )
 
         files_with_spans: dict[str, SearchCodeHit] = {}
+        files_by_path = {}
 
         span_count = 0
         spans_with_exact_query_match = 0
@@ -236,7 +366,14 @@ class CodeIndex:
 
         sum_tokens = 0
         for rank, search_hit in enumerate(search_results):
-            file = self._file_repo.get_file(search_hit.file_path)
+            # TODO: Add a check before span is added...
+            if sum_tokens > max_tokens:
+                break
+
+            if search_hit.file_path not in files_by_path:
+                files_by_path[search_hit.file_path] = self._file_repo.get_file(search_hit.file_path)
+
+            file = files_by_path[search_hit.file_path]
             if not file:
                 logger.warning(
                     f"semantic_search(query={query}, file_pattern={file_pattern}) Could not find search hit file {search_hit.file_path}."
@@ -248,10 +385,6 @@ class CodeIndex:
                 )
                 continue
 
-            # TODO: Add a check before span is added...
-            if sum_tokens > max_tokens:
-                break
-
             spans = []
             for span_id in search_hit.span_ids:
                 span = file.module.find_span_by_id(span_id)
@@ -514,7 +647,12 @@ class CodeIndex:
         max_tokens: int | None = None,
         max_method_tokens: int = 500,
         max_spans: int | None = None,
+        created_files: list[str] | None = None,
     ) -> list[FileWithSpans]:
+        """
+        Find test files related to the file. Files created in the current branch of a search aren't in the index, pass
+        them as `created_files` to match them by file name as well.
+        """
         if span_id:
             query = f"{file_path} {span_id}"
         elif query:
@@ -522,16 +660,17 @@ class CodeIndex:
         else:
             query = file_path
 
-        search_results = self._vector_search(query, category="test")
+        search_results = self._iter_vector_search(query, category="test")
 
         sum_tokens = 0
         files = []
-        matching_file = self._find_by_test_pattern(file_path)
+        files_by_path = {}
+        matching_file = self._find_by_test_pattern(file_path, created_files)
         if matching_file:
             files.append(FileWithSpans(file_path=matching_file, span_ids=[]))
         elif span_id or query and max_results > 1:
             # Try to find the most similar test file by file name if no exact match on file name
-            files = self.find_test_files(file_path, max_results=1, max_spans=max_spans)
+            files = self.find_test_files(file_path, max_results=1, max_spans=max_spans, created_files=created_files)
 
         for result in search_results:
             file_with_spans = next((f for f in files if f.file_path == result.file_path), None)
@@ -540,7 +679,10 @@ class CodeIndex:
                 file_with_spans = FileWithSpans(file_path=result.file_path, span_ids=[])
                 files.append(file_with_spans)
 
-            file = self._file_repo.get_file(result.file_path)
+            if result.file_path not in files_by_path:
+                files_by_path[result.file_path] = self._file_repo.get_file(result.file_path)
+
+            file = files_by_path[result.file_path]
             if not file:
                 logger.warning(f"run_tests() File not found {result.file_path}")
                 continue
@@ -573,7 +715,7 @@ class CodeIndex:
 
         return files
 
-    def _find_by_test_pattern(self, file_path: str) -> str | None:
+    def _find_by_test_pattern(self, file_path: str, created_files: list[str] | None = None) -> str | None:
         """
         Find the test file related to the provided file path.
 
@@ -584,7 +726,13 @@ class CodeIndex:
         dirname = os.path.dirname(file_path)
         test_patterns = [f"test_{filename}", f"{filename}_test.py"]
 
-        matched_files = self._file_repo.find_by_pattern(test_patterns)
+        test_files_by_name = self._get_test_files_by_name()
+        matched_files = [test_file for pattern in test_patterns for test_file in test_files_by_name.get(pattern, [])]
+        matched_files.extend(
+            created_file
+            for created_file in created_files or []
+            if os.path.basename(created_file) in test_patterns and created_file not in matched_files
+        )
         if not matched_files:
             return None
 
@@ -604,6 +752,34 @@ class CodeIndex:
 
         return best_match
 
+    def find_related_spans(
+        self,
+        file_path: str,
+        span_id: str,
+        relationship_types: Optional[list[RelationshipType]] = None,
+    ) -> list[tuple[str, str]]:
+        """
+        Find spans in any file that the span references or is referenced by, as tuples of file path and span id.
+
+        Uses the reference graph built on ingestion and doesn't parse any files.
+        """
+        if not self._code_graph:
+            logger.warning("find_related_spans() No code graph in the index, run ingestion to build it.")
+            return []
+
+        related_spans = self._code_graph.successors(file_path, span_id, relationship_types)
+        related_spans.extend(self._code_graph.predecessors(file_path, span_id, relationship_types))
+        return list(dict.fromkeys(related_spans))
+
+    def _get_test_files_by_name(self) -> "dict[str, list[str]]":
+        if self._test_files_by_name is None:
+            repo_dir = getattr(self._file_repo, "repo_dir", None)
+            if repo_dir:
+                self._test_files_by_name = _find_test_files_by_name(repo_dir)
+            else:
+                self._test_files_by_name = _list_test_files_by_name(self._file_repo)
+        return self._test_files_by_name
+
     def _create_search_hit(self, file: FileWithSpans, rank: int = 0):
         file_hit = SearchCodeHit(file_path=file.file_path)
         for span_id in file.span_ids:
@@ -618,7 +794,34 @@ class CodeIndex:
         file_pattern: Optional[str] = None,
         exact_content_match: Optional[str] = None,
         top_k: int = 500,
+    ) -> list[CodeSnippet]:
+        return list(
+            self._iter_vector_search(
+                query,
+                exact_query_match=exact_query_match,
+                category=category,
+                file_pattern=file_pattern,
+                exact_content_match=exact_content_match,
+                top_k=top_k,
+            )
+        )
+
+    def _iter_vector_search(
+        self,
+        query: str = "",
+        exact_query_match: bool = False,
+        category: str | None = None,
+        file_pattern: Optional[str] = None,
+        exact_content_match: Optional[str] = None,
+        top_k: int = 500,
+        page_size: int = 100,
     ):
+        """
+        Yield search results in order of similarity.
+
+        The vector store is queried in windows of increasing size up to `top_k` hits, so callers that stop iterating
+        when they have enough results don't pay for documents lookups and filtering of hits they will never use.
+        """
         # Import llama_index components only when needed
         from llama_index.core.vector_stores.types import VectorStoreQuery
 
@@ -633,6 +836,19 @@ class CodeIndex:
 
         logger.debug(f"vector_search() Searching for query [{query[:50]}...] and file pattern [{file_pattern}].")
 
+        if file_pattern:
+            include_files = set(self._file_repo.matching_files(file_pattern))
+            if len(include_files) == 0:
+                logger.info(f"vector_search() No files found for file pattern {file_pattern}, return empty result...")
+                return
+        else:
+            include_files = set()
+
+        if category and category != "test":
+            exclude_files = self._file_repo.find_files(["**/tests/**", "tests*", "*_test.py", "test_*.py"])
+        else:
+            exclude_files = set()
+
         query_embedding = self._embed_model.get_query_embedding(query)
 
         # FIXME: Filters can't be used ATM. Category isn't set in some instance vector stores
@@ -640,97 +856,91 @@ class CodeIndex:
         # if category:
         #    filters.filters.append(MetadataFilter(key="category", value=category))
 
-        query_bundle = VectorStoreQuery(
-            query_str=query,
-            query_embedding=query_embedding,
-            similarity_top_k=top_k,  # TODO: Fix paging?
-            #    filters=filters,
-        )
-
-        result = self._vector_store.query(query_bundle)
-
         filtered_out_snippets = 0
         ignored_removed_snippets = 0
-        sum_tokens = 0
-
-        sum_tokens_per_file = {}
+        returned_snippets = 0
+
+        seen_node_ids = set()
+        window = min(page_size, top_k)
+        while True:
+            query_bundle = VectorStoreQuery(
+                query_str=query,
+                query_embedding=query_embedding,
+                similarity_top_k=window,
+                #    filters=filters,
+            )
 
-        if file_pattern:
-            include_files = self._file_repo.matching_files(file_pattern)
-            if len(include_files) == 0:
-                logger.info(f"vector_search() No files found for file pattern {file_pattern}, return empty result...")
-                return []
-        else:
-            include_files = []
+            result = self._vector_store.query(query_bundle)
 
-        if category and category != "test":
-            exclude_files = self._file_repo.find_files(["**/tests/**", "tests*", "*_test.py", "test_*.py"])
-        else:
-            exclude_files = set()
+            for node_id, distance in zip(result.ids, result.similarities, strict=False):
+                # Hits from previous windows are returned again in the same order
+                if node_id in seen_node_ids:
+                    continue
+                seen_node_ids.add(node_id)
 
-        search_results = []
+                node_doc = self._docstore.get_document(node_id, raise_error=False)
+                if not node_doc:
+                    ignored_removed_snippets += 1
+                    continue
 
-        for node_id, distance in zip(result.ids, result.similarities, strict=False):
-            node_doc = self._docstore.get_document(node_id, raise_error=False)
-            if not node_doc:
-                ignored_removed_snippets += 1
-                # TODO: Retry to get top_k results
-                continue
+                file_path = node_doc.metadata["file_path"]
+                if exclude_files and file_path in exclude_files:
+                    filtered_out_snippets += 1
+                    continue
 
-            if exclude_files and node_doc.metadata["file_path"] in exclude_files:
-                filtered_out_snippets += 1
-                continue
+                if include_files and file_path not in include_files:
+                    filtered_out_snippets += 1
+                    continue
 
-            if include_files and node_doc.metadata["file_path"] not in include_files:
-                filtered_out_snippets += 1
-                continue
+                is_test_file = is_test(file_path)
+                if category == "implementation" and is_test_file:
+                    filtered_out_snippets += 1
+                    continue
 
-            is_test_file = is_test(node_doc.metadata["file_path"])
-            if category == "implementation" and is_test_file:
-                filtered_out_snippets += 1
-                continue
+                if category == "test" and not is_test_file:
+                    filtered_out_snippets += 1
+                    continue
 
-            if category == "test" and not is_test_file:
-                filtered_out_snippets += 1
-                continue
+                if exact_query_match and query not in node_doc.get_content():
+                    filtered_out_snippets += 1
+                    continue
 
-            if exact_query_match and query not in node_doc.get_content():
-                filtered_out_snippets += 1
-                continue
+                if exact_content_match and not is_string_in(exact_content_match, node_doc.get_content()):
+                    filtered_out_snippets += 1
+                    continue
 
-            if exact_content_match and not is_string_in(exact_content_match, node_doc.get_content()):
-                filtered_out_snippets += 1
-                continue
+                returned_snippets += 1
+                yield CodeSnippet(
+                    id=node_doc.id_,
+                    file_path=file_path,
+                    distance=distance,
+                    content=node_doc.get_content(),
+                    tokens=node_doc.metadata["tokens"],
+                    span_ids=node_doc.metadata.get("span_ids", []),
+                    start_line=node_doc.metadata.get("start_line", None),
+                    end_line=node_doc.metadata.get("end_line", None),
+                )
 
-            if node_doc.metadata["file_path"] not in sum_tokens_per_file:
-                sum_tokens_per_file[node_doc.metadata["file_path"]] = 0
-
-            sum_tokens += node_doc.metadata["tokens"]
-            sum_tokens_per_file[node_doc.metadata["file_path"]] += node_doc.metadata["tokens"]
-
-            code_snippet = CodeSnippet(
-                id=node_doc.id_,
-                file_path=node_doc.metadata["file_path"],
-                distance=distance,
-                content=node_doc.get_content(),
-                tokens=node_doc.metadata["tokens"],
-                span_ids=node_doc.metadata.get("span_ids", []),
-                start_line=node_doc.metadata.get("start_line", None),
-                end_line=node_doc.metadata.get("end_line", None),
-            )
+            # Stop when the vector store has no more hits or the max number of hits is reached. Results are filtered
+            # for deleted vectors and duplicates, so compare to the number of vectors when the store has it.
+            vector_count = getattr(self._vector_store, "vector_count", None)
+            if vector_count is not None:
+                exhausted = window >= vector_count
+            else:
+                exhausted = len(result.ids) < window
+            if exhausted or window >= top_k:
+                break
 
-            search_results.append(code_snippet)
+            window = min(window * 4, top_k)
 
         # TODO: Rerank by file pattern if no exact matches on file pattern
 
         logger.debug(
-            f"vector_search() Returning {len(search_results)} search results. "
+            f"vector_search() Returned {returned_snippets} search results. "
             f"(Ignored {ignored_removed_snippets} removed search results. "
-            f"Filtered out {filtered_out_snippets} search results from vector search result with {len(result.ids)} hits.)"
+            f"Filtered out {filtered_out_snippets} search results from vector search result with {len(seen_node_ids)} hits.)"
         )
 
-        return search_results
-
     def run_ingestion(
         self,
         repo_path: Optional[str] = None,
@@ -794,7 +1004,11 @@ class CodeIndex:
         blocks_by_class_name = {}
         blocks_by_function_name = {}
 
+        code_graph_builder = CodeGraphBuilder()
+
         def index_callback(codeblock: CodeBlock):
+            code_graph_builder.add_block(codeblock)
+
             if codeblock.type == CodeBlockType.CLASS:
                 if codeblock.identifier not in blocks_by_class_name:
                     blocks_by_class_name[codeblock.identifier] = []
@@ -818,6 +1032,7 @@ class CodeIndex:
             comment_strategy=self._settings.comment_strategy,
             index_callback=index_callback,
             repo_path=repo_path,
+            enable_code_graph=True,
         )
 
         prepared_nodes = splitter.get_nodes_from_documents(docs, show_progress=True)
@@ -830,12 +1045,25 @@ class CodeIndex:
 
         self._blocks_by_class_name = blocks_by_class_name
         self._blocks_by_function_name = blocks_by_function_name
+        self._test_files_by_name = _find_test_files_by_name(repo_path)
+        self._code_graph = code_graph_builder.build()
+        self.invalidate_search_cache()
 
         return len(embedded_nodes), embedded_tokens
 
     def persist(self, persist_dir: str):
+        from moatless.index.binary_store import persist_docstore, remove_binary_docstore
+        from moatless.index.settings import StorageFormat
+
         self._vector_store.persist(persist_dir)
-        self._docstore.persist(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+        json_docstore_path = os.path.join(persist_dir, DEFAULT_PERSIST_FNAME)
+        if self._settings.storage_format == StorageFormat.BINARY:
+            persist_docstore(self._docstore, persist_dir, compress=self._settings.compress_storage)
+            if os.path.exists(json_docstore_path):
+                os.remove(json_docstore_path)
+        else:
+            self._docstore.persist(json_docstore_path)
+            remove_binary_docstore(persist_dir)
         self._settings.persist(persist_dir)
 
         with open(os.path.join(persist_dir, "blocks_by_class_name.json"), "w") as f:
@@ -844,6 +1072,47 @@ class CodeIndex:
         with open(os.path.join(persist_dir, "blocks_by_function_name.json"), "w") as f:
             f.write(json.dumps(self._blocks_by_function_name, indent=2))
 
+        if self._test_files_by_name is not None:
+            with open(os.path.join(persist_dir, TEST_FILES_PERSIST_FNAME), "w") as f:
+                f.write(json.dumps(self._test_files_by_name, indent=2))
+
+        if self._code_graph is not None:
+            self._code_graph.persist(persist_dir)
+
+
+def _is_test_file_name(filename: str) -> bool:
+    return filename.startswith("test_") or filename.endswith("_test.py")
+
+
+def _find_test_files_by_name(repo_path: str) -> dict[str, list[str]]:
+    """Map the file names of all test files in the repository to their paths. Hidden directories are skipped."""
+    test_files_by_name: dict[str, list[str]] = {}
+    for dirpath, dirnames, filenames in os.walk(repo_path):
+        dirnames[:] = sorted(dirname for dirname in dirnames if not dirname.startswith("."))
+        for filename in sorted(filenames):
+            if _is_test_file_name(filename):
+                file_path = os.path.relpath(os.path.join(dirpath, filename), repo_path).replace(os.sep, "/")
+                test_files_by_name.setdefault(filename, []).append(file_path)
+
+    return test_files_by_name
+
+
+def _list_test_files_by_name(repository: Repository) -> dict[str, list[str]]:
+    """Map the file names of all test files to their paths, for repositories that aren't stored in a directory."""
+    test_files_by_name: dict[str, list[str]] = {}
+    directories = [""]
+    while directories:
+        listing = repository.list_directory(directories.pop())
+        for directory in reversed(listing["directories"]):
+            if not os.path.basename(directory).startswith("."):
+                directories.append(directory)
+        for file_path in listing["files"]:
+            filename = os.path.basename(file_path)
+            if _is_test_file_name(filename):
+                test_files_by_name.setdefault(filename, []).append(file_path)
+
+    return test_files_by_name
+
 
 def _rerank_files(file_paths: list[str], file_pattern: str):
     if len(file_paths) < 2:
@@ -853,15 +1122,12 @@ def _rerank_files(file_paths: list[str], file_pattern: str):
     tokenized_query = [part for part in tokenized_query if part.strip()]
     query = "/".join(tokenized_query)
 
-    scored_files = []
-    for file_path in file_paths:
-        cleaned_file_path = file_path.replace(".py", "")
-        score = fuzz.partial_ratio(cleaned_file_path, query)
-        scored_files.append((file_path, score))
-
-    scored_files.sort(key=lambda x: x[1], reverse=True)
+    cleaned_file_paths = [file_path.replace(".py", "") for file_path in file_paths]
+    scores = process.cdist(cleaned_file_paths, [query], scorer=fuzz.partial_ratio)[:, 0]
 
-    sorted_file_paths = [file for file, score in scored_files]
+    # Stable sort on descending score to keep the original order of files with the same score
+    order = np.argsort(-scores, kind="stable")
+    sorted_file_paths = [file_paths[i] for i in order]
 
     logger.info(
         f"rerank_files() Reranked {len(file_paths)} files with query {tokenized_query}. First hit {sorted_file_paths[0]}"
@@ -1,10 +1,18 @@
 import os
 
-from moatless.index.retry_voyage_embedding import VoyageEmbeddingWithRetry
+from moatless.index.retry_voyage_embedding import VOYAGE_MAX_BATCH_SIZE, VoyageEmbeddingWithRetry
 
 
-def get_embed_model(model_name: str) -> "BaseEmbedding":
-    if model_name.startswith("voyage"):
+def get_embed_model(model_name: str, dimensions: int | None = None) -> "BaseEmbedding":
+    if model_name.startswith("local"):
+        from moatless.index.hash_embedding import HashEmbedding
+
+        return HashEmbedding(
+            model_name=model_name,
+            dimensions=dimensions or 1536,
+            latency=float(os.environ.get("LOCAL_EMBED_LATENCY", 0)),
+        )
+    elif model_name.startswith("voyage"):
         try:
             from llama_index.embeddings.voyageai import VoyageEmbedding
         except ImportError as e:
@@ -19,7 +27,9 @@ def get_embed_model(model_name: str) -> "BaseEmbedding":
             model_name=model_name,
             voyage_api_key=os.environ.get("VOYAGE_API_KEY"),
             truncation=True,
-            embed_batch_size=60,
+            # Texts are packed into requests by token count and sent concurrently by the embedding model
+            embed_batch_size=VOYAGE_MAX_BATCH_SIZE,
+            max_concurrent_requests=int(os.environ.get("VOYAGE_MAX_CONCURRENT_REQUESTS", 4)),
         )
     else:
         # Assumes OpenAI otherwise
@@ -77,6 +77,7 @@ class EpicSplitter(NodeParser):
         tokenizer: Optional[Callable] = None,
         non_code_file_extensions: list[str] | None = None,
         callback_manager: CallbackManager | None = None,
+        enable_code_graph: bool = False,
     ) -> None:
         if non_code_file_extensions is None:
             non_code_file_extensions = ["md", "txt"]
@@ -86,7 +87,7 @@ class EpicSplitter(NodeParser):
             language=language,
             index_callback=index_callback,
             min_lines_to_parse_block=min_lines_to_parse_block,
-            enable_code_graph=False,
+            enable_code_graph=enable_code_graph,
         )
 
         super().__init__(
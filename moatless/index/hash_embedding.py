@@ -0,0 +1,82 @@
+import asyncio
+import re
+import time
+import zlib
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import Field
+
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_SUBTOKEN_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize_identifiers(text: str) -> list[str]:
+    """Split text into lower cased identifiers and their snake_case and camelCase sub tokens."""
+    tokens = []
+    for identifier in _IDENTIFIER_PATTERN.findall(text):
+        lowered = identifier.lower()
+        tokens.append(lowered)
+
+        subtokens = [subtoken.lower() for part in identifier.split("_") for subtoken in _SUBTOKEN_PATTERN.findall(part)]
+        if len(subtokens) > 1:
+            tokens.extend(subtokens)
+
+    return tokens
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic embedding model that feature hashes identifier tokens into a fixed number of dimensions.
+
+    Runs locally without network access or API keys and is meant for benchmarks and tests of the index, not for
+    retrieval quality.
+    """
+
+    model_name: str = Field(default="local-hash", description="The name of the embedding model.")
+    dimensions: int = Field(default=1536, description="The number of dimensions of the vectors.")
+    latency: float = Field(default=0.0, description="Artificial latency in seconds added to each embedding request.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            tokens = tokenize_identifiers(text)
+            if not tokens:
+                continue
+
+            hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens), dtype=np.uint32, count=len(tokens))
+            indices = (hashes % self.dimensions).astype(np.intp)
+
+            # Use the highest bit as sign to reduce the bias from hash collisions
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], indices, signs)
+
+        # Sub linear term frequency scaling and L2 normalization
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(texts)
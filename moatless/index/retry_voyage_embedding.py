@@ -1,38 +1,147 @@
+import asyncio
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
 
+import voyageai
 from llama_index.embeddings.voyageai import VoyageEmbedding
-from tenacity import retry, wait_random_exponential, stop_after_attempt
-from voyageai.error import InvalidRequestError
+from pydantic import Field
+from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from voyageai.error import APIConnectionError, InvalidRequestError, RateLimitError, ServiceUnavailableError, Timeout
+
+from moatless.utils.tokenizer import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# Max tokens per request by model name, see https://docs.voyageai.com/docs/embeddings. Names are matched exactly as
+# models with a common prefix have different limits, like voyage-3 and voyage-3-large.
+VOYAGE_BATCH_TOKEN_LIMITS = {
+    "voyage-3.5-lite": 1_000_000,
+    "voyage-3-lite": 1_000_000,
+    "voyage-3.5": 320_000,
+    "voyage-3": 320_000,
+    "voyage-2": 320_000,
+    "voyage-3-large": 120_000,
+    "voyage-code-3": 120_000,
+    "voyage-code-2": 120_000,
+    "voyage-multilingual-2": 120_000,
+    "voyage-finance-2": 120_000,
+    "voyage-law-2": 120_000,
+    "voyage-large-2": 120_000,
+    "voyage-large-2-instruct": 120_000,
+}
+# Used for models not listed, the lowest limit of the listed models
+DEFAULT_BATCH_TOKEN_LIMIT = 120_000
+
+# Max number of texts per request
+VOYAGE_MAX_BATCH_SIZE = 1000
+
+_RETRYABLE_ERRORS = (RateLimitError, ServiceUnavailableError, Timeout, APIConnectionError)
+
+
+def is_token_limit_error(e: Exception) -> bool:
+    return isinstance(e, InvalidRequestError) and "Please lower the number of tokens in the batch" in str(e)
+
 
 class VoyageEmbeddingWithRetry(VoyageEmbedding):
-    @retry(wait=wait_random_exponential(multiplier=1, max=60), stop=stop_after_attempt(6))
-    def _get_embedding(self, texts: List[str], input_type: str) -> List[List[float]]:
-        try:
-            return self._client.embed(
-                texts,
-                model=self.model_name,
-                input_type=input_type,
-                truncation=self.truncation,
-            ).embeddings
-        except InvalidRequestError as e:
-            if "Please lower the number of tokens in the batch" in str(e):
-                if len(texts) < 10:
-                    raise  # If batch size is already less than 10 we expect batchs to be abnormaly large and raise the error
+    """
+    Voyage embedding model that packs texts into batches by token count and sends them concurrently.
+
+    Rate limit and connection errors are retried with exponential backoff. If a batch is rejected for having too
+    many tokens, only that batch is split in halves while the other batches proceed.
+    """
+
+    max_batch_tokens: int = Field(
+        default=0,
+        description="Max tokens per request. Defaults to 80% of the model limit as tokens are counted with tiktoken.",
+    )
+    max_concurrent_requests: int = Field(default=4, description="Max number of requests in flight.")
+    max_retries: int = Field(default=6, description="Max attempts per batch on rate limit and connection errors.")
+    retry_max_wait: float = Field(default=60.0, description="Max seconds to wait between retries.")
+
+    def __init__(
+        self,
+        model_name: str,
+        voyage_api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(model_name=model_name, voyage_api_key=voyage_api_key, **kwargs)
+
+        if base_url:
+            self._client = voyageai.Client(api_key=voyage_api_key, base_url=base_url)
+            self._aclient = voyageai.AsyncClient(api_key=voyage_api_key, base_url=base_url)
+
+        if not self.max_batch_tokens:
+            token_limit = VOYAGE_BATCH_TOKEN_LIMITS.get(model_name, DEFAULT_BATCH_TOKEN_LIMIT)
+            self.max_batch_tokens = int(token_limit * 0.8)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_batch([query], input_type="query")[0]
 
-                mid = len(texts) // 2
-                first_half = texts[:mid]
-                second_half = texts[mid:]
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await asyncio.to_thread(self._embed_batch, [query], "query"))[0]
 
-                logger.info(
-                    f"Splitting batch of {len(texts)} texts into two halves of {len(first_half)} and {len(second_half)} texts."
-                )
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_batch([text], input_type="document")[0]
 
-                embeddings_first = self._get_embedding(first_half, input_type)
-                embeddings_second = self._get_embedding(second_half, input_type)
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await asyncio.to_thread(self._embed_batch, [text], "document"))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_concurrently(texts, input_type="document")
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._embed_concurrently, texts, "document")
+
+    def _pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """Split texts in order into batches below the max number of tokens and texts per request."""
+        batches = []
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= VOYAGE_MAX_BATCH_SIZE):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+
+            batch.append(text)
+            batch_tokens += tokens
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _embed_concurrently(self, texts: List[str], input_type: str) -> List[List[float]]:
+        batches = self._pack_batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch(batches[0], input_type)
+
+        logger.debug(f"Embedding {len(texts)} texts in {len(batches)} batches.")
+
+        embeddings = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            for batch_embeddings in executor.map(lambda batch: self._embed_batch(batch, input_type), batches):
+                embeddings.extend(batch_embeddings)
+
+        return embeddings
+
+    def _embed_batch(self, texts: List[str], input_type: str) -> List[List[float]]:
+        try:
+            for attempt in Retrying(
+                wait=wait_random_exponential(multiplier=1, max=self.retry_max_wait),
+                stop=stop_after_attempt(self.max_retries),
+                retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+                reraise=True,
+            ):
+                with attempt:
+                    return self._embed(texts, input_type=input_type)
+        except InvalidRequestError as e:
+            if not is_token_limit_error(e) or len(texts) == 1:
+                raise
 
-                return embeddings_first + embeddings_second
-            raise
+        mid = len(texts) // 2
+        logger.info(f"Splitting batch of {len(texts)} texts into two halves of {mid} and {len(texts) - mid} texts.")
+        return self._embed_batch(texts[:mid], input_type) + self._embed_batch(texts[mid:], input_type)
@@ -16,8 +16,33 @@ class CommentStrategy(Enum):
     EXCLUDE = "exclude"
 
 
+class VectorQuantization(Enum):
+    # Full float32 vectors in a flat index
+    FLAT = "flat"
+
+    # Scalar quantization to 16 bit floats
+    FP16 = "fp16"
+
+    # Scalar quantization to 8 bit integers, trained on the indexed vectors
+    INT8 = "int8"
+
+    # Product quantization, trained on the indexed vectors
+    PQ = "pq"
+
+
+class StorageFormat(Enum):
+    # JSON files compatible with the llama_index stores
+    JSON = "json"
+
+    # Numpy arrays, length prefixed blob files and columnar metadata
+    BINARY = "binary"
+
+
 class IndexSettings(BaseModel):
-    embed_model: str = Field(default="text-embedding-3-small", description="The embedding model to use.")
+    embed_model: str = Field(
+        default="text-embedding-3-small",
+        description="The embedding model to use. Use `local-hash` for an offline embedding model without API keys.",
+    )
     dimensions: int = Field(default=1536, description="The number of dimensions of the vectors.")
 
     language: str = Field(default="python", description="The language of the code.")
@@ -30,9 +55,28 @@ class IndexSettings(BaseModel):
         description="Strategy on how comments will be indexed.",
     )
 
+    quantization: VectorQuantization = Field(
+        default=VectorQuantization.FLAT,
+        description="How vectors are stored in the vector index.",
+    )
+    pq_m: int = Field(default=64, description="The number of sub-quantizers when using product quantization.")
+    pq_nbits: int = Field(default=8, description="The number of bits per sub-quantizer code.")
+    rerank_top_k: int = Field(
+        default=0,
+        description="Number of candidates to re-rank with exact distances from a float16 sidecar. 0 disables re-ranking.",
+    )
+
+    storage_format: StorageFormat = Field(
+        default=StorageFormat.JSON,
+        description="The format used when persisting the vector store and the docstore.",
+    )
+    compress_storage: bool = Field(default=False, description="Compress texts and metadata in the binary format.")
+
     def to_serializable_dict(self):
         data = self.dict()
         data["comment_strategy"] = data["comment_strategy"].value
+        data["quantization"] = data["quantization"].value
+        data["storage_format"] = data["storage_format"].value
         return data
 
     def persist(self, persist_dir: str):
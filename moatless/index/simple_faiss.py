@@ -23,6 +23,8 @@ from llama_index.core.vector_stores.types import (
 )
 from llama_index.core.vector_stores.utils import node_to_metadata_dict
 
+from moatless.index.binary_store import read_columns, read_strings, write_columns, write_strings
+
 logger = logging.getLogger(__name__)
 
 LEARNER_MODES = {
@@ -36,6 +38,56 @@ MMR_MODE = VectorStoreQueryMode.MMR
 NAMESPACE_SEP = "__"
 DEFAULT_VECTOR_STORE = "default"
 
+RERANK_SIDECAR_FNAME = "vector_index_rerank.npz"
+BINARY_IDS_FNAME = "vector_index.ids.npy"
+JSON_DATA_FNAME = "vector_index.json"
+BINARY_DATA_FNAMES = (
+    BINARY_IDS_FNAME,
+    "vector_index.text_ids.bin",
+    "vector_index.ref_text_ids.bin",
+    "vector_index.ref_doc_ids.bin",
+    "vector_index.metadata_ids.bin",
+    "vector_index.metadata.bin",
+    "vector_index.header.json",
+)
+
+# Deleted vectors are removed from the faiss index in batches as each remove_ids call scans the whole index
+DELETE_BATCH_SIZE = 10000
+
+# The value range of each dimension in an int8 index is fixed by the vectors it's trained on
+MIN_SQ_TRAINING_SIZE = 1000
+
+
+def create_faiss_index(d: int, quantization: str = "flat", pq_m: int = 64, pq_nbits: int = 8) -> Any:
+    """
+    Create an ID mapped faiss index storing vectors with the given quantization.
+
+    `int8` and `pq` indexes must be trained before vectors can be added, see `SimpleFaissVectorStore.add`.
+    """
+    quantization = getattr(quantization, "value", quantization)
+
+    if quantization == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif quantization == "fp16":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    elif quantization == "int8":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif quantization == "pq":
+        if d % pq_m != 0:
+            raise ValueError(f"The number of dimensions {d} must be a multiple of pq_m {pq_m}.")
+        index = faiss.IndexPQ(d, pq_m, pq_nbits, faiss.METRIC_L2)
+    else:
+        raise ValueError(f"Unknown quantization {quantization}.")
+
+    return faiss.IndexIDMap(index)
+
+
+def _remove_files(persist_dir: str, file_names) -> None:
+    for file_name in file_names:
+        file_path = os.path.join(persist_dir, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
 
 @dataclass
 class SimpleVectorStoreData(DataClassJsonMixin):
@@ -43,30 +95,84 @@ class SimpleVectorStoreData(DataClassJsonMixin):
     vector_id_to_text_id: dict[int, str] = field(default_factory=dict)
     metadata_dict: dict[str, Any] = field(default_factory=dict)
 
+    def persist_binary(self, persist_dir: str, compress: bool = False) -> None:
+        """Persist the id maps as numpy arrays and the metadata as columns."""
+        vector_ids = np.fromiter(self.vector_id_to_text_id.keys(), dtype=np.int64, count=len(self.vector_id_to_text_id))
+        np.save(f"{persist_dir}/{BINARY_IDS_FNAME}", vector_ids)
+        write_strings(f"{persist_dir}/vector_index.text_ids.bin", list(self.vector_id_to_text_id.values()))
+
+        write_strings(f"{persist_dir}/vector_index.ref_text_ids.bin", list(self.text_id_to_ref_doc_id.keys()))
+        write_strings(f"{persist_dir}/vector_index.ref_doc_ids.bin", list(self.text_id_to_ref_doc_id.values()))
+
+        write_strings(f"{persist_dir}/vector_index.metadata_ids.bin", list(self.metadata_dict.keys()))
+        write_columns(f"{persist_dir}/vector_index.metadata.bin", list(self.metadata_dict.values()), compress=compress)
+
+        with open(f"{persist_dir}/vector_index.header.json", "w") as f:
+            json.dump({"compressed": compress}, f)
+
+    @classmethod
+    def from_binary_dir(cls, persist_dir: str) -> "SimpleVectorStoreData":
+        with open(f"{persist_dir}/vector_index.header.json") as f:
+            header = json.load(f)
+
+        vector_ids = np.load(f"{persist_dir}/{BINARY_IDS_FNAME}").tolist()
+        text_ids = read_strings(f"{persist_dir}/vector_index.text_ids.bin")
+
+        ref_text_ids = read_strings(f"{persist_dir}/vector_index.ref_text_ids.bin")
+        ref_doc_ids = read_strings(f"{persist_dir}/vector_index.ref_doc_ids.bin")
+
+        metadata_ids = read_strings(f"{persist_dir}/vector_index.metadata_ids.bin")
+        metadata = read_columns(f"{persist_dir}/vector_index.metadata.bin", compressed=header["compressed"])
+
+        return cls(
+            text_id_to_ref_doc_id=dict(zip(ref_text_ids, ref_doc_ids, strict=True)),
+            vector_id_to_text_id=dict(zip(vector_ids, text_ids, strict=True)),
+            metadata_dict=dict(zip(metadata_ids, metadata, strict=True)),
+        )
+
 
 class SimpleFaissVectorStore(BasePydanticVectorStore):
     """Simple Vector Store using Faiss."""
 
     stores_text: bool = False
     d: int = 1536  # Add this as a model field instead of private attr
+    rerank_top_k: int = 0  # Number of candidates to re-rank with exact distances, 0 disables re-ranking
+    storage_format: str = "json"  # Persist the id maps and metadata as "json" or "binary"
+    compress: bool = False  # Compress the metadata when persisting in the binary format
 
     _data: SimpleVectorStoreData = PrivateAttr()
     _fs: fsspec.AbstractFileSystem = PrivateAttr()
     _faiss_index: Any = PrivateAttr()
 
-    _vector_ids_to_delete: list[int] = PrivateAttr(default_factory=list)
+    _vector_ids_to_delete: set[int] = PrivateAttr(default_factory=set)
     _text_ids_to_delete: set[str] = PrivateAttr(default_factory=set)
 
+    _next_vector_id: int = PrivateAttr(default=0)
+    _vector_ids_by_ref_doc_id: dict[str, set[int]] = PrivateAttr(default_factory=dict)
+
+    # Vectors waiting for the faiss index to be trained
+    _pending_ids: list[int] = PrivateAttr(default_factory=list)
+    _pending_embeddings: list[list[float]] = PrivateAttr(default_factory=list)
+
+    # An untrained quantized index, used instead of the exact index in `_faiss_index` when there are enough vectors
+    # to train it
+    _untrained_index: Any = PrivateAttr(default=None)
+
+    # float16 copies of the vectors used to re-rank candidates from a quantized index
+    _rerank_vectors: dict[int, np.ndarray] = PrivateAttr(default_factory=dict)
+
     def __init__(
         self,
         faiss_index: Any,
         d: int = 1536,
         data: SimpleVectorStoreData | None = None,
         fs: fsspec.AbstractFileSystem | None = None,
+        rerank_top_k: int = 0,
+        rerank_vectors: dict[int, np.ndarray] | None = None,
         **kwargs: Any,
     ) -> None:
         """Initialize params."""
-        super().__init__(d=d, **kwargs)  # Pass d to parent constructor
+        super().__init__(d=d, rerank_top_k=rerank_top_k, **kwargs)  # Pass d to parent constructor
 
         import_err_msg = """
             `faiss` package not found. For instructions on
@@ -81,17 +187,37 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
         self._faiss_index = cast(faiss.Index, faiss_index)
         self._data = data or SimpleVectorStoreData()
         self._fs = fs or fsspec.filesystem("file")
+        self._rerank_vectors = rerank_vectors or {}
+
+        if self._data.vector_id_to_text_id:
+            self._next_vector_id = max(self._data.vector_id_to_text_id) + 1
+
+        for vector_id, text_id in self._data.vector_id_to_text_id.items():
+            ref_doc_id = self._data.text_id_to_ref_doc_id.get(text_id, text_id)
+            self._vector_ids_by_ref_doc_id.setdefault(ref_doc_id, set()).add(vector_id)
 
     @classmethod
-    def from_defaults(cls, d: int = 1536):
-        faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(1536))
-        return cls(faiss_index, d)
+    def from_defaults(
+        cls,
+        d: int = 1536,
+        quantization: str = "flat",
+        pq_m: int = 64,
+        pq_nbits: int = 8,
+        rerank_top_k: int = 0,
+    ):
+        faiss_index = create_faiss_index(d, quantization, pq_m=pq_m, pq_nbits=pq_nbits)
+        return cls(faiss_index, d, rerank_top_k=rerank_top_k)
 
     @property
     def client(self) -> Any:
         """Return the faiss index."""
         return self._faiss_index
 
+    @property
+    def vector_count(self) -> int:
+        """The number of vectors a query can hit, including vectors pending deletion that are filtered from results."""
+        return self._faiss_index.ntotal + len(self._pending_ids)
+
     def add(
         self,
         nodes: list[BaseNode],
@@ -102,30 +228,104 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
         if not nodes:
             return []
 
-        vector_id = max([int(k) for k in self._data.vector_id_to_text_id]) if self._data.vector_id_to_text_id else 0
+        vector_id = self._next_vector_id
 
         logger.info(f"Adding {len(nodes)} nodes to index, start at id {vector_id}.")
 
         embeddings = []
         ids = []
         for node in nodes:
+            ref_doc_id = node.ref_doc_id or node.id_
             embeddings.append(node.get_embedding())
-            ids.append(int(vector_id))
+            ids.append(vector_id)
             self._data.vector_id_to_text_id[vector_id] = node.id_
-            self._data.text_id_to_ref_doc_id[node.id_] = node.ref_doc_id or node.id_
+            self._data.text_id_to_ref_doc_id[node.id_] = ref_doc_id
+            self._vector_ids_by_ref_doc_id.setdefault(ref_doc_id, set()).add(vector_id)
+            self._text_ids_to_delete.discard(node.id_)
             vector_id += 1
 
             metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
             metadata.pop("_node_content", None)
             self._data.metadata_dict[node.node_id] = metadata
 
-        vectors_ndarray = np.array(embeddings)
-        ids_ndarray = np.array(ids)
+        self._next_vector_id = vector_id
+
+        if self.rerank_top_k:
+            for vector_id, embedding in zip(ids, embeddings, strict=True):
+                self._rerank_vectors[vector_id] = np.asarray(embedding, dtype=np.float16)
+
+        if not self._faiss_index.is_trained:
+            # Quantized indexes are trained on the first vectors added, wait until there are enough of them
+            self._pending_ids.extend(ids)
+            self._pending_embeddings.extend(embeddings)
+            if len(self._pending_ids) >= self._min_training_size():
+                self._flush_pending()
+            return [node.node_id for node in nodes]
+
+        vectors_ndarray = np.array(embeddings, dtype="float32")
+        ids_ndarray = np.array(ids, dtype=np.int64)
 
         self._faiss_index.add_with_ids(vectors_ndarray, ids_ndarray)
 
+        if self._untrained_index is not None and self._faiss_index.ntotal >= self._min_training_size(
+            self._untrained_index
+        ):
+            self._train_quantized_index()
+
         return [node.node_id for node in nodes]
 
+    def _min_training_size(self, faiss_index: Any = None) -> int:
+        index = faiss.downcast_index((faiss_index or self._faiss_index).index)
+        if isinstance(index, faiss.IndexPQ):
+            # faiss recommends at least 39 training points per centroid
+            return 39 * (1 << index.pq.nbits)
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return MIN_SQ_TRAINING_SIZE
+        return 1
+
+    def _can_train(self, vectors: int) -> bool:
+        index = faiss.downcast_index(self._faiss_index.index)
+        if isinstance(index, faiss.IndexPQ):
+            return vectors >= (1 << index.pq.nbits)
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            # A few vectors give a value range that clips most vectors added later
+            return vectors >= MIN_SQ_TRAINING_SIZE
+        return True
+
+    def _train_quantized_index(self) -> None:
+        """Move the vectors in the exact index to the quantized index, trained on them."""
+        exact_index = self._faiss_index
+        ids_ndarray = faiss.vector_to_array(exact_index.id_map).astype(np.int64)
+        vectors_ndarray = exact_index.index.reconstruct_n(0, exact_index.ntotal)
+
+        logger.info(f"Training vector index on {len(ids_ndarray)} vectors.")
+        self._untrained_index.train(vectors_ndarray)
+        self._untrained_index.add_with_ids(vectors_ndarray, ids_ndarray)
+        self._faiss_index = self._untrained_index
+        self._untrained_index = None
+
+    def _flush_pending(self) -> None:
+        """Train the index on the pending vectors if needed and add them to the index."""
+        if not self._pending_ids:
+            return
+
+        vectors_ndarray = np.array(self._pending_embeddings, dtype="float32")
+        ids_ndarray = np.array(self._pending_ids, dtype=np.int64)
+
+        if not self._faiss_index.is_trained:
+            if self._can_train(len(ids_ndarray)):
+                logger.info(f"Training vector index on {len(ids_ndarray)} vectors.")
+                self._faiss_index.train(vectors_ndarray)
+            else:
+                # Too few vectors to train the quantizer, search them exactly until there are enough
+                logger.info(f"Using an exact vector index until there are enough vectors to train, got {len(ids_ndarray)}.")
+                self._untrained_index = self._faiss_index
+                self._faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(self.d))
+
+        self._faiss_index.add_with_ids(vectors_ndarray, ids_ndarray)
+        self._pending_ids = []
+        self._pending_embeddings = []
+
     def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
         """
         Delete nodes using with ref_doc_id.
@@ -135,14 +335,46 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
 
         """
 
-        self._text_ids_to_delete = set()
-        for text_id, ref_doc_id_ in self._data.text_id_to_ref_doc_id.items():
-            if ref_doc_id == ref_doc_id_:
-                self._text_ids_to_delete.add(text_id)
+        vector_ids = self._vector_ids_by_ref_doc_id.pop(ref_doc_id, set())
 
-        for vector_id, text_id in self._data.vector_id_to_text_id.items():
+        for vector_id in vector_ids:
+            self._text_ids_to_delete.add(self._data.vector_id_to_text_id[vector_id])
+
+        self._vector_ids_to_delete.update(vector_ids)
+
+        if len(self._vector_ids_to_delete) >= DELETE_BATCH_SIZE:
+            self._remove_deleted_vectors()
+
+    def _remove_deleted_vectors(self) -> None:
+        """Remove vectors marked as deleted from the faiss index and the id maps in one batch."""
+        if self._pending_ids:
+            pending = [
+                (vector_id, embedding)
+                for vector_id, embedding in zip(self._pending_ids, self._pending_embeddings, strict=True)
+                if vector_id not in self._vector_ids_to_delete
+            ]
+            self._pending_ids = [vector_id for vector_id, _ in pending]
+            self._pending_embeddings = [embedding for _, embedding in pending]
+
+        if self._vector_ids_to_delete:
+            logger.info(f"Deleting {len(self._vector_ids_to_delete)} vectors from index.")
+            ids_to_remove_array = np.fromiter(
+                self._vector_ids_to_delete, dtype=np.int64, count=len(self._vector_ids_to_delete)
+            )
+            removed = self._faiss_index.remove_ids(ids_to_remove_array)
+            logger.info(f"Removed {removed} vectors from index.")
+
+        for vector_id in self._vector_ids_to_delete:
+            text_id = self._data.vector_id_to_text_id.pop(vector_id, None)
             if text_id in self._text_ids_to_delete:
-                self._vector_ids_to_delete.append(vector_id)
+                self._data.text_id_to_ref_doc_id.pop(text_id, None)
+            self._rerank_vectors.pop(vector_id, None)
+
+        for text_id in self._text_ids_to_delete:
+            self._data.metadata_dict.pop(text_id, None)
+
+        self._vector_ids_to_delete = set()
+        self._text_ids_to_delete = set()
 
     def query(
         self,
@@ -158,9 +390,19 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
         """
         query_filter_fn = _build_metadata_filter_fn(lambda node_id: self._data.metadata_dict[node_id], query.filters)
 
+        self._flush_pending()
+
         query_embedding = cast(list[float], query.query_embedding)
         query_embedding_np = np.array(query_embedding, dtype="float32")[np.newaxis, :]
-        dists, indices = self._faiss_index.search(query_embedding_np, query.similarity_top_k)
+
+        if self.rerank_top_k and self._rerank_vectors:
+            dists, indices = self._rerank(
+                query_embedding_np,
+                query.similarity_top_k,
+                max(query.similarity_top_k, self.rerank_top_k),
+            )
+        else:
+            dists, indices = self._faiss_index.search(query_embedding_np, query.similarity_top_k)
         dists = list(dists[0])
 
         if len(indices) == 0:
@@ -174,17 +416,23 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
 
         filtered_dists = []
         filtered_node_ids = []
+        seen_node_ids = set()
         for dist, idx in zip(dists, node_idxs, strict=False):
             if idx < 0:
                 break
 
+            if idx in self._vector_ids_to_delete:
+                filtered_out += 1
+                continue
+
             node_id = self._data.vector_id_to_text_id.get(idx)
             if not query_filter_fn(node_id):
                 filtered_out += 1
-            elif node_id and node_id not in filtered_node_ids:
+            elif node_id and node_id not in seen_node_ids:
+                seen_node_ids.add(node_id)
                 filtered_node_ids.append(node_id)
                 filtered_dists.append(dist.item())
-            elif node_id in filtered_node_ids:
+            elif node_id in seen_node_ids:
                 duplicates += 1
             else:
                 not_found += 1
@@ -196,6 +444,20 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
 
         return VectorStoreQueryResult(similarities=filtered_dists, ids=filtered_node_ids)
 
+    def _rerank(self, query_embedding_np: np.ndarray, top_k: int, candidates: int) -> tuple[np.ndarray, np.ndarray]:
+        """Search for candidates in the quantized index and re-rank them on exact distances to the sidecar vectors."""
+        _, indices = self._faiss_index.search(query_embedding_np, candidates)
+
+        candidate_ids = [idx for idx in indices[0] if idx >= 0 and idx in self._rerank_vectors]
+        if not candidate_ids:
+            return self._faiss_index.search(query_embedding_np, top_k)
+
+        vectors = np.stack([self._rerank_vectors[idx] for idx in candidate_ids]).astype(np.float32)
+        exact_dists = ((vectors - query_embedding_np) ** 2).sum(axis=1)
+
+        order = np.argsort(exact_dists, kind="stable")[:top_k]
+        return exact_dists[order][np.newaxis, :], np.array(candidate_ids, dtype=np.int64)[order][np.newaxis, :]
+
     def persist(
         self,
         persist_dir: str = DEFAULT_PERSIST_DIR,
@@ -213,35 +475,39 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
         if not os.path.exists(persist_dir):
             os.makedirs(persist_dir)
 
-        logger.info(f"Deleting {len(self._vector_ids_to_delete)} vectors from index.")
-
-        if self._vector_ids_to_delete:
-            ids_to_remove_array = np.array(self._vector_ids_to_delete, dtype=np.int64)
-            removed = self._faiss_index.remove_ids(ids_to_remove_array)
-            logger.info(f"Removed {removed} vectors from index.")
-
-        if self._text_ids_to_delete:
-            for text_id in self._text_ids_to_delete:
-                if self._data.metadata_dict is not None:
-                    self._data.metadata_dict.pop(text_id, None)
+        self._remove_deleted_vectors()
+        self._flush_pending()
 
         faiss.write_index(self._faiss_index, f"{persist_dir}/vector_index.faiss")
 
-        for vector_id in self._vector_ids_to_delete:
-            text_id = self._data.vector_id_to_text_id.pop(vector_id, None)
-            if text_id:
-                self._data.text_id_to_ref_doc_id.pop(text_id, None)
-
-        self._vector_ids_to_delete = []
-
-        with fs.open(f"{persist_dir}/vector_index.json", "w") as f:
-            json.dump(self._data.to_dict(), f)
+        # Files of the other storage format or a previous rerank sidecar would be loaded instead of the new files
+        if self.storage_format == "binary":
+            self._data.persist_binary(persist_dir, compress=self.compress)
+            _remove_files(persist_dir, [JSON_DATA_FNAME])
+        else:
+            with fs.open(f"{persist_dir}/{JSON_DATA_FNAME}", "w") as f:
+                json.dump(self._data.to_dict(), f)
+            _remove_files(persist_dir, BINARY_DATA_FNAMES)
+
+        if self._rerank_vectors:
+            ids = np.fromiter(self._rerank_vectors.keys(), dtype=np.int64, count=len(self._rerank_vectors))
+            vectors = np.stack(list(self._rerank_vectors.values())).astype(np.float16)
+            np.savez_compressed(f"{persist_dir}/{RERANK_SIDECAR_FNAME}", ids=ids, vectors=vectors)
+        else:
+            _remove_files(persist_dir, [RERANK_SIDECAR_FNAME])
 
     @classmethod
     def from_persist_dir(
-        cls, persist_dir: str, fs: fsspec.AbstractFileSystem | None = None
+        cls,
+        persist_dir: str,
+        fs: fsspec.AbstractFileSystem | None = None,
+        rerank_top_k: int = 0,
+        storage_format: str | None = None,
     ) -> "SimpleFaissVectorStore":
-        """Create a SimpleKVStore from a persist directory."""
+        """
+        Create a SimpleKVStore from a persist directory. The storage format is detected from the persisted files if
+        not set.
+        """
 
         fs = fs or fsspec.filesystem("file")
         if not fs.exists(persist_dir):
@@ -255,13 +521,31 @@ class SimpleFaissVectorStore(BasePydanticVectorStore):
         faiss_index = faiss.read_index(f"{persist_dir}/vector_index.faiss")
 
         logger.debug(f"Loading {__name__} from {persist_dir}.")
-        with fs.open(f"{persist_dir}/vector_index.json", "rb") as f:
-            data_dict = json.load(f)
-            data = SimpleVectorStoreData.from_dict(data_dict)
+        if storage_format is None:
+            storage_format = "binary" if fs.exists(f"{persist_dir}/{BINARY_IDS_FNAME}") else "json"
+
+        if storage_format == "binary":
+            data = SimpleVectorStoreData.from_binary_dir(persist_dir)
+        else:
+            with fs.open(f"{persist_dir}/{JSON_DATA_FNAME}", "rb") as f:
+                data_dict = json.load(f)
+                data = SimpleVectorStoreData.from_dict(data_dict)
+
+        rerank_vectors = {}
+        if rerank_top_k and fs.exists(f"{persist_dir}/{RERANK_SIDECAR_FNAME}"):
+            with np.load(f"{persist_dir}/{RERANK_SIDECAR_FNAME}") as sidecar:
+                rerank_vectors = dict(zip(sidecar["ids"].tolist(), sidecar["vectors"], strict=True))
 
         logger.info(f"Loading {__name__} from {persist_dir}.")
 
-        return cls(faiss_index=faiss_index, data=data)
+        return cls(
+            faiss_index=faiss_index,
+            d=faiss_index.d,
+            data=data,
+            rerank_top_k=rerank_top_k,
+            rerank_vectors=rerank_vectors,
+            storage_format=storage_format,
+        )
 
     @classmethod
     def from_index(cls, faiss_index: Any):
@@ -1,18 +1,19 @@
 import json
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any, Callable, List
+from typing import Optional, Dict, Any, Callable, List, Union
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr
 
 from moatless.agent.agent import ActionAgent
 from moatless.completion.model import Usage
+from moatless.events import EventPayload, EventQueue, create_event
 from moatless.exceptions import RejectError, RuntimeError
 from moatless.file_context import FileContext
 from moatless.index.code_index import CodeIndex
-from moatless.node import Node, generate_ascii_tree
+from moatless.node import Node, generate_ascii_node, generate_ascii_tree
 from moatless.repository.repository import Repository
 from moatless.runtime.runtime import RuntimeEnvironment
+from moatless.utils.log import LazyMessage
 from moatless.workspace import Workspace
 
 logger = logging.getLogger(__name__)
@@ -30,6 +31,13 @@ class AgenticLoop(BaseModel):
     event_handlers: List[Callable] = Field(
         default_factory=list, description="Event handlers for loop events", exclude=True
     )
+    event_queue_size: Optional[int] = Field(
+        None,
+        description="Dispatch events to the handlers on a background thread through a queue of this size, so slow "
+        "handlers don't stall the loop. Handlers are called when the event is emitted if not set.",
+    )
+
+    _event_queue: Optional[EventQueue] = PrivateAttr(default=None)
 
     @classmethod
     def create(
@@ -72,8 +80,19 @@ class AgenticLoop(BaseModel):
         """Run the agentic loop until completion or max iterations."""
         self.assert_runnable()
 
+        if self.event_queue_size and self.event_handlers:
+            self._event_queue = EventQueue(self.event_handlers, max_size=self.event_queue_size)
+
+        try:
+            return self._run()
+        finally:
+            if self._event_queue:
+                self._event_queue.close()
+                self._event_queue = None
+
+    def _run(self):
         current_node = self.get_last_node()
-        self.log(logger.info, generate_ascii_tree(self.root))
+        self.log(logger.info, LazyMessage(generate_ascii_tree, self.root))
 
         self.emit_event("loop_started", {})
 
@@ -97,12 +116,12 @@ class AgenticLoop(BaseModel):
                 current_node = self._create_next_node(current_node)
                 self.agent.run(current_node)
                 self.maybe_persist()
-                self.log(logger.info, generate_ascii_tree(self.root, current_node))
+                self.log(logger.info, LazyMessage(generate_ascii_node, current_node))
 
                 # Emit iteration event
                 self.emit_event(
                     "loop_iteration",
-                    {
+                    lambda: {
                         "iteration": len(self.root.get_all_nodes()),
                         "total_cost": total_cost,
                         "action": current_node.action.name if current_node.action else None,
@@ -123,7 +142,7 @@ class AgenticLoop(BaseModel):
 
         self.emit_event(
             "loop_completed",
-            {
+            lambda: {
                 "total_iterations": len(self.root.get_all_nodes()),
                 "total_cost": self.total_usage().completion_cost,
             },
@@ -195,12 +214,14 @@ class AgenticLoop(BaseModel):
 
         return True
 
-    def log(self, logger_fn: Callable, message: str, **kwargs):
-        """Log a message with metadata."""
+    def log(self, logger_fn: Callable, message: Union[str, LazyMessage], **kwargs):
+        """Log a message with metadata, a lazy message is only created if the log level is enabled."""
         metadata = {**self.metadata, **kwargs}
-        metadata_str = " ".join(f"{k}: {str(v)[:20]}" for k, v in metadata.items())
-        log_message = f"[{metadata_str}] {message}" if metadata else message
-        logger_fn(log_message)
+        if metadata:
+            metadata_str = " ".join(f"{k}: {str(v)[:20]}" for k, v in metadata.items())
+            logger_fn("[%s] %s", metadata_str, message)
+        else:
+            logger_fn("%s", message)
 
     @classmethod
     def model_validate(
@@ -274,14 +295,18 @@ class AgenticLoop(BaseModel):
         """Add an event handler for loop events."""
         self.event_handlers.append(handler)
 
-    def emit_event(self, event_type: str, data: dict):
-        """Emit an event to all registered handlers."""
+    def emit_event(self, event_type: str, data: EventPayload):
+        """
+        Emit an event to all registered handlers. The data can be a function that creates it, which is only called
+        if there are handlers.
+        """
+        if not self.event_handlers:
+            return
+
         logger.info(f"Emit event {event_type}")
-        for handler in self.event_handlers:
-            handler(
-                {
-                    "event_type": event_type,
-                    "data": data,
-                    "timestamp": datetime.now().isoformat(),
-                }
-            )
+        event = create_event(event_type, data)
+        if self._event_queue:
+            self._event_queue.put(event)
+        else:
+            for handler in self.event_handlers:
+                handler(event)
@@ -1,8 +1,9 @@
+import hashlib
 import json
 import logging
 from typing import Optional, List, Dict, Any, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from moatless.actions.schema import ActionArguments, Observation
 from moatless.agent.settings import AgentSettings
@@ -14,10 +15,16 @@ from moatless.completion.model import (
 from moatless.file_context import FileContext
 from moatless.repository.repository import Repository
 from moatless.runtime.runtime import RuntimeEnvironment
+from moatless.tree_journal import replay_node_journal
+from moatless.tree_stats import TreeStats
+from moatless.utils.trajectory_file import LazySection, TrajectoryReader, is_binary_trajectory, write_trajectory
 from moatless.workspace import Workspace
 
 logger = logging.getLogger(__name__)
 
+# Fields that are parsed on first access when a node tree is reconstructed with lazy=True
+LAZY_FIELDS = ("action_steps", "completions", "file_context")
+
 
 class ActionStep(BaseModel):
     action: ActionArguments
@@ -101,6 +108,66 @@ class Node(BaseModel):
     agent_settings: Optional[AgentSettings] = Field(None, description="The agent settings associated with the node")
     feedback_data: Optional[FeedbackData] = Field(None, description="Structured feedback data for the node")
 
+    _tree_stats: Optional[TreeStats] = PrivateAttr(default=None)
+    # Unparsed data of lazy fields, with the repository and runtime to parse the file context with
+    _lazy_fields: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+    _lazy_context: Optional[tuple] = PrivateAttr(default=None)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called when the attribute isn't set, as for lazy fields that are not parsed yet
+        try:
+            lazy_fields = object.__getattribute__(self, "__pydantic_private__")["_lazy_fields"]
+        except (AttributeError, KeyError, TypeError):
+            lazy_fields = None
+
+        if lazy_fields and name in lazy_fields:
+            self._load_lazy_field(name)
+            return self.__dict__[name]
+
+        return super().__getattr__(name)
+
+    def _load_lazy_field(self, name: str):
+        data = self._lazy_fields.pop(name)
+        if isinstance(data, LazySection):
+            data = data.load()
+
+        if name == "action_steps":
+            value = [ActionStep.model_validate(step_data) for step_data in data]
+        elif name == "completions":
+            value = {key: Completion.model_validate(completion) for key, completion in data.items()}
+        elif name == "file_context":
+            repo, runtime = self._lazy_context
+            value = FileContext.from_dict(repo=repo, runtime=runtime, data=data)
+        else:
+            raise ValueError(f"Field {name} can't be loaded lazily")
+
+        self.__dict__[name] = value
+        self._release_lazy_data()
+
+    def _release_lazy_data(self):
+        if not self._lazy_fields:
+            self._lazy_fields = None
+            self._lazy_context = None
+
+    def load_lazy_fields(self):
+        """Parse all fields that were not accessed yet on a lazily reconstructed node."""
+        for name in list(self._lazy_fields or []):
+            if name in self.__dict__:
+                # Assigned before it was loaded
+                self._lazy_fields.pop(name)
+                self._release_lazy_data()
+            else:
+                self._load_lazy_field(name)
+
+    def __copy__(self):
+        # Copies would share the unparsed data of lazy fields, and loading them on one would remove them on the other
+        self.load_lazy_fields()
+        return super().__copy__()
+
+    def __deepcopy__(self, memo: Optional[Dict[int, Any]] = None):
+        self.load_lazy_fields()
+        return super().__deepcopy__(memo)
+
     @property
     def action(self) -> Optional[ActionArguments]:
         """Backward compatibility: Get action from the latest action step"""
@@ -182,6 +249,8 @@ class Node(BaseModel):
         """Add a child node to this node."""
         child_node.parent = self
         self.children.append(child_node)
+        if self._tree_stats is not None:
+            self._tree_stats.add(child_node)
 
     def set_parent(self, parent: "Node"):
         if self.node_id == parent.node_id:
@@ -211,6 +280,18 @@ class Node(BaseModel):
 
         return None
 
+    def state_hash(self) -> Optional[str]:
+        """
+        A hash of the file context and the last observation, equal for nodes that reached the same state with
+        different actions. None if the node has no file context.
+        """
+        if not self.file_context:
+            return None
+
+        observation = self.observation
+        state = [self.file_context.state_hash(), observation.message if observation else None]
+        return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
     def get_sibling_nodes(self) -> List["Node"]:
         if not self.parent:
             return []
@@ -263,6 +344,13 @@ class Node(BaseModel):
             nodes.extend(child._get_all_nodes())
         return nodes
 
+    def get_tree_stats(self) -> TreeStats:
+        """Get the incrementally maintained statistics of the tree, built on first access."""
+        root = self.get_root()
+        if root._tree_stats is None or root._tree_stats.root is not root:
+            TreeStats(root)
+        return root._tree_stats
+
     def get_root(self) -> "Node":
         node = self
         while node.parent:
@@ -300,9 +388,19 @@ class Node(BaseModel):
             if step.completion:
                 usage += step.completion.usage
 
-        for completion in self.completions.values():
-            if completion:
-                usage += completion.usage
+        pending_completions = self._lazy_fields.get("completions") if self._lazy_fields else None
+        if isinstance(pending_completions, LazySection):
+            pending_completions = self._lazy_fields["completions"] = pending_completions.load()
+
+        if pending_completions is not None:
+            # Sum usage without parsing the completions of a lazily loaded node
+            for completion in pending_completions.values():
+                if completion and completion.get("usage"):
+                    usage += Usage.model_validate(completion["usage"])
+        else:
+            for completion in self.completions.values():
+                if completion:
+                    usage += completion.usage
 
         return usage
 
@@ -329,6 +427,8 @@ class Node(BaseModel):
         if self.parent and self.parent.file_context:
             self.file_context = self.parent.file_context.clone()
         self.children = []
+        if self._tree_stats is not None:
+            self._tree_stats.invalidate()
 
     def clone_and_reset(self) -> "Node":
         """
@@ -365,6 +465,8 @@ class Node(BaseModel):
         Returns:
             Dict[str, Any]: A dictionary representation of the node tree.
         """
+        if self._lazy_fields:
+            self.load_lazy_fields()
 
         exclude_set = {"parent", "children"}
         if "exclude" in kwargs:
@@ -403,6 +505,7 @@ class Node(BaseModel):
         node_data: Dict[str, Any],
         repo: Repository | None = None,
         runtime: RuntimeEnvironment | None = None,
+        lazy: bool = False,
     ) -> "Node":
         """Update reconstruction to handle both old and new formats"""
 
@@ -424,6 +527,25 @@ class Node(BaseModel):
         if not "user_message" in node_data and node_data.get("message"):
             node_data["user_message"] = node_data.pop("message")
 
+        lazy_fields = {}
+        if lazy:
+            for field in LAZY_FIELDS:
+                if node_data.get(field):
+                    lazy_fields[field] = node_data.pop(field)
+                else:
+                    node_data.pop(field, None)
+
+            # Terminal is checked on the raw steps to keep backward compatibility without parsing them. Binary
+            # trajectories are written with terminal set and don't need the check.
+            if not isinstance(lazy_fields.get("action_steps"), LazySection):
+                for step_data in lazy_fields.get("action_steps", []):
+                    if (step_data.get("observation") or {}).get("terminal"):
+                        node_data["terminal"] = True
+
+        for field, value in node_data.items():
+            if isinstance(value, LazySection):
+                node_data[field] = value.load()
+
         if node_data.get("action_steps"):
             node_data["action_steps"] = [
                 ActionStep.model_validate(step_data) for step_data in node_data["action_steps"]
@@ -448,20 +570,21 @@ class Node(BaseModel):
         if node_data.get("feedback_data"):
             node_data["feedback_data"] = FeedbackData.model_validate(node_data["feedback_data"])
 
-        if "children" in node_data:
-            children = node_data.get("children", [])
+        children = node_data.pop("children", [])
+        node = super().model_validate(node_data)
 
-            del node_data["children"]
-            node = super().model_validate(node_data)
+        if lazy_fields:
+            for field in lazy_fields:
+                del node.__dict__[field]
+            node._lazy_fields = lazy_fields
+            node._lazy_context = (repo, runtime)
 
-            for child_data in children:
-                child = cls._reconstruct_node(child_data, repo=repo, runtime=runtime)
-                child.parent = node
-                node.children.append(child)
+        for child_data in children:
+            child = cls._reconstruct_node(child_data, repo=repo, runtime=runtime, lazy=lazy)
+            child.parent = node
+            node.children.append(child)
 
-            return node
-        else:
-            return super().model_validate(node_data)
+        return node
 
     @classmethod
     def reconstruct(
@@ -469,6 +592,8 @@ class Node(BaseModel):
         data: Union[Dict[str, Any], List[Dict[str, Any]]],
         repo: Repository | None = None,
         runtime: RuntimeEnvironment | None = None,
+        journal: Optional[List[Dict[str, Any]]] = None,
+        lazy: bool = False,
     ) -> "Node":
         """
         Reconstruct a node tree from either dict (tree) or list format.
@@ -477,16 +602,21 @@ class Node(BaseModel):
             data: Either a dict (tree format) or list of dicts (list format)
             parent: Optional parent node (used internally)
             repo: Optional repository reference
+            journal: Optional journal records to replay on the data, see `moatless.tree_journal`
+            lazy: Parse the action steps, completions and file context of each node on first access
 
         Returns:
             Node: Root node of reconstructed tree
         """
+        if journal:
+            data = replay_node_journal(data, journal)
+
         # Handle list format
         if isinstance(data, list):
-            return cls._reconstruct_from_list(data, repo=repo, runtime=runtime)
+            return cls._reconstruct_from_list(data, repo=repo, runtime=runtime, lazy=lazy)
 
         # Handle single node reconstruction (dict format)
-        return cls._reconstruct_node(data, repo=repo, runtime=runtime)
+        return cls._reconstruct_node(data, repo=repo, runtime=runtime, lazy=lazy)
 
     @classmethod
     def _reconstruct_from_list(
@@ -494,6 +624,7 @@ class Node(BaseModel):
         node_list: List[Dict],
         repo: Repository | None = None,
         runtime: RuntimeEnvironment | None = None,
+        lazy: bool = False,
     ) -> "Node":
         """
         Reconstruct tree from a flat list of nodes.
@@ -511,7 +642,7 @@ class Node(BaseModel):
         for node_data in node_list:
             parent_id = node_data.pop("parent_id", None)
             # Use the core reconstruct method for each node
-            node = cls._reconstruct_node(node_data, repo=repo, runtime=runtime)
+            node = cls._reconstruct_node(node_data, repo=repo, runtime=runtime, lazy=lazy)
             nodes_by_id[node.node_id] = (node, parent_id)
 
         # Connect parent-child relationships
@@ -541,25 +672,27 @@ class Node(BaseModel):
         return node_list
 
     @classmethod
-    def load_from_file(cls, file_path: str, repo: Repository | None = None) -> "Node":
+    def load_from_file(cls, file_path: str, repo: Repository | None = None, lazy: bool = False) -> "Node":
         """
-        Load node tree from file, supporting both old tree format and new list format.
+        Load node tree from file, supporting both old tree format, new list format and the binary format.
 
         Args:
             file_path (str): Path to the saved node data
             repo (Repository): Optional repository reference
+            lazy (bool): Parse the action steps, completions and file context of each node on first access
 
         Returns:
             Node: Root node of the tree
         """
+        if is_binary_trajectory(file_path):
+            with TrajectoryReader(file_path) as reader:
+                return cls.reconstruct(reader.read_nodes(lazy=lazy), repo=repo, lazy=lazy)
+
         with open(file_path, "r") as f:
             data = json.load(f)
 
-        if isinstance(data, list):
-            return cls.reconstruct_from_list(data, repo=repo)
-        else:
-            # Old tree format
-            return cls.reconstruct(data, repo=repo)
+        # Handles both the list format and the old tree format
+        return cls.reconstruct(data, repo=repo, lazy=lazy)
 
     def persist(self, file_path: str, format: str = "list"):
         """
@@ -567,14 +700,16 @@ class Node(BaseModel):
 
         Args:
             file_path (str): The path to save to
-            format (str): Either "list" (new) or "tree" (legacy)
+            format (str): Either "list" (new), "tree" (legacy) or "binary" (compressed, see `moatless.utils.trajectory_file`)
         """
         if format == "list":
             self.persist_as_list(file_path)
         elif format == "tree":
             self.persist_tree(file_path)
+        elif format == "binary":
+            write_trajectory(file_path, self.dump_as_list())
         else:
-            raise ValueError("Format must be either 'list' or 'tree'")
+            raise ValueError("Format must be either 'list', 'tree' or 'binary'")
 
     def truncate_children_by_id(self, max_id: int):
         """Truncate children to only include nodes with IDs less than or equal to the specified value.
@@ -583,6 +718,8 @@ class Node(BaseModel):
             max_id (int): Maximum node ID to keep (inclusive)
         """
         self.children = [child for child in self.children if child.node_id <= max_id]
+        if self._tree_stats is not None:
+            self._tree_stats.invalidate()
         # Recursively truncate remaining children
         for child in self.children:
             child.truncate_children_by_id(max_id)
@@ -626,25 +763,18 @@ def generate_ascii_tree(
     return "\n".join(tree_lines)
 
 
-def _append_ascii_node(
-    node: Node,
-    prefix: str,
-    is_last: bool,
-    tree_lines: list[str],
-    current: Node | None,
-    include_explanation: bool = False,
-    include_diffs: bool = False,
-    include_feedback: bool = False,
-    include_action_details: bool = False,
-    include_file_context: bool = False,
-    use_color: bool = True,
-    show_trajectory: bool = False,
-) -> None:
-    # Get current trajectory nodes if we have a current node and trajectory marking is enabled
-    current_trajectory_nodes = []
-    if current and show_trajectory:
-        current_trajectory_nodes = current.get_trajectory()
+def generate_ascii_node(node: Node, use_color: bool = True) -> str:
+    """
+    Create the ASCII line of a node, indented by its depth and with the id of its parent. Cheaper than
+    `generate_ascii_tree` when logging the node added in each iteration, as only this node is rendered.
+    """
+    depth = node.get_depth()
+    indent = "    " * max(depth - 1, 0)
+    parent_str = f" <- Node{node.parent.node_id}" if node.parent else ""
+    return f"{indent}└── {_format_ascii_node(node, node, use_color)}{parent_str}"
+
 
+def _format_ascii_node(node: Node, current: Node | None = None, use_color: bool = True) -> str:
     # Build node information
     state_params = []
     if node.action_steps:
@@ -689,6 +819,32 @@ def _append_ascii_node(
     if use_color:
         expandable_str = color_green(expandable_str) if node.is_expandable() else color_red(expandable_str)
 
+    return (
+        f"{node_str} {state_info} "
+        f"(expansions: {node.expanded_count()}, reward: {reward_str}, "
+        f"visits: {node.visits}, {expandable_str})"
+    )
+
+
+def _append_ascii_node(
+    node: Node,
+    prefix: str,
+    is_last: bool,
+    tree_lines: list[str],
+    current: Node | None,
+    include_explanation: bool = False,
+    include_diffs: bool = False,
+    include_feedback: bool = False,
+    include_action_details: bool = False,
+    include_file_context: bool = False,
+    use_color: bool = True,
+    show_trajectory: bool = False,
+) -> None:
+    # Get current trajectory nodes if we have a current node and trajectory marking is enabled
+    current_trajectory_nodes = []
+    if current and show_trajectory:
+        current_trajectory_nodes = current.get_trajectory()
+
     # Calculate the current node's connection prefix
     connection = "└── " if is_last else "├── "
 
@@ -696,11 +852,7 @@ def _append_ascii_node(
     trajectory_marker = "* " if (show_trajectory and node in current_trajectory_nodes) else "  "
 
     # Add the node line with expandable status and optional trajectory marker
-    tree_lines.append(
-        f"{prefix}{connection}{trajectory_marker}{node_str} {state_info} "
-        f"(expansions: {node.expanded_count()}, reward: {reward_str}, "
-        f"visits: {node.visits}, {expandable_str})"
-    )
+    tree_lines.append(f"{prefix}{connection}{trajectory_marker}{_format_ascii_node(node, current, use_color)}")
 
     # Calculate the content prefix - should align with the node's content
     content_prefix = prefix + ("    " if is_last else "│   ")
@@ -1,4 +1,3 @@
-import difflib
 import glob
 import logging
 import os
@@ -12,6 +11,7 @@ from pydantic import BaseModel, Field, PrivateAttr
 from moatless.codeblocks import get_parser_by_path
 from moatless.codeblocks.module import Module
 from moatless.repository.repository import Repository
+from moatless.utils.diff import unified_diff
 
 logger = logging.getLogger(__name__)
 
@@ -428,7 +428,7 @@ def remove_duplicate_lines(replacement_lines, original_lines):
 
 def do_diff(file_path: str, original_content: str, updated_content: str) -> Optional[str]:
     return "".join(
-        difflib.unified_diff(
+        unified_diff(
             original_content.strip().splitlines(True),
             updated_content.strip().splitlines(True),
             fromfile=file_path,
@@ -1,24 +1,46 @@
 import json
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any, List, Callable
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable, Union
 
-from pydantic import BaseModel, Field, model_validator, ConfigDict
+from pydantic import BaseModel, Field, PrivateAttr, model_validator, ConfigDict
 
 from moatless.actions.action import Action
 from moatless.agent.agent import ActionAgent
 from moatless.agent.settings import AgentSettings
 from moatless.completion.model import Usage
 from moatless.discriminator.base import BaseDiscriminator
+from moatless.events import EventPayload, EventQueue, create_event
 from moatless.exceptions import RuntimeError, RejectError
 from moatless.expander import Expander
 from moatless.feedback.base import BaseFeedbackGenerator
 from moatless.file_context import FileContext
 from moatless.index.code_index import CodeIndex
-from moatless.node import Node, generate_ascii_tree
+from moatless.node import Node, generate_ascii_node, generate_ascii_tree
 from moatless.repository.repository import Repository
 from moatless.runtime.runtime import RuntimeEnvironment
 from moatless.selector.base import BaseSelector
+from moatless.transposition import TranspositionTable
+from moatless.tree_journal import (
+    SNAPSHOT_ID_KEY,
+    TreeJournal,
+    flatten_nodes,
+    get_journal_path,
+    new_snapshot_id,
+    read_journal,
+    replay_journal,
+    write_snapshot,
+)
+from moatless.utils.log import LazyMessage
+from moatless.utils.trajectory_file import (
+    TrajectoryReader,
+    is_binary_trajectory,
+    is_binary_trajectory_path,
+    write_trajectory,
+)
 from moatless.value_function.base import BaseValueFunction
 
 logger = logging.getLogger(__name__)
@@ -43,6 +65,11 @@ class SearchTree(BaseModel):
     )
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata for the search tree.")
     persist_path: Optional[str] = Field(None, description="Path to persist the search tree.")
+    persist_journal: bool = Field(
+        True,
+        description="Append changed nodes to a journal next to the persisted tree instead of rewriting the full tree "
+        "after every iteration.",
+    )
     unique_id: int = Field(default=0, description="Unique ID counter for nodes.")
 
     max_expansions: int = Field(1, description="The maximum number of expansions of one state.")
@@ -60,13 +87,38 @@ class SearchTree(BaseModel):
         None, description="The min reward threshold to consider before finishing."
     )
     max_depth: Optional[int] = Field(20, description="The maximum depth for one trajectory in simulations.")
+    max_workers: int = Field(
+        1,
+        description="The number of simulations to run concurrently. With more than one worker, nodes are selected "
+        "while other nodes are simulated and the results are applied to the tree in the order the nodes were expanded.",
+    )
+    use_transpositions: bool = Field(
+        False,
+        description="Detect nodes that reach the same file context and observation as another node in the tree. "
+        "They share the reward of the equivalent node instead of being evaluated, and are not expanded. Their actions "
+        "are still generated and executed, as the state is only known after that.",
+    )
 
     event_handlers: List[Callable] = Field(
         default_factory=list, description="Event handlers for tree events", exclude=True
     )
+    event_queue_size: Optional[int] = Field(
+        None,
+        description="Dispatch events to the handlers on a background thread through a queue of this size, so slow "
+        "handlers don't stall the search. Handlers are called when the event is emitted if not set.",
+    )
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    _journal: Optional[TreeJournal] = PrivateAttr(default=None)
+    # Nodes changed since last persisted, mapped to the changed fields or None if the full node should be persisted
+    _changed_nodes: Dict[int, Optional[set]] = PrivateAttr(default_factory=dict)
+    _persisted_unique_id: Optional[int] = PrivateAttr(default=None)
+    # Serializes changes to the tree and event handlers in a parallel search
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _transpositions: Optional[TranspositionTable] = PrivateAttr(default=None)
+    _event_queue: Optional[EventQueue] = PrivateAttr(default=None)
+
     @classmethod
     def create(
         cls,
@@ -122,7 +174,13 @@ class SearchTree(BaseModel):
         )
 
     @classmethod
-    def model_validate(cls, obj: Any, repository: Repository | None = None, runtime: RuntimeEnvironment | None = None):
+    def model_validate(
+        cls,
+        obj: Any,
+        repository: Repository | None = None,
+        runtime: RuntimeEnvironment | None = None,
+        lazy: bool = False,
+    ):
         if isinstance(obj, dict):
             obj = obj.copy()
 
@@ -144,8 +202,8 @@ class SearchTree(BaseModel):
             if "discriminator" in obj and isinstance(obj["discriminator"], dict):
                 obj["discriminator"] = BaseDiscriminator.model_validate(obj["discriminator"])
 
-            if "root" in obj and isinstance(obj["root"], dict):
-                obj["root"] = Node.reconstruct(obj["root"], repo=repository)
+            if "root" in obj and isinstance(obj["root"], (dict, list)):
+                obj["root"] = Node.reconstruct(obj["root"], repo=repository, runtime=runtime, lazy=lazy)
 
         instance = super().model_validate(obj)
         instance.repository = repository
@@ -180,9 +238,7 @@ class SearchTree(BaseModel):
 
     @classmethod
     def from_file(cls, file_path: str, persist_path: str | None = None, **kwargs) -> "SearchTree":
-        with open(file_path, "r") as f:
-            tree_data = json.load(f)
-
+        tree_data = cls._read_persisted(file_path)
         return cls.from_dict(tree_data, persist_path=persist_path or file_path, **kwargs)
 
     def run_search(self) -> Node | None:
@@ -190,86 +246,215 @@ class SearchTree(BaseModel):
 
         self.assert_runnable()
 
-        self.log(logger.info, generate_ascii_tree(self.root))
+        if self.event_queue_size and self.event_handlers:
+            self._event_queue = EventQueue(self.event_handlers, max_size=self.event_queue_size)
 
-        if len(self.root.get_all_nodes()) > 1:
+        try:
+            return self._run_search()
+        finally:
+            if self._event_queue:
+                self._event_queue.close()
+                self._event_queue = None
+
+    def _run_search(self) -> Node | None:
+        self.log(logger.info, LazyMessage(generate_ascii_tree, self.root))
+
+        stats = self.root.get_tree_stats()
+        if stats.node_count > 1:
             self.log(
                 logger.info,
-                f"Restarting search tree with {len(self.root.get_all_nodes())} nodes",
+                f"Restarting search tree with {stats.node_count} nodes",
             )
 
+        if self.use_transpositions:
+            self._transpositions = TranspositionTable.from_tree(self.root)
+
         # Emit tree started event
         self.emit_event("tree_started", {})
 
-        while not self.is_finished():
-            total_cost = self.total_usage().completion_cost
-            self.log(
-                logger.info,
-                f"Run iteration {len(self.root.get_all_nodes())}",
-                cost=total_cost,
-            )
+        if self.max_workers > 1:
+            self._run_parallel_iterations()
+        else:
+            while not self.is_finished():
+                stats = self.root.get_tree_stats()
+                total_cost = stats.total_usage().completion_cost
+                self.log(
+                    logger.info,
+                    f"Run iteration {stats.node_count}",
+                    cost=total_cost,
+                )
 
-            node = self._select(self.root)
+                node = self._select(self.root)
 
-            if node:
-                new_node = self._expand(node)
-                self._simulate(new_node)
-                self._backpropagate(new_node)
-                self.maybe_persist()
-                self.log(logger.info, generate_ascii_tree(self.root, new_node))
+                if node:
+                    new_node = self._expand(node)
+                    self._simulate(new_node)
+                    self._backpropagate(new_node)
+                    self._complete_iteration(new_node, total_cost)
+                else:
+                    self.log(logger.info, "Search complete: no more nodes to expand.")
+                    break
 
-                # Emit tree iteration event
-                self.emit_event(
-                    "tree_iteration",
-                    {
-                        "iteration": len(self.root.get_all_nodes()),
-                        "total_cost": total_cost,
-                        "best_reward": max((n.reward.value if n.reward else 0) for n in self.root.get_all_nodes()),
-                        "finished_nodes": len(self.get_finished_nodes()),
-                        "total_nodes": len(self.root.get_all_nodes()),
-                        "best_node_id": self.get_best_trajectory().node_id if self.get_best_trajectory() else None,
-                        "action": new_node.action.name if new_node.action else None,
-                        "current_node_id": new_node.node_id,
-                    },
-                )
-            else:
-                self.log(logger.info, "Search complete: no more nodes to expand.")
-                break
+        self.log(logger.info, LazyMessage(generate_ascii_tree, self.root))
 
-        if not len(self.get_finished_nodes()):
+        stats = self.root.get_tree_stats()
+        finished_nodes = stats.finished_nodes()
+        if not finished_nodes:
             self.log(
                 logger.warning,
-                f"Search completed with no finished nodes. {len(self.root.get_all_nodes())} nodes created.",
+                f"Search completed with no finished nodes. {stats.node_count} nodes created.",
             )
         else:
             self.log(
                 logger.info,
-                f"Search completed with {len(self.get_finished_nodes())} finished nodes. {len(self.root.get_all_nodes())} nodes created.",
+                f"Search completed with {len(finished_nodes)} finished nodes. {stats.node_count} nodes created.",
             )
 
+        if self._transpositions:
+            self.log(
+                logger.info,
+                f"Found {self._transpositions.hits} nodes that reached the state of another node, "
+                f"{self._transpositions.shared_rewards} value function evaluations saved.",
+            )
+
+        best_trajectory = self.get_best_trajectory()
+
+        if self.persist_path and self._journal and self._journal.size:
+            # Compact the journal so the persisted tree is complete when the search is done
+            self.persist(self.persist_path)
+
         # Emit tree completed event
         self.emit_event(
             "tree_completed",
             {
-                "total_iterations": len(self.root.get_all_nodes()),
-                "total_cost": self.total_usage().completion_cost,
-                "finished_nodes": len(self.get_finished_nodes()),
-                "best_node_id": self.get_best_trajectory().node_id if self.get_best_trajectory() else None,
+                "total_iterations": stats.node_count,
+                "total_cost": stats.total_usage().completion_cost,
+                "finished_nodes": len(finished_nodes),
+                "best_node_id": best_trajectory.node_id if best_trajectory else None,
+                "transpositions": self._transpositions.hits if self._transpositions else 0,
+                "saved_evaluations": self._transpositions.shared_rewards if self._transpositions else 0,
             },
         )
 
-        return self.get_best_trajectory()
+        return best_trajectory
+
+    def _complete_iteration(self, new_node: Node, total_cost: float):
+        with self._lock:
+            self.maybe_persist()
+        self.log(logger.info, LazyMessage(generate_ascii_node, new_node))
+        self.log(logger.debug, LazyMessage(generate_ascii_tree, self.root, new_node))
+
+        # Emit the new node and the nodes updated by backpropagation
+        self.emit_event("tree_iteration_delta", lambda: self._iteration_delta_data(new_node))
+
+        # Emit tree iteration event
+        self.emit_event("tree_iteration", lambda: self._iteration_data(new_node, total_cost))
+
+    def _iteration_delta_data(self, new_node: Node) -> dict:
+        return {
+            "iteration": self.root.get_tree_stats().node_count,
+            "node": {
+                "node_id": new_node.node_id,
+                "parent_id": new_node.parent.node_id if new_node.parent else None,
+                "depth": new_node.get_depth(),
+                "action": new_node.action.name if new_node.action else None,
+                "reward": new_node.reward.value if new_node.reward else None,
+                "terminal": new_node.terminal,
+                "duplicate": bool(new_node.is_duplicate),
+            },
+            "updated_nodes": [
+                {
+                    "node_id": node.node_id,
+                    "visits": node.visits,
+                    "value": node.value,
+                    "expandable": node.is_expandable(),
+                }
+                for node in new_node.get_trajectory()
+            ],
+        }
 
-    def _select(self, node: Node) -> Optional[Node]:
-        """Select a node for expansion using the UCT algorithm."""
-        expandable_nodes = node.get_expandable_descendants()
+    def _iteration_data(self, new_node: Node, total_cost: float) -> dict:
+        stats = self.root.get_tree_stats()
+        best_trajectory = self.get_best_trajectory()
+        return {
+            "iteration": stats.node_count,
+            "total_cost": total_cost,
+            "best_reward": stats.max_reward(),
+            "finished_nodes": len(stats.finished_nodes()),
+            "total_nodes": stats.node_count,
+            "best_node_id": best_trajectory.node_id if best_trajectory else None,
+            "action": new_node.action.name if new_node.action else None,
+            "current_node_id": new_node.node_id,
+        }
 
-        if not expandable_nodes:
+    def _run_parallel_iterations(self):
+        """
+        Run iterations with up to `max_workers` simulations in flight. Nodes are selected and expanded on this thread
+        while the workers execute and evaluate other nodes, with a virtual loss on the paths of nodes in flight so
+        selections diverge. The results are applied to the tree in the order the nodes were expanded, which keeps the
+        search deterministic when the agent and value function are.
+        """
+        stats = self.root.get_tree_stats()
+        in_flight: deque[tuple[Node, Future]] = deque()
+
+        # Nodes in flight are not written to a snapshot, so start with one before any simulation
+        self.maybe_persist()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="search") as executor:
+            try:
+                while True:
+                    with self._lock:
+                        while len(in_flight) < self.max_workers and not self.is_finished():
+                            node = self._select(self.root)
+                            if not node:
+                                break
+
+                            self.log(
+                                logger.info,
+                                f"Run iteration {stats.node_count} with {len(in_flight)} simulations in flight",
+                                cost=stats.total_usage().completion_cost,
+                            )
+                            new_node = self._expand(node)
+                            stats.start_simulation(new_node)
+                            # Only states registered before submission are matched, as the order simulations finish
+                            # in is not deterministic
+                            version = self._transpositions.version if self._transpositions else None
+                            future = executor.submit(self._execute_and_evaluate, new_node, version)
+                            in_flight.append((new_node, future))
+
+                    if not in_flight:
+                        self.log(logger.info, "Search complete: no more nodes to expand.")
+                        break
+
+                    new_node, future = in_flight[0]
+                    future.exception()
+
+                    with self._lock:
+                        in_flight.popleft()
+                        try:
+                            future.result()
+                        finally:
+                            stats.finish_simulation(new_node)
+                            self._mark_changed(new_node)
+                            if self._transpositions:
+                                self._transpositions.add(new_node)
+
+                        self._backpropagate(new_node)
+                        total_cost = stats.total_usage().completion_cost
+
+                    # Event handlers are called outside the lock, nodes are only added to the tree on this thread
+                    self._complete_iteration(new_node, total_cost)
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
+
+    def _select(self, node: Node) -> Optional[Node]:
+        """Select a node for expansion with the selector."""
+        if not node.get_tree_stats().has_expandable_nodes():
             self.log(logger.info, "No expandable nodes found.")
             return None
 
-        # If we have a finished node or exceeded depth, use normal selection
-        return self.selector.select(expandable_nodes)
+        return self.selector.select_from_tree(node)
 
     def _expand(self, node: Node, force_expansion: bool = False) -> Node:
         """Expand the node and return a child node."""
@@ -294,7 +479,7 @@ class SearchTree(BaseModel):
 
                 self.emit_event(
                     "feedback_generated",
-                    {
+                    lambda: {
                         "node_id": child_node.node_id,
                         "parent_id": node.node_id,
                         "feedback": child_node.feedback_data.model_dump(),
@@ -303,12 +488,23 @@ class SearchTree(BaseModel):
                     },
                 )
 
+        self.root.get_tree_stats().refresh(child_node)
+        self._mark_changed(child_node)
+
         self.log(logger.info, f"Expanded Node{node.node_id} to new Node{child_node.node_id}")
         return child_node
 
     def _simulate(self, node: Node):
         """Simulate a playout by executing the action and evaluating the result."""
-
+        try:
+            self._execute_and_evaluate(node)
+        finally:
+            self.root.get_tree_stats().refresh(node)
+            self._mark_changed(node)
+            if self._transpositions:
+                self._transpositions.add(node)
+
+    def _execute_and_evaluate(self, node: Node, transposition_version: Optional[int] = None):
         if node.observation:
             logger.info(f"Node{node.node_id}: Action already executed. Skipping.")
         else:
@@ -319,6 +515,18 @@ class SearchTree(BaseModel):
                 logger.info(f"Node{node.node_id}: Reached max depth {self.max_depth}. Marking as terminal.")
                 node.terminal = True
 
+        if self._transpositions and node.observation and not node.is_duplicate:
+            equivalent_node = self._transpositions.transpose(node, transposition_version)
+            if equivalent_node:
+                self.emit_event(
+                    "transposition_found",
+                    {
+                        "node_id": node.node_id,
+                        "equivalent_node_id": equivalent_node.node_id,
+                        "reward": node.reward.value if node.reward else None,
+                    },
+                )
+
         if self.value_function and not node.is_duplicate and node.observation:
             try:
                 logger.info(f"Node{node.node_id}: Evaluating value function")
@@ -371,12 +579,15 @@ class SearchTree(BaseModel):
             return
 
         reward = node.reward.value
+        stats = self.root.get_tree_stats()
         while node is not None:
             node.visits += 1
             if not node.value:
                 node.value = reward
             else:
                 node.value += reward
+            stats.refresh_visits(node)
+            self._mark_changed(node, {"visits", "value"})
             node = node.parent
 
     def get_best_trajectory(self) -> Node | None:
@@ -386,12 +597,22 @@ class SearchTree(BaseModel):
 
         nodes = self.get_finished_nodes()
         if not nodes:
-            nodes = self.get_leaf_nodes()
+            leaf_count = self.root.get_tree_stats().leaf_count
             self.log(
                 logger.info,
-                f"get_best_trajectory() No finished nodes found. Will select from {len(nodes)} leaf nodes.",
+                f"get_best_trajectory() No finished nodes found. Will select from {leaf_count} leaf nodes.",
             )
 
+            if leaf_count == 1 or self.discriminator is None:
+                if leaf_count > 1:
+                    self.log(
+                        logger.info,
+                        "No discriminator provided. Returning the first finished node.",
+                    )
+                return self._get_last_leaf_node()
+
+            nodes = self.get_leaf_nodes()
+
         if len(nodes) == 1:
             return nodes[0]
 
@@ -404,39 +625,44 @@ class SearchTree(BaseModel):
 
         return self.discriminator.select(nodes)
 
+    def _get_last_leaf_node(self) -> Node:
+        """Get the last leaf node in depth first order without traversing the tree."""
+        node = self.root
+        while node.children:
+            node = node.children[-1]
+        return node
+
     def is_finished(self):
+        stats = self.root.get_tree_stats()
+
         # Check max cost
-        total_cost = self.total_usage().completion_cost
-        if self.max_cost and self.total_usage().completion_cost and total_cost >= self.max_cost:
+        total_cost = stats.total_usage().completion_cost
+        if self.max_cost and total_cost and total_cost >= self.max_cost:
             logger.info(f"Search finished: Reached max cost {self.max_cost}")
             return True
 
         # Check max iterations
-        if len(self.root.get_all_nodes()) >= self.max_iterations:
+        if stats.node_count >= self.max_iterations:
             logger.info(f"Search finished: Reached max iterations {self.max_iterations}")
             return True
 
-        finished_nodes = self.get_finished_nodes()
-        unique_finished_parents = set()
-        for node in finished_nodes:
-            unique_finished_parents.add(node.parent.node_id)
+        # Finished nodes are counted by unique parent
+        finished_count = stats.finished_count
 
         # Check max finished nodes
-        if self.max_finished_nodes and len(unique_finished_parents) >= self.max_finished_nodes:
+        if self.max_finished_nodes and finished_count >= self.max_finished_nodes:
             logger.info(f"Search finished: Reached max finished nodes {self.max_finished_nodes}")
             return True
 
         # Check reward threshold
-        if self.reward_threshold and any(
-            node.reward and node.reward.value >= self.reward_threshold for node in finished_nodes
-        ):
-            if not self.min_finished_nodes or len(unique_finished_parents) >= self.min_finished_nodes:
+        max_finished_reward = stats.max_finished_reward() if self.reward_threshold else None
+        if max_finished_reward is not None and max_finished_reward >= self.reward_threshold:
+            if not self.min_finished_nodes or finished_count >= self.min_finished_nodes:
                 logger.info(f"Search finished: Found solution meeting reward threshold {self.reward_threshold}")
                 return True
 
         # Check if there are no more expandable nodes
-        expandable_nodes = self.root.get_expandable_descendants()
-        if not expandable_nodes:
+        if not stats.has_expandable_nodes():
             logger.info("Search finished: No more expandable nodes")
             return True
 
@@ -444,21 +670,11 @@ class SearchTree(BaseModel):
 
     def get_finished_nodes(self) -> List[Node]:
         """Get all finished nodes in the search tree by uniqe parent node."""
-        parent_ids = set()
-        finished_nodes = []
-        for node in self.root.get_all_nodes():
-            # TODO: Pick finished node with highest/avg/lowest reward?
-            if node.is_finished() and node.parent.node_id not in parent_ids:
-                parent_ids.add(node.parent.node_id)
-                finished_nodes.append(node)
-
-        return finished_nodes
+        # TODO: Pick finished node with highest/avg/lowest reward?
+        return self.root.get_tree_stats().finished_nodes()
 
     def get_node_by_id(self, node_id: int) -> Node | None:
-        return next(
-            (node for node in self.root.get_all_nodes() if node.node_id == node_id),
-            None,
-        )
+        return self.root.get_tree_stats().get_node(node_id)
 
     def get_leaf_nodes(self) -> List[Node]:
         """Get all leaf nodes in the search tree."""
@@ -466,28 +682,112 @@ class SearchTree(BaseModel):
 
     def total_usage(self) -> Usage:
         """Calculate total token usage across all nodes."""
-        return self.root.total_usage()
-
+        return self.root.get_tree_stats().total_usage()
 
     def maybe_persist(self):
-        if self.persist_path:
+        if not self.persist_path:
+            return
+
+        stats = self.root.get_tree_stats()
+        if not self.persist_journal:
+            # Nodes in flight in a parallel search are changed by the workers while the tree is dumped, so the tree
+            # is written when all simulations are done
+            if not stats.in_flight_count:
+                self.persist(self.persist_path)
+            return
+
+        # Start with a snapshot of the full tree, and compact the journal when it's as large as the snapshot. Nodes
+        # in flight in a parallel search are changed by the workers, so the journal is not compacted until all
+        # simulations are done and they are written when their simulation is done.
+        if (
+            self._journal is None
+            or self._journal.path != get_journal_path(self.persist_path)
+            or not os.path.exists(self.persist_path)
+            or (self._journal.size >= os.path.getsize(self.persist_path) and not stats.in_flight_count)
+        ):
             self.persist(self.persist_path)
+            return
+
+        self._journal.append(self._get_journal_records())
+        self._changed_nodes = {
+            node_id: fields for node_id, fields in self._changed_nodes.items() if stats.is_in_flight(node_id)
+        }
 
     def persist(self, file_path: str, **kwargs):
         """
-        Persist the entire SearchTree to a file.
+        Persist the entire SearchTree to a file. The tree is written in the compressed binary trajectory format if
+        the file path ends with `.trajz`, and as JSON otherwise.
 
         Args:
             file_path (str): The path to the file where the tree will be saved.
         """
         tree_data = self.model_dump(**kwargs)
 
-        with open(file_path, "w") as f:
-            try:
-                json.dump(tree_data, f, indent=2)
-            except Exception as e:
-                logger.exception(f"Error saving search tree to {file_path}: {tree_data}")
-                raise e
+        is_snapshot = file_path == self.persist_path and self.persist_journal
+        if is_snapshot:
+            snapshot_id = new_snapshot_id()
+            tree_data[SNAPSHOT_ID_KEY] = snapshot_id
+
+        try:
+            if is_binary_trajectory_path(file_path):
+                nodes = flatten_nodes(tree_data.pop("root"))
+                write_trajectory(file_path, nodes, metadata=tree_data)
+            else:
+                write_snapshot(file_path, tree_data, indent=2)
+        except Exception as e:
+            logger.exception(f"Error saving search tree to {file_path}: {tree_data}")
+            raise e
+
+        if is_snapshot:
+            # The snapshot includes all changes in the journal
+            self._journal = TreeJournal(get_journal_path(file_path))
+            self._journal.reset(snapshot_id)
+            self._changed_nodes.clear()
+            self._persisted_unique_id = self.unique_id
+        elif file_path == self.persist_path and os.path.exists(get_journal_path(file_path)):
+            os.remove(get_journal_path(file_path))
+
+    def _mark_changed(self, node: Node, fields: Optional[set] = None):
+        """Mark a node to be written to the journal, with the changed fields or None if the full node changed."""
+        if node.node_id in self._changed_nodes:
+            changed_fields = self._changed_nodes[node.node_id]
+            if changed_fields is None or fields is None:
+                self._changed_nodes[node.node_id] = None
+            else:
+                changed_fields.update(fields)
+        else:
+            self._changed_nodes[node.node_id] = None if fields is None else set(fields)
+
+    def _get_journal_records(self) -> List[Dict[str, Any]]:
+        records = []
+        if self.unique_id != self._persisted_unique_id:
+            records.append({"type": "tree", "data": {"unique_id": self.unique_id}})
+            self._persisted_unique_id = self.unique_id
+
+        stats = self.root.get_tree_stats()
+        for node_id, fields in self._changed_nodes.items():
+            node = stats.get_node(node_id)
+            if node is None or stats.is_in_flight(node_id):
+                continue
+
+            if fields is None:
+                records.append(
+                    {
+                        "type": "node",
+                        "node_id": node.node_id,
+                        "parent_id": node.parent.node_id if node.parent else None,
+                        "data": node.model_dump(exclude={"parent", "children"}),
+                    }
+                )
+            else:
+                records.append(
+                    {
+                        "type": "update",
+                        "node_id": node.node_id,
+                        "data": {field: getattr(node, field) for field in sorted(fields)},
+                    }
+                )
+        return records
 
     def _generate_unique_id(self) -> int:
         self.unique_id += 1
@@ -532,6 +832,9 @@ class SearchTree(BaseModel):
         reward_threshold: Optional[float] = None,
         simulation_depth: int = 1,
         max_depth: Optional[int] = None,
+        max_workers: int = 1,
+        use_transpositions: bool = False,
+        event_queue_size: Optional[int] = None,
     ) -> "SearchTree":
         if not root and not message:
             raise ValueError("Either a root node or a message must be provided.")
@@ -567,6 +870,9 @@ class SearchTree(BaseModel):
             max_finished_nodes=max_finished_nodes,
             reward_threshold=reward_threshold,
             max_depth=max_depth,
+            max_workers=max_workers,
+            use_transpositions=use_transpositions,
+            event_queue_size=event_queue_size,
         )
 
     @classmethod
@@ -577,6 +883,7 @@ class SearchTree(BaseModel):
         repository: Repository | None = None,
         code_index: CodeIndex | None = None,
         runtime: RuntimeEnvironment | None = None,
+        lazy: bool = False,
     ) -> "SearchTree":
         data = data.copy()
         if persist_path:
@@ -591,14 +898,35 @@ class SearchTree(BaseModel):
                 runtime=runtime,
             )
 
-        return cls.model_validate(data, repository, runtime)
+        return cls.model_validate(data, repository, runtime, lazy=lazy)
 
     @classmethod
-    def from_file(cls, file_path: str, persist_path: str | None = None, **kwargs) -> "SearchTree":
-        with open(file_path, "r") as f:
-            tree_data = json.load(f)
+    def from_file(cls, file_path: str, persist_path: str | None = None, lazy: bool = False, **kwargs) -> "SearchTree":
+        """
+        Load a persisted search tree. With lazy set the action steps, completions and file context of each node are
+        parsed on first access, which is faster and uses less memory when only the tree structure and rewards are
+        needed, like in reports.
+        """
+        tree_data = cls._read_persisted(file_path, lazy=lazy)
+        return cls.from_dict(tree_data, persist_path=persist_path or file_path, lazy=lazy, **kwargs)
+
+    @staticmethod
+    def _read_persisted(file_path: str, lazy: bool = False) -> Dict[str, Any]:
+        """Read a persisted tree and replay the changes in its journal if there is one."""
+        if is_binary_trajectory(file_path):
+            with TrajectoryReader(file_path) as reader:
+                tree_data = dict(reader.metadata)
+                tree_data["root"] = reader.read_nodes(lazy=lazy)
+        else:
+            with open(file_path, "r") as f:
+                tree_data = json.load(f)
 
-        return cls.from_dict(tree_data, persist_path=persist_path or file_path, **kwargs)
+        records = read_journal(get_journal_path(file_path))
+        if records:
+            logger.info(f"Replaying {len(records)} journal records on {file_path}")
+            tree_data = replay_journal(tree_data, records)
+
+        return tree_data
 
     @model_validator(mode="after")
     def set_depth(self):
@@ -650,33 +978,42 @@ class SearchTree(BaseModel):
 
         return data
 
-    def log(self, logger_fn: Callable, message: str, **kwargs):
+    def log(self, logger_fn: Callable, message: Union[str, LazyMessage], **kwargs):
         """
         Log a message with metadata prefix (if any) and specified log level.
 
         Args:
             logger_fn: Logger function (logger.debug, logger.info, etc)
-            message (str): The message to log
+            message (str | LazyMessage): The message to log, a lazy message is only created if the log level is enabled
             **kwargs: Additional key-value pairs to include in metadata
         """
         metadata = {**self.metadata, **kwargs}
-        metadata_str = " ".join(f"{k}: {str(v)[:20]}" for k, v in metadata.items())
-        log_message = f"[{metadata_str}] {message}" if metadata else message
-
-        logger_fn(log_message)
+        if metadata:
+            metadata_str = " ".join(f"{k}: {str(v)[:20]}" for k, v in metadata.items())
+            logger_fn("[%s] %s", metadata_str, message)
+        else:
+            logger_fn("%s", message)
 
     def add_event_handler(self, handler: Callable):
         """Add an event handler for tree events."""
         self.event_handlers.append(handler)
 
-    def emit_event(self, event_type: str, data: dict):
-        """Emit an event to all registered handlers."""
+    def emit_event(self, event_type: str, data: EventPayload):
+        """
+        Emit an event to all registered handlers. The data can be a function that creates it, which is only called
+        if there are handlers. The function is called with the tree locked, and the handlers after it's released.
+        """
+        if not self.event_handlers:
+            return
+
         logger.info(f"Emit event {event_type}")
-        for handler in self.event_handlers:
-            handler(
-                {
-                    "event_type": event_type,
-                    "data": data,
-                    "timestamp": datetime.now().isoformat(),
-                }
-            )
+        if callable(data):
+            with self._lock:
+                data = data()
+
+        event = create_event(event_type, data)
+        if self._event_queue:
+            self._event_queue.put(event)
+        else:
+            for handler in self.event_handlers:
+                handler(event)
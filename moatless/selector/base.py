@@ -17,6 +17,17 @@ class BaseSelector(BaseModel, ABC):
 
         return expandable_nodes[0]
 
+    def select_from_tree(self, root: Node) -> Node | None:
+        """
+        Select a node to expand in the tree, skipping nodes that are or have children with a simulation in flight in
+        a parallel search. Selectors that score the tree stats can avoid traversing the tree.
+        """
+        stats = root.get_tree_stats()
+        expandable_nodes = root.get_expandable_descendants()
+        if stats.in_flight_count:
+            expandable_nodes = [node for node in expandable_nodes if stats.is_selectable(node)]
+        return self.select(expandable_nodes)
+
     @classmethod
     def model_validate(cls, obj: Any):
         if isinstance(obj, dict):
@@ -0,0 +1,89 @@
+import logging
+from typing import List, Literal
+
+import numpy as np
+from pydantic import Field
+
+from moatless.node import Node
+from moatless.selector.base import BaseSelector
+from moatless.tree_stats import NodeArrays
+
+logger = logging.getLogger(__name__)
+
+
+class UCTSelector(BaseSelector):
+    """
+    Select the expandable node with the highest UCT or PUCT score.
+
+    The mean value of a node is scaled by `reward_scale` and combined with an exploration term:
+
+        UCT:  Q + c * sqrt(ln(N_parent + 1) / (N + 1))
+        PUCT: Q + c * P * sqrt(N_parent) / (N + 1)
+
+    where P is the prior of the node, uniform over the expansions of its parent. Deep nodes and nodes with duplicate
+    children are penalized. In a parallel search each simulation in flight through a node counts as a visit with the
+    virtual loss as reward, and nodes in flight or with children in flight are not selected.
+
+    Scores are computed with NumPy over the node arrays in the tree stats, which are updated on expansion and
+    backpropagation, so selection doesn't traverse the tree. Ties go to the node created first.
+    """
+
+    algorithm: Literal["uct", "puct"] = Field("uct", description="Score nodes with UCT or PUCT.")
+    exploration_weight: float = Field(1.0, description="Weight of the exploration term.")
+    reward_scale: float = Field(100.0, description="Node values are divided by this to scale the mean value.")
+    depth_penalty: float = Field(0.0, description="Penalty per depth level of the node.")
+    duplicate_penalty: float = Field(0.0, description="Penalty per child of the node that is a duplicate.")
+    virtual_loss: float = Field(
+        1.0, description="Loss per simulation in flight through a node in a parallel search, in units of the reward scale."
+    )
+
+    def select(self, expandable_nodes: List[Node]) -> Node | None:
+        if not expandable_nodes:
+            return None
+
+        arrays = expandable_nodes[0].get_tree_stats().arrays
+        rows = np.array([arrays.row(node.node_id) for node in expandable_nodes], dtype=np.int64)
+        scores = self.score(arrays, rows)
+        return expandable_nodes[_best_index(scores, arrays.node_ids[rows])]
+
+    def select_from_tree(self, root: Node) -> Node | None:
+        stats = root.get_tree_stats()
+        arrays = stats.arrays
+        rows = arrays.selectable_rows()
+        if not len(rows):
+            return None
+
+        scores = self.score(arrays, rows)
+        return stats.get_node(int(arrays.node_ids[rows[_best_index(scores, arrays.node_ids[rows])]]))
+
+    def score(self, arrays: NodeArrays, rows: np.ndarray) -> np.ndarray:
+        """The scores of the nodes in the given rows of the node arrays."""
+        parent_rows = arrays.parent_rows[rows]
+        virtual_losses = arrays.virtual_losses[rows]
+        visits = arrays.visits[rows] + virtual_losses
+        parent_visits = arrays.visits[parent_rows] + arrays.virtual_losses[parent_rows]
+        values = arrays.values[rows] - virtual_losses * self.virtual_loss * self.reward_scale
+        mean_values = np.divide(values, visits, out=np.zeros(len(rows)), where=visits > 0)
+        scores = mean_values / self.reward_scale
+
+        if self.algorithm == "puct":
+            scores += self.exploration_weight * arrays.priors[rows] * np.sqrt(parent_visits) / (visits + 1)
+        else:
+            scores += self.exploration_weight * np.sqrt(np.log(parent_visits + 1) / (visits + 1))
+
+        if self.depth_penalty:
+            scores -= self.depth_penalty * arrays.depths[rows]
+
+        if self.duplicate_penalty:
+            size = arrays.size
+            duplicate_rows = np.flatnonzero(arrays.duplicate[:size])
+            duplicate_children = np.bincount(arrays.parent_rows[duplicate_rows], minlength=size)
+            scores -= self.duplicate_penalty * duplicate_children[rows]
+
+        return scores
+
+
+def _best_index(scores: np.ndarray, node_ids: np.ndarray) -> int:
+    """The index of the highest score, ties go to the lowest node id as rows are not always in creation order."""
+    best = np.flatnonzero(scores == scores.max())
+    return int(best[np.argmin(node_ids[best])])
@@ -12,6 +12,7 @@ from moatless.benchmark.utils import get_moatless_instance
 from moatless.search_tree import SearchTree
 from moatless.streamlit.shared import trajectory_table
 from moatless.streamlit.tree_visualization import update_visualization
+from moatless.utils.trajectory_file import TrajectoryReader, is_binary_trajectory
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -98,12 +99,17 @@ def main():
                 if not "search_tree" in st.session_state or st.session_state.search_tree.persist_path != file_path:
                     with st.spinner("Loading search tree from trajectory file"):
                         # Need to load twice to get the instance id...
-                        with open(file_path, "r") as f:
-                            search_tree = json.load(f)
-                            if "metadata" in search_tree and "instance_id" in search_tree["metadata"]:
-                                instance_id = search_tree["metadata"]["instance_id"]
-                            else:
-                                instance_id = None
+                        if is_binary_trajectory(file_path):
+                            with TrajectoryReader(file_path) as reader:
+                                search_tree = reader.metadata
+                        else:
+                            with open(file_path, "r") as f:
+                                search_tree = json.load(f)
+
+                        if "metadata" in search_tree and "instance_id" in search_tree["metadata"]:
+                            instance_id = search_tree["metadata"]["instance_id"]
+                        else:
+                            instance_id = None
 
                         if instance_id:
                             instance = get_moatless_instance(instance_id)
@@ -125,6 +131,7 @@ def main():
 
                         st.session_state.search_tree = SearchTree.from_file(
                             file_path,
+                            lazy=True,
                             # repository=repository,
                             # runtime=runtime,
                             # code_index=code_index,
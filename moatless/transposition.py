@@ -0,0 +1,91 @@
+"""
+Transposition table of the states reached in a search tree.
+
+Different action sequences can reach the same state, like viewing the same code in another order or making the same
+change with different edits. Without a transposition table each of them is evaluated by the value function and
+expanded on its own. Nodes are registered by a hash of their file context and last observation, see
+`Node.state_hash`, when their simulation is done. A node that reaches the state of a registered node shares its
+reward instead of being evaluated, and is marked as a duplicate so it's not expanded, as its subtree would repeat the
+subtree of the equivalent node.
+
+Only the evaluation and the expansion of the duplicate are saved. The state of a node is known after its action is
+generated and executed, so the completion that generates the action and the action itself, including any test runs,
+still run for every node that reaches an equivalent state.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from moatless.node import Node
+
+logger = logging.getLogger(__name__)
+
+
+class TranspositionTable:
+    def __init__(self):
+        # The first node that reached each state, with the order it was registered in
+        self._states: Dict[str, Tuple[int, "Node"]] = {}
+        self._registered: set[int] = set()
+        self.hits = 0
+        self.shared_rewards = 0
+
+    @classmethod
+    def from_tree(cls, root: "Node") -> "TranspositionTable":
+        """Create a table with the executed nodes in the tree, in depth first order."""
+        table = cls()
+        for node in root.get_all_nodes():
+            table.add(node)
+        return table
+
+    @property
+    def version(self) -> int:
+        """The number of registered states, used to only match states registered before a point in time."""
+        return len(self._states)
+
+    def add(self, node: "Node"):
+        """Register the state of an executed node, unless it's a duplicate or the state is already registered."""
+        if node.node_id in self._registered or not node.observation or node.is_duplicate:
+            return
+
+        state_hash = node.state_hash()
+        if state_hash is None:
+            return
+
+        self._registered.add(node.node_id)
+        if state_hash not in self._states:
+            self._states[state_hash] = (len(self._states), node)
+
+    def lookup(self, node: "Node", before_version: Optional[int] = None) -> Optional["Node"]:
+        """
+        Find another node that reached the same state as the node. Only states registered before the given version
+        are matched if set.
+        """
+        state_hash = node.state_hash()
+        entry = self._states.get(state_hash) if state_hash else None
+        if entry is None or entry[1] is node:
+            return None
+
+        order, equivalent_node = entry
+        if before_version is not None and order >= before_version:
+            return None
+
+        return equivalent_node
+
+    def transpose(self, node: "Node", before_version: Optional[int] = None) -> Optional["Node"]:
+        """
+        If another node reached the same state, mark the node as a duplicate of it and share its reward. Returns the
+        equivalent node.
+        """
+        equivalent_node = self.lookup(node, before_version)
+        if equivalent_node is None:
+            return None
+
+        self.hits += 1
+        node.is_duplicate = True
+        if equivalent_node.reward:
+            node.reward = equivalent_node.reward.model_copy()
+            self.shared_rewards += 1
+
+        logger.info(f"Node{node.node_id}: Reached the same state as Node{equivalent_node.node_id}")
+        return equivalent_node
@@ -0,0 +1,154 @@
+"""
+Append-only journal of changes to a persisted search tree.
+
+Rewriting the full tree after every iteration gets slow when the tree grows, as every node with its file context and
+completions is serialized again. Instead the persisted tree is written as a snapshot once, and after each iteration
+the new and changed nodes are appended to a journal next to it as one compact JSON record per line. The journal is
+compacted into a new snapshot when it has grown as large as the snapshot, so the cost of persisting stays
+proportional to the number of changed nodes.
+
+A tree is recovered by replaying the journal on the snapshot. The journal starts with the id of the snapshot it
+applies to, so a journal left from an earlier snapshot is ignored. This happens if the process stops between writing
+a new snapshot and truncating the journal.
+
+Record types:
+    {"type": "snapshot", "snapshot_id": "..."}                      The snapshot the journal applies to
+    {"type": "node", "node_id": 3, "parent_id": 1, "data": {...}}  A new node, or a node that replaces the stored one
+    {"type": "update", "node_id": 1, "data": {"visits": 2}}       Fields to update on a stored node
+    {"type": "tree", "data": {"unique_id": 3}}                     Fields to update on the search tree
+"""
+
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".journal"
+SNAPSHOT_ID_KEY = "journal_snapshot_id"
+
+
+def get_journal_path(persist_path: str) -> str:
+    return persist_path + JOURNAL_SUFFIX
+
+
+class TreeJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def append(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        with open(self.path, "a") as f:
+            f.write(lines)
+            f.flush()
+        self.size += len(lines)
+
+    def reset(self, snapshot_id: str):
+        """Start a new journal on the snapshot with the given id."""
+        with open(self.path, "w"):
+            pass
+        self.size = 0
+        self.append([{"type": "snapshot", "snapshot_id": snapshot_id}])
+
+
+def new_snapshot_id() -> str:
+    return uuid.uuid4().hex
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+
+    records = []
+    with open(path, "r") as f:
+        lines = f.readlines()
+
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            # The last record may be incomplete if the process was stopped while writing it
+            if i == len(lines) - 1:
+                logger.warning(f"Ignoring incomplete last record in journal {path}")
+            else:
+                raise
+    return records
+
+
+def write_snapshot(path: str, data: Dict[str, Any], **kwargs):
+    """Write the data to a temporary file and move it in place, so an interrupted write keeps the old snapshot."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(temp_path, path)
+
+
+def replay_journal(tree_data: Dict[str, Any], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply the journal records to a persisted search tree, with the nodes returned in list format."""
+    if records and records[0].get("type") == "snapshot":
+        if records[0]["snapshot_id"] != tree_data.get(SNAPSHOT_ID_KEY):
+            logger.warning("Ignoring journal started from another snapshot")
+            return tree_data
+
+    tree_data = tree_data.copy()
+    for record in records:
+        if record.get("type") == "tree":
+            tree_data.update(record["data"])
+
+    if "root" in tree_data:
+        tree_data["root"] = replay_node_journal(tree_data["root"], records)
+    return tree_data
+
+
+def replay_node_journal(
+    data: Union[Dict[str, Any], List[Dict[str, Any]]], records: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Apply the journal records to a persisted node tree in tree or list format, and return it in list format."""
+    nodes: Dict[int, Dict[str, Any]] = {}
+    for node_data in _iter_nodes(data):
+        nodes[node_data["node_id"]] = node_data
+
+    for record in records:
+        record_type = record.get("type")
+        if record_type == "node":
+            node_data = dict(record["data"])
+            node_data["node_id"] = record["node_id"]
+            node_data["parent_id"] = record.get("parent_id")
+            nodes[record["node_id"]] = node_data
+        elif record_type == "update":
+            node_data = nodes.get(record["node_id"])
+            if node_data is None:
+                logger.warning(f"Journal update for unknown node {record['node_id']}")
+                continue
+            node_data.update(record["data"])
+
+    return list(nodes.values())
+
+
+def flatten_nodes(data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Return a persisted node tree in tree or list format as a list of nodes with parent ids, in depth first order."""
+    return list(_iter_nodes(data))
+
+
+def _iter_nodes(data: Union[Dict[str, Any], List[Dict[str, Any]]], parent_id: Optional[int] = None):
+    if isinstance(data, list):
+        for node_data in data:
+            yield dict(node_data)
+        return
+
+    stack = [(data, parent_id)]
+    while stack:
+        node_data, parent_id = stack.pop()
+        children = node_data.get("children", [])
+        node_data = {key: value for key, value in node_data.items() if key != "children"}
+        node_data["parent_id"] = parent_id
+        yield node_data
+        stack.extend((child, node_data["node_id"]) for child in reversed(children))
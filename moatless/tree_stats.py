@@ -0,0 +1,383 @@
+"""
+Statistics of a search tree maintained incrementally as nodes are added, executed and rewarded.
+
+The search loop checks the node count, finished nodes, total usage and best reward several times per iteration.
+Computing them by traversing the tree makes every iteration linear in the size of the tree, so they are kept in a
+`TreeStats` registry that is shared by all nodes in the tree. Nodes are registered by `Node.add_child` and refreshed
+by the search tree after they are expanded, executed and rewarded.
+
+The visits, values and other statistics selectors score nodes by are also kept in NumPy arrays in `NodeArrays`, with
+one row per node, so selectors can score all expandable nodes with vectorized operations.
+
+In a parallel search, nodes that are being simulated are marked as in flight. They and their parents are not
+selectable, so siblings are not simulated concurrently and each node is simulated after its earlier siblings, as in a
+serial search. Each node on the path of a node in flight to the root counts a virtual loss until the simulation is
+done, so concurrent selections diverge.
+"""
+
+import bisect
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from moatless.completion.model import Usage
+
+if TYPE_CHECKING:
+    from moatless.node import Node
+
+logger = logging.getLogger(__name__)
+
+USAGE_FIELDS = ("completion_cost", "completion_tokens", "prompt_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+class TreeStats:
+    def __init__(self, root: "Node"):
+        self.root = root
+        self._nodes: Dict[int, "Node"] = {}
+        self._usage: Dict[int, Tuple[float, ...]] = {}
+        self._usage_totals: List[float] = [0] * len(USAGE_FIELDS)
+        self._rewards: Dict[int, float] = {}
+        self._max_reward: Optional[float] = None
+        self._finished: Set[int] = set()
+        # The first finished node by parent with its path, and the paths sorted in depth first order
+        self._finished_by_parent: Dict[Optional[int], Tuple[Tuple[int, ...], "Node"]] = {}
+        self._finished_paths: List[Tuple[int, ...]] = []
+        self._finished_nodes: Optional[List["Node"]] = None
+        self._max_finished_reward: Optional[float] = None
+        self._max_finished_reward_valid = False
+        self._expandable: Set[int] = set()
+        self._leaves: Set[int] = set()
+        self._arrays = NodeArrays()
+        self._in_flight: Set[int] = set()
+        self._stale = False
+        self._build()
+
+    def _build(self):
+        self._nodes.clear()
+        self._usage.clear()
+        self._usage_totals = [0] * len(USAGE_FIELDS)
+        self._rewards.clear()
+        self._max_reward = None
+        self._finished.clear()
+        self._finished_by_parent.clear()
+        self._finished_paths.clear()
+        self._finished_nodes = None
+        self._max_finished_reward_valid = False
+        self._expandable.clear()
+        self._leaves.clear()
+        self._arrays = NodeArrays()
+        self._stale = False
+        self._register(self.root)
+        for node_id in self._in_flight:
+            self._arrays.add_virtual_loss(node_id, 1)
+
+    def _register(self, node: "Node"):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node._tree_stats = self
+            self._nodes[node.node_id] = node
+            self._update(node)
+            # Reversed so siblings are registered in the order they were added, as when registered one by one
+            stack.extend(reversed(node.children))
+
+    def add(self, node: "Node"):
+        """Register a node added to the tree, with its descendants."""
+        if self._stale:
+            return
+
+        self._register(node)
+        if node.parent is not None:
+            self._update(node.parent)
+
+    def refresh(self, node: "Node"):
+        """Update the statistics of a node after it was changed."""
+        if self._stale:
+            return
+
+        if node.node_id not in self._nodes:
+            self._register(node)
+        else:
+            self._update(node)
+
+    def refresh_visits(self, node: "Node"):
+        """Update the visits and value of a node, called for each node on backpropagation."""
+        if self._stale or node.node_id not in self._nodes:
+            return
+
+        self._arrays.update_visits(node)
+
+    def start_simulation(self, node: "Node"):
+        """Mark a node as in flight and add a virtual loss to its path."""
+        self._in_flight.add(node.node_id)
+        if not self._stale:
+            self._arrays.add_virtual_loss(node.node_id, 1)
+
+    def finish_simulation(self, node: "Node"):
+        """Remove the virtual loss of a node added by `start_simulation` and refresh it."""
+        self._in_flight.discard(node.node_id)
+        if not self._stale:
+            self._arrays.add_virtual_loss(node.node_id, -1)
+        self.refresh(node)
+
+    def is_in_flight(self, node_id: int) -> bool:
+        return node_id in self._in_flight
+
+    def is_selectable(self, node: "Node") -> bool:
+        """Check that neither the node nor any of its children are in flight."""
+        if not self._in_flight:
+            return True
+        return node.node_id not in self._in_flight and not any(
+            child.node_id in self._in_flight for child in node.children
+        )
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
+
+    def invalidate(self):
+        """Rebuild the statistics on next access, used when nodes are removed or moved."""
+        self._stale = True
+
+    def _ensure_built(self):
+        if self._stale:
+            logger.debug("Rebuilding stale tree stats")
+            self._build()
+
+    def _update(self, node: "Node"):
+        node_id = node.node_id
+
+        usage = node.usage()
+        new_usage = tuple(getattr(usage, field) for field in USAGE_FIELDS)
+        old_usage = self._usage.get(node_id)
+        if old_usage != new_usage:
+            for i, value in enumerate(new_usage):
+                self._usage_totals[i] += value - (old_usage[i] if old_usage else 0)
+            self._usage[node_id] = new_usage
+
+        reward = node.reward.value if node.reward else 0
+        old_reward = self._rewards.get(node_id)
+        self._rewards[node_id] = reward
+        if self._max_reward is not None:
+            if reward >= self._max_reward:
+                self._max_reward = reward
+            elif old_reward == self._max_reward:
+                self._max_reward = None
+
+        if node.is_finished():
+            if node_id not in self._finished:
+                self._finished.add(node_id)
+                self._add_finished(node)
+            else:
+                self._max_finished_reward_valid = False
+        elif node_id in self._finished:
+            self._finished.discard(node_id)
+            self._rebuild_finished()
+
+        is_expandable = node.is_expandable()
+        _update_membership(self._expandable, node_id, is_expandable)
+        _update_membership(self._leaves, node_id, node.is_leaf())
+        self._arrays.update(node, is_expandable)
+
+    def _add_finished(self, node: "Node"):
+        path = _get_path(node)
+        parent_id = node.parent.node_id if node.parent else None
+        existing = self._finished_by_parent.get(parent_id)
+        if existing and existing[0] < path:
+            return
+
+        if existing:
+            self._finished_paths.remove(existing[0])
+        self._finished_by_parent[parent_id] = (path, node)
+        bisect.insort(self._finished_paths, path)
+        self._finished_nodes = None
+        self._max_finished_reward_valid = False
+
+    def _rebuild_finished(self):
+        self._finished_by_parent.clear()
+        self._finished_paths.clear()
+        self._finished_nodes = None
+        self._max_finished_reward_valid = False
+        for node_id in self._finished:
+            self._add_finished(self._nodes[node_id])
+
+    @property
+    def node_count(self) -> int:
+        self._ensure_built()
+        return len(self._nodes)
+
+    def get_node(self, node_id: int) -> Optional["Node"]:
+        self._ensure_built()
+        return self._nodes.get(node_id)
+
+    def total_usage(self) -> Usage:
+        self._ensure_built()
+        return Usage(**dict(zip(USAGE_FIELDS, self._usage_totals)))
+
+    def max_reward(self) -> float:
+        """The highest reward in the tree, where nodes without reward count as 0."""
+        self._ensure_built()
+        if self._max_reward is None:
+            self._max_reward = max(self._rewards.values(), default=0)
+        return self._max_reward
+
+    def finished_nodes(self) -> List["Node"]:
+        """Finished nodes by unique parent node, in the same order as a depth first traversal."""
+        self._ensure_built()
+        if self._finished_nodes is None:
+            nodes_by_path = {path: node for path, node in self._finished_by_parent.values()}
+            self._finished_nodes = [nodes_by_path[path] for path in self._finished_paths]
+
+        return list(self._finished_nodes)
+
+    @property
+    def finished_count(self) -> int:
+        """The number of unique parents of finished nodes."""
+        self._ensure_built()
+        return len(self._finished_by_parent)
+
+    def max_finished_reward(self) -> Optional[float]:
+        """The highest reward of the finished nodes returned by `finished_nodes`, None if none has a reward."""
+        self._ensure_built()
+        if not self._max_finished_reward_valid:
+            rewards = [node.reward.value for _, node in self._finished_by_parent.values() if node.reward]
+            self._max_finished_reward = max(rewards, default=None)
+            self._max_finished_reward_valid = True
+        return self._max_finished_reward
+
+    def has_expandable_nodes(self) -> bool:
+        self._ensure_built()
+        return bool(self._expandable)
+
+    @property
+    def leaf_count(self) -> int:
+        self._ensure_built()
+        return len(self._leaves)
+
+    @property
+    def arrays(self) -> "NodeArrays":
+        self._ensure_built()
+        return self._arrays
+
+
+class NodeArrays:
+    """
+    Node statistics in NumPy arrays with one row per node, in the order the nodes were registered. The arrays are
+    allocated with spare capacity and only the first `size` rows are used.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.size = 0
+        self.node_ids = np.zeros(capacity, dtype=np.int64)
+        self.parent_rows = np.zeros(capacity, dtype=np.int64)
+        self.depths = np.zeros(capacity, dtype=np.int64)
+        self.visits = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        # Prior probability of selecting the node from its parent, uniform over the expansions of the parent
+        self.priors = np.zeros(capacity, dtype=np.float64)
+        # Number of simulations in flight through the node
+        self.virtual_losses = np.zeros(capacity, dtype=np.int64)
+        self.in_flight = np.zeros(capacity, dtype=bool)
+        self.in_flight_children = np.zeros(capacity, dtype=np.int64)
+        self.expandable = np.zeros(capacity, dtype=bool)
+        self.duplicate = np.zeros(capacity, dtype=bool)
+        self._rows: Dict[int, int] = {}
+
+    def row(self, node_id: int) -> Optional[int]:
+        return self._rows.get(node_id)
+
+    def selectable_rows(self) -> np.ndarray:
+        """Rows of expandable nodes where neither the node nor any of its children are in flight."""
+        size = self.size
+        return np.flatnonzero(
+            self.expandable[:size] & ~self.in_flight[:size] & (self.in_flight_children[:size] == 0)
+        )
+
+    def update(self, node: "Node", is_expandable: bool):
+        row = self._rows.get(node.node_id)
+        if row is None:
+            row = self._add(node)
+
+        self.expandable[row] = is_expandable
+        self.duplicate[row] = bool(node.is_duplicate)
+        self.update_visits(node, row)
+
+    def update_visits(self, node: "Node", row: Optional[int] = None):
+        if row is None:
+            row = self._rows[node.node_id]
+        self.visits[row] = node.visits or 0
+        self.values[row] = node.value or 0
+
+    def add_virtual_loss(self, node_id: int, count: int):
+        """Add virtual losses to the node and its ancestors, and mark the node as in flight if the count is positive."""
+        row = self._rows.get(node_id)
+        if row is None:
+            return
+
+        self.in_flight[row] = count > 0
+        if self.parent_rows[row] != row:
+            self.in_flight_children[self.parent_rows[row]] += count
+
+        while True:
+            self.virtual_losses[row] += count
+            parent_row = self.parent_rows[row]
+            if parent_row == row:
+                break
+            row = parent_row
+
+    def _add(self, node: "Node") -> int:
+        if self.size == len(self.node_ids):
+            self._grow()
+
+        row = self.size
+        self.size += 1
+        self._rows[node.node_id] = row
+        self.node_ids[row] = node.node_id
+
+        parent_row = self._rows.get(node.parent.node_id) if node.parent is not None else None
+        if parent_row is None:
+            self.parent_rows[row] = row
+            self.depths[row] = 0
+            self.priors[row] = 1.0
+        else:
+            self.parent_rows[row] = parent_row
+            self.depths[row] = self.depths[parent_row] + 1
+            self.priors[row] = 1.0 / max(node.parent.max_expansions or 1, 1)
+        return row
+
+    def _grow(self):
+        capacity = len(self.node_ids) * 2
+        for name in (
+            "node_ids",
+            "parent_rows",
+            "depths",
+            "visits",
+            "values",
+            "priors",
+            "virtual_losses",
+            "in_flight",
+            "in_flight_children",
+            "expandable",
+            "duplicate",
+        ):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+
+def _update_membership(members: Set[int], node_id: int, is_member: bool):
+    if is_member:
+        members.add(node_id)
+    else:
+        members.discard(node_id)
+
+
+def _get_path(node: "Node") -> Tuple[int, ...]:
+    """The child indexes from the root to the node, sorting paths gives depth first order."""
+    path = []
+    while node.parent is not None:
+        path.append(next(i for i, child in enumerate(node.parent.children) if child is node))
+        node = node.parent
+    return tuple(reversed(path))
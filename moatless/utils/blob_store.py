@@ -0,0 +1,71 @@
+"""
+Process local store of interned file contents keyed by content hash.
+
+File contexts in a search tree hold the same file contents many times. Contents are put in the store and referenced
+as `Blob`s, so equal contents share one string and can be compared by hash. The store only keeps weak references,
+a blob is dropped when no file context references it anymore.
+"""
+
+import hashlib
+import threading
+import weakref
+from typing import Optional
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class Blob:
+    """Immutable content with its hash."""
+
+    __slots__ = ("hash", "content", "__weakref__")
+
+    def __init__(self, hash: str, content: str):
+        self.hash = hash
+        self.content = content
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Blob) and self.hash == other.hash
+
+    def __hash__(self) -> int:
+        return hash(self.hash)
+
+    def __len__(self) -> int:
+        return len(self.content)
+
+    def __repr__(self) -> str:
+        return f"Blob(hash={self.hash[:12]}, length={len(self.content)})"
+
+
+class BlobStore:
+    def __init__(self):
+        self._blobs: weakref.WeakValueDictionary[str, Blob] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def put(self, content: str) -> Blob:
+        """Return the interned blob for the content."""
+        blob_hash = content_hash(content)
+        with self._lock:
+            blob = self._blobs.get(blob_hash)
+            if blob is None:
+                blob = Blob(blob_hash, content)
+                self._blobs[blob_hash] = blob
+            return blob
+
+    def get(self, blob_hash: str) -> Optional[Blob]:
+        return self._blobs.get(blob_hash)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def stats(self) -> dict:
+        blobs = list(self._blobs.values())
+        return {"blobs": len(blobs), "characters": sum(len(blob) for blob in blobs)}
+
+
+_blob_store = BlobStore()
+
+
+def get_blob_store() -> BlobStore:
+    return _blob_store
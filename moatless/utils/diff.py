@@ -0,0 +1,259 @@
+"""
+Line diffs with the Myers O(ND) algorithm in linear space.
+
+Changes are represented as `(i1, i2, j1, j2)` tuples, meaning that the lines `a[i1:i2]` are replaced by `b[j1:j2]`.
+Common prefixes and suffixes are trimmed before diffing, so the cost of a diff grows with the size of the changed
+region and the number of differences rather than with the size of the files. When the changed region is already known,
+as for a replaced range of lines, `replace_changes` diffs only that region.
+"""
+
+from typing import Iterator, Optional, Sequence
+
+Change = tuple[int, int, int, int]
+
+
+def diff_changes(
+    a: Sequence[str],
+    b: Sequence[str],
+    a_lo: int = 0,
+    a_hi: Optional[int] = None,
+    b_lo: int = 0,
+    b_hi: Optional[int] = None,
+) -> list[Change]:
+    """Returns the changes between `a[a_lo:a_hi]` and `b[b_lo:b_hi]` with indexes in the full sequences."""
+    a_hi = len(a) if a_hi is None else a_hi
+    b_hi = len(b) if b_hi is None else b_hi
+
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+
+    if a_lo == a_hi and b_lo == b_hi:
+        return []
+    if a_lo == a_hi or b_lo == b_hi:
+        return [(a_lo, a_hi, b_lo, b_hi)]
+
+    # Compare lines as integers in the region that is diffed
+    line_ids: dict[str, int] = {}
+    a_ids = [line_ids.setdefault(line, len(line_ids)) for line in a[a_lo:a_hi]]
+    b_ids = [line_ids.setdefault(line, len(line_ids)) for line in b[b_lo:b_hi]]
+
+    matches = _myers_matches(a_ids, b_ids)
+    return _matches_to_changes(matches, a_lo, a_hi, b_lo, b_hi)
+
+
+def replace_changes(
+    a: Sequence[str], b: Sequence[str], changes: list[Change], start: int, end: int, new_end: int
+) -> list[Change]:
+    """
+    Updates the changes between `a` and a sequence where the lines from `start` to `end` were replaced to get `b`,
+    with the replacement in `b[start:new_end]`. Only the replaced lines and the changes they overlap are diffed.
+    """
+    delta = new_end - end
+    before = [change for change in changes if change[3] < start]
+    after = [change for change in changes if change[2] > end]
+    overlapping = changes[len(before) : len(changes) - len(after)]
+
+    window_start = min([start] + [change[2] for change in overlapping])
+    window_end = max([end] + [change[3] for change in overlapping])
+
+    a_start = window_start - sum((j2 - j1) - (i2 - i1) for i1, i2, j1, j2 in before)
+    a_end = window_end - sum((j2 - j1) - (i2 - i1) for i1, i2, j1, j2 in before + overlapping)
+
+    middle = diff_changes(a, b, a_start, a_end, window_start, window_end + delta)
+    return before + middle + [(i1, i2, j1 + delta, j2 + delta) for i1, i2, j1, j2 in after]
+
+
+def changes_from_hunks(hunks) -> list[Change]:
+    """Returns the changes of parsed unified diff hunks."""
+    changes = []
+    for hunk in hunks:
+        # Hunks without source or target lines are numbered from the line before
+        i = hunk.source_start - 1 if hunk.source_length else hunk.source_start
+        j = hunk.target_start - 1 if hunk.target_length else hunk.target_start
+        change_i, change_j = i, j
+        for line in hunk.lines:
+            if line.is_context:
+                if (change_i, change_j) != (i, j):
+                    changes.append((change_i, i, change_j, j))
+                i += 1
+                j += 1
+                change_i, change_j = i, j
+            elif line.is_removed:
+                i += 1
+            elif line.is_added:
+                j += 1
+        if (change_i, change_j) != (i, j):
+            changes.append((change_i, i, change_j, j))
+    return changes
+
+
+def unified_diff(
+    a: Sequence[str],
+    b: Sequence[str],
+    fromfile: str = "",
+    tofile: str = "",
+    n: int = 3,
+    lineterm: str = "\n",
+    changes: Optional[list[Change]] = None,
+) -> Iterator[str]:
+    """Generates a unified diff in the same format as `difflib.unified_diff`, from precomputed changes if given."""
+    if changes is None:
+        changes = diff_changes(a, b)
+
+    started = False
+    for group in _grouped_opcodes(_changes_to_opcodes(changes, len(a), len(b)), n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}{lineterm}"
+            yield f"+++ {tofile}{lineterm}"
+
+        first, last = group[0], group[-1]
+        yield f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@{lineterm}"
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in {"replace", "delete"}:
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in {"replace", "insert"}:
+                for line in b[j1:j2]:
+                    yield "+" + line
+
+
+def _myers_matches(a: list[int], b: list[int]) -> list[tuple[int, int]]:
+    """Returns the matching positions of a longest common subsequence, by recursively finding middle snakes."""
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        x0, y0, x1, y1 = _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+        matches.extend((a_lo + x, b_lo + y0 + x - x0) for x in range(x0, x1))
+        stack.append((a_lo, a_lo + x0, b_lo, b_lo + y0))
+        stack.append((a_lo + x1, a_hi, b_lo + y1, b_hi))
+
+    matches.sort()
+    return matches
+
+
+def _middle_snake(a: list[int], a_lo: int, a_hi: int, b: list[int], b_lo: int, b_hi: int) -> tuple[int, int, int, int]:
+    """Finds the middle snake of a shortest edit script, searching forward from the start and backward from the end."""
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 == 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + backward[offset + delta - k] >= n:
+                return x_start, y_start, x, y
+
+        # The backward search runs on the reversed sequences
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return n - x, m - y, n - x_start, m - y_start
+
+    raise RuntimeError("No middle snake found")
+
+
+def _matches_to_changes(matches: list[tuple[int, int]], a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> list[Change]:
+    changes = []
+    i, j = a_lo, b_lo
+    for match_i, match_j in matches:
+        match_i += a_lo
+        match_j += b_lo
+        if match_i > i or match_j > j:
+            changes.append((i, match_i, j, match_j))
+        i, j = match_i + 1, match_j + 1
+    if i < a_hi or j < b_hi:
+        changes.append((i, a_hi, j, b_hi))
+    return changes
+
+
+def _changes_to_opcodes(changes: list[Change], len_a: int, len_b: int) -> list[tuple[str, int, int, int, int]]:
+    opcodes = []
+    i = j = 0
+    for i1, i2, j1, j2 in changes:
+        if i1 > i:
+            opcodes.append(("equal", i, i1, j, j1))
+        tag = "replace" if i2 > i1 and j2 > j1 else "delete" if i2 > i1 else "insert"
+        opcodes.append((tag, i1, i2, j1, j2))
+        i, j = i2, j2
+    if i < len_a:
+        opcodes.append(("equal", i, len_a, j, len_b))
+    return opcodes
+
+
+def _grouped_opcodes(opcodes: list[tuple[str, int, int, int, int]], n: int):
+    """Groups opcodes in hunks with up to n lines of context, like `difflib.SequenceMatcher.get_grouped_opcodes`."""
+    codes = list(opcodes) or [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > n * 2:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
@@ -0,0 +1,22 @@
+from typing import Any, Callable, Optional
+
+
+class LazyMessage:
+    """
+    A log message that is created when it's formatted. Pass it as an argument to a logger, like
+    `logger.info("%s", LazyMessage(generate_ascii_tree, root))`, and it's only created if a handler emits the record.
+    """
+
+    __slots__ = ("_function", "_args", "_kwargs", "_message")
+
+    def __init__(self, function: Callable[..., str], *args: Any, **kwargs: Any):
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._message: Optional[str] = None
+
+    def __str__(self) -> str:
+        # Formatted once, also if several handlers emit the record
+        if self._message is None:
+            self._message = str(self._function(*self._args, **self._kwargs))
+        return self._message
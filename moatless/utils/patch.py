@@ -0,0 +1,72 @@
+"""
+Unified diff patches parsed to immutable hunks.
+
+The same patch is stored in many file contexts of a search tree, parsed patches are cached so each patch is only
+parsed once per process.
+"""
+
+import io
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from unidiff import PatchSet
+from unidiff.constants import LINE_TYPE_ADDED, LINE_TYPE_CONTEXT, LINE_TYPE_REMOVED
+
+
+class PatchLine(NamedTuple):
+    line_type: str
+    value: str
+    source_line_no: Optional[int] = None
+    target_line_no: Optional[int] = None
+
+    @property
+    def is_added(self) -> bool:
+        return self.line_type == LINE_TYPE_ADDED
+
+    @property
+    def is_removed(self) -> bool:
+        return self.line_type == LINE_TYPE_REMOVED
+
+    @property
+    def is_context(self) -> bool:
+        return self.line_type == LINE_TYPE_CONTEXT
+
+
+class Hunk(NamedTuple):
+    source_start: int
+    source_length: int
+    target_start: int
+    target_length: int
+    lines: tuple[PatchLine, ...]
+
+    def __str__(self) -> str:
+        header = f"@@ -{self.source_start},{self.source_length} +{self.target_start},{self.target_length} @@\n"
+        return header + "".join(line.line_type + line.value for line in self.lines)
+
+
+class PatchedFile(NamedTuple):
+    path: str
+    hunks: tuple[Hunk, ...]
+
+
+@lru_cache(maxsize=1024)
+def parse_patch(patch: str) -> tuple[PatchedFile, ...]:
+    """Parses a unified diff to the patched files with their hunks."""
+    patched_files = []
+    for patched_file in PatchSet(io.StringIO(patch)):
+        hunks = tuple(
+            Hunk(
+                source_start=hunk.source_start,
+                source_length=hunk.source_length,
+                target_start=hunk.target_start,
+                target_length=hunk.target_length,
+                lines=tuple(
+                    PatchLine(line.line_type, line.value, line.source_line_no, line.target_line_no)
+                    for line in hunk
+                    if line.line_type in (LINE_TYPE_ADDED, LINE_TYPE_REMOVED, LINE_TYPE_CONTEXT)
+                ),
+            )
+            for hunk in patched_file
+        )
+        patched_files.append(PatchedFile(patched_file.path, hunks))
+    return tuple(patched_files)
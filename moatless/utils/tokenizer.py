@@ -8,6 +8,10 @@ _voyageai = None
 def count_tokens(content: str, model: str = "gpt-3.5-turbo") -> int:
     global _enc, _voyageai
 
+    if model.startswith("local"):
+        # Local embedding models have no tokenizer of their own
+        model = "gpt-3.5-turbo"
+
     if model.startswith("voyage"):
         if _voyageai is None:
             voyageai_import_err = "`voyageai` package not found, please run `pip install voyageai`"
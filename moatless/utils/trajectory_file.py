@@ -0,0 +1,237 @@
+"""
+Compressed binary trajectory files with a node index.
+
+Trajectories are stored as pretty-printed JSON by default, where every node repeats its full completion inputs and
+responses and its file context. The binary format stores each node in sections that are compressed separately with
+zstd: a header with the scalar fields, and one section for each of the large fields in `NODE_SECTIONS`. An index at
+the end of the file has the offsets of all sections together with a summary of each node, so readers can load the
+tree structure, rewards and usage without decompressing any completion, and load other fields only for the nodes that
+need them.
+
+Layout:
+    MAGIC
+    compressed sections...
+    compressed index (JSON)
+    index offset and length (two unsigned 64 bit little endian integers)
+    MAGIC
+
+Requires the `zstandard` package.
+"""
+
+import json
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+MAGIC = b"MTRAJ\x00\x01\n"
+FOOTER = struct.Struct("<QQ")
+FORMAT_VERSION = 1
+
+TRAJECTORY_SUFFIX = ".trajz"
+
+# Fields stored in their own sections, all other node fields are stored in the header section
+NODE_SECTIONS = ("action_steps", "completions", "file_context", "artifact_changes", "workspace", "output")
+
+USAGE_FIELDS = ("completion_cost", "completion_tokens", "prompt_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "`zstandard` package not found, please run `pip install moatless[trajz]` to use binary trajectory files"
+        ) from e
+    return zstandard
+
+
+def is_binary_trajectory_path(file_path: str) -> bool:
+    """Check if a trajectory should be written in the binary format, by the file suffix."""
+    return file_path.endswith(TRAJECTORY_SUFFIX)
+
+
+def is_binary_trajectory(file_path: str) -> bool:
+    """Check if an existing file is a binary trajectory."""
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_trajectory(file_path: str, nodes: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None, level: int = 3):
+    """
+    Write nodes in list format, as returned by `Node.dump_as_list`, to a binary trajectory file.
+
+    The file is written to a temporary file and moved in place, so an interrupted write keeps the previous file.
+    """
+    zstandard = _import_zstandard()
+    compressor = zstandard.ZstdCompressor(level=level)
+
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        index_nodes = []
+        for node_data in nodes:
+            sections = {}
+            header = {key: value for key, value in node_data.items() if key not in NODE_SECTIONS}
+            sections["header"] = _write_section(f, compressor, header)
+            for field in NODE_SECTIONS:
+                if node_data.get(field) is not None:
+                    sections[field] = _write_section(f, compressor, node_data[field])
+
+            index_nodes.append(
+                {
+                    "node_id": node_data["node_id"],
+                    "parent_id": node_data.get("parent_id"),
+                    "sections": sections,
+                    "summary": summarize_node(node_data),
+                }
+            )
+
+        index = {"version": FORMAT_VERSION, "metadata": metadata or {}, "nodes": index_nodes}
+        index_offset, index_length = _write_section(f, compressor, index)
+        f.write(FOOTER.pack(index_offset, index_length))
+        f.write(MAGIC)
+
+    os.replace(temp_path, file_path)
+
+
+def summarize_node(node_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a node that reports need without loading its sections."""
+    usage = dict.fromkeys(USAGE_FIELDS, 0)
+    completions = [step.get("completion") for step in node_data.get("action_steps") or []]
+    completions.extend((node_data.get("completions") or {}).values())
+    for completion in completions:
+        if completion and completion.get("usage"):
+            for field in USAGE_FIELDS:
+                usage[field] += completion["usage"].get(field) or 0
+
+    action_steps = node_data.get("action_steps") or []
+    action = action_steps[-1].get("action") if action_steps else None
+    action_name = None
+    if action and action.get("action_args_class"):
+        action_name = action["action_args_class"].rsplit(".", 1)[-1]
+
+    reward = node_data.get("reward")
+    return {
+        "reward": reward.get("value") if reward else None,
+        "visits": node_data.get("visits"),
+        "value": node_data.get("value"),
+        "terminal": node_data.get("terminal"),
+        "error": node_data.get("error"),
+        "action_args_class": action_name,
+        "usage": usage,
+    }
+
+
+class LazySection:
+    """A node section that is read from the trajectory file when loaded."""
+
+    __slots__ = ("reader", "location")
+
+    def __init__(self, reader: "TrajectoryReader", location: List[int]):
+        self.reader = reader
+        self.location = location
+
+    def load(self) -> Any:
+        return self.reader._read_section(self.location)
+
+
+def _write_section(f: BinaryIO, compressor, data: Any) -> List[int]:
+    payload = compressor.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+    offset = f.tell()
+    f.write(payload)
+    return [offset, len(payload)]
+
+
+class TrajectoryReader:
+    """
+    Reads a binary trajectory file. Only the index is read when opened, node sections are read and decompressed
+    when requested.
+    """
+
+    def __init__(self, file_path: str):
+        zstandard = _import_zstandard()
+        self.file_path = file_path
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._file = open(file_path, "rb")
+        self._file_id = _file_id(os.fstat(self._file.fileno()))
+
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{file_path} is not a binary trajectory file")
+
+            self._file.seek(-(FOOTER.size + len(MAGIC)), os.SEEK_END)
+            footer = self._file.read(FOOTER.size + len(MAGIC))
+            if footer[FOOTER.size :] != MAGIC:
+                raise ValueError(f"Binary trajectory file {file_path} is incomplete")
+
+            index_offset, index_length = FOOTER.unpack(footer[: FOOTER.size])
+            index = self._read_section([index_offset, index_length])
+        except Exception:
+            self._file.close()
+            raise
+
+        if index.get("version") != FORMAT_VERSION:
+            self._file.close()
+            raise ValueError(f"Unsupported binary trajectory version {index.get('version')} in {file_path}")
+
+        self.metadata: Dict[str, Any] = index["metadata"]
+        self._nodes: Dict[int, Dict[str, Any]] = {node["node_id"]: node for node in index["nodes"]}
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def node_ids(self) -> List[int]:
+        return list(self._nodes.keys())
+
+    def read_summaries(self) -> List[Dict[str, Any]]:
+        """The node ids, parent ids and summaries of all nodes, read from the index only."""
+        return [
+            {"node_id": node["node_id"], "parent_id": node["parent_id"], **node["summary"]}
+            for node in self._nodes.values()
+        ]
+
+    def read_node(self, node_id: int, fields: Optional[Iterable[str]] = None, lazy: bool = False) -> Dict[str, Any]:
+        """
+        Read a node in list format. Only the header and the given sections are read if fields are set, use an empty
+        list to read the header only. With lazy set the sections are returned as `LazySection` to be read later.
+        """
+        node = self._nodes[node_id]
+        node_data = self._read_section(node["sections"]["header"])
+        for field, location in node["sections"].items():
+            if field != "header" and (fields is None or field in fields):
+                node_data[field] = LazySection(self, location) if lazy else self._read_section(location)
+        return node_data
+
+    def read_nodes(self, fields: Optional[Iterable[str]] = None, lazy: bool = False) -> List[Dict[str, Any]]:
+        """Read all nodes in list format, with the given sections only if fields are set."""
+        if fields is not None:
+            fields = set(fields)
+        return [self.read_node(node_id, fields, lazy) for node_id in self._nodes]
+
+    def _read_section(self, location: List[int]) -> Any:
+        offset, length = location
+        if self._file.closed:
+            # Lazy sections may be loaded after the reader was closed, the file is opened for each of them
+            with open(self.file_path, "rb") as f:
+                if _file_id(os.fstat(f.fileno())) != self._file_id:
+                    raise ValueError(f"Binary trajectory file {self.file_path} was replaced after it was read")
+                f.seek(offset)
+                data = f.read(length)
+        else:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        return json.loads(self._decompressor.decompress(data))
+
+
+def _file_id(stat: os.stat_result) -> tuple:
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
@@ -1,4 +1,6 @@
+import hashlib
 import importlib
+import json
 import logging
 from abc import ABC, abstractmethod
 from typing import Any, Optional, Tuple
@@ -17,6 +19,32 @@ class BaseValueFunction(BaseModel, ABC):
     def get_reward(self, node: Node) -> Tuple[Reward, Optional[Completion]]:
         raise NotImplementedError("get_reward method must be implemented")
 
+    def get_cache_key(self, node: Node) -> Optional[str]:
+        """
+        A key for the evaluation of the node, to cache rewards in `CachedValueFunction`. None if rewards should not be
+        cached.
+
+        Value functions with a `completion_model` are keyed by a hash of their settings, including the completion
+        model config without the API key, the state the node reached and the arguments of its action. Override this
+        if the reward depends on more than that, like earlier steps of the trajectory, for example with
+        `reward_cache_key` and the prompt messages.
+        """
+        if not isinstance(getattr(self, "completion_model", None), BaseCompletionModel):
+            return None
+
+        state_hash = node.state_hash()
+        if state_hash is None:
+            return None
+
+        data = {
+            "value_function": self.model_dump(),
+            "state": state_hash,
+            # Thoughts are left out, as in the equality of action arguments
+            "action": [node.action.name, node.action.model_dump(exclude={"thoughts"})] if node.action else None,
+        }
+        state = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(state.encode("utf-8")).hexdigest()
+
     @classmethod
     def model_validate(cls, obj: Any):
         if isinstance(obj, dict):
@@ -33,6 +61,8 @@ class BaseValueFunction(BaseModel, ABC):
                     obj["completion_model"] = BaseCompletionModel.model_validate(obj["completion_model"])
 
                 instance = value_function_class.model_validate(obj)
+            elif cls is not BaseValueFunction:
+                return super().model_validate(obj)
             else:
                 return None
                 # raise ValueError("value_function_class is required in {obj}")
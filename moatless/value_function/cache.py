@@ -0,0 +1,167 @@
+"""
+Persistent cache of value function rewards.
+
+Value functions that ask an LLM for a reward pay a full completion for every evaluated node, also when an evaluation
+is resumed or re-run, or when the same state is reached by different paths. `CachedValueFunction` wraps a value
+function and stores its rewards by a key for the evaluation, so an evaluation of the same prompt or state with the
+same completion model returns the stored reward instead. Value functions with a completion model are keyed by their
+settings, the state of the node and its action by default, see `BaseValueFunction.get_cache_key`. Value functions can
+override it to key by the prompt instead, with `reward_cache_key` and the messages they would send.
+
+The cache is stored as one JSON record per line, appended when a reward is added, and read when the cache is opened.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import Field, PrivateAttr, field_validator
+
+from moatless.completion.base import BaseCompletionModel
+from moatless.completion.model import Completion, Usage
+from moatless.node import Node, Reward
+from moatless.value_function.base import BaseValueFunction
+
+logger = logging.getLogger(__name__)
+
+CACHED_FLAG = "cached"
+
+
+def reward_cache_key(messages: List[Any], completion_model: BaseCompletionModel) -> str:
+    """A hash of the prompt messages and the completion model config, the API key is not included."""
+    data = {
+        "messages": [message.model_dump() if hasattr(message, "model_dump") else message for message in messages],
+        "completion_model": completion_model.model_dump(),
+    }
+    state = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(state.encode("utf-8")).hexdigest()
+
+
+class RewardCache:
+    """Rewards and completions by cache key, kept in memory and appended to a file if a path is set."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(path, "r") as f:
+            lines = f.readlines()
+
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last entry may be incomplete if the process was stopped while writing it
+                if i == len(lines) - 1:
+                    logger.warning(f"Ignoring incomplete last entry in reward cache {path}")
+                    continue
+                raise
+            self._entries[entry["key"]] = entry
+
+        logger.info(f"Loaded {len(self._entries)} rewards from cache {path}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: str) -> Optional[Tuple[Reward, Optional[Completion]]]:
+        """
+        The cached reward and completion for the key, or None. The completion is flagged as cached and has an empty
+        usage, as no tokens were spent on it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        completion = None
+        if entry.get("completion"):
+            completion = Completion.model_validate(entry["completion"])
+            completion.usage = Usage()
+            if CACHED_FLAG not in completion.flags:
+                completion.flags.append(CACHED_FLAG)
+
+        return Reward.model_validate(entry["reward"]), completion
+
+    def put(self, key: str, reward: Reward, completion: Optional[Completion] = None):
+        entry = {
+            "key": key,
+            "reward": reward.model_dump(),
+            "completion": completion.model_dump() if completion else None,
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+class CachedValueFunction(BaseValueFunction):
+    """
+    Returns cached rewards for prompts that were evaluated before, and evaluates other nodes with the wrapped value
+    function. Nodes are always evaluated if the wrapped value function returns no cache key for them.
+    """
+
+    value_function: BaseValueFunction = Field(..., description="The value function to cache rewards of.")
+    cache_path: Optional[str] = Field(None, description="File to persist the cache to, kept in memory only if not set.")
+
+    _cache: Optional[RewardCache] = PrivateAttr(default=None)
+
+    @field_validator("value_function", mode="before")
+    @classmethod
+    def validate_value_function(cls, value: Any) -> Any:
+        if isinstance(value, dict):
+            return BaseValueFunction.model_validate(value)
+        return value
+
+    @property
+    def cache(self) -> RewardCache:
+        if self._cache is None:
+            self._cache = RewardCache(self.cache_path)
+        return self._cache
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache.hit_rate
+
+    def get_cache_key(self, node: Node) -> Optional[str]:
+        return self.value_function.get_cache_key(node)
+
+    def get_reward(self, node: Node) -> Tuple[Reward, Optional[Completion]]:
+        key = self.value_function.get_cache_key(node)
+        if key is None:
+            return self.value_function.get_reward(node)
+
+        cached = self.cache.get(key)
+        if cached:
+            logger.info(f"Node{node.node_id}: Using cached reward {cached[0].value}")
+            return cached
+
+        reward, completion = self.value_function.get_reward(node)
+        if reward:
+            self.cache.put(key, reward, completion)
+        return reward, completion
+
+    def model_dump(self, *args, **kwargs):
+        data = super().model_dump(*args, **kwargs)
+        data["value_function"] = self.value_function.model_dump(*args, **kwargs)
+        return data
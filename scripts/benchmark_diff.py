@@ -0,0 +1,110 @@
+"""
+Benchmark patch generation for a sequence of edits on large and repetitive files.
+
+Compares difflib, as used before, with the Myers based `ContextFile.generate_patch` on the full contents, and with
+updating the patch from the replaced lines as `StringReplace` and `InsertLine` do.
+
+    python scripts/benchmark_diff.py --lines 2000 20000 --edits 20
+"""
+
+import argparse
+import difflib
+import json
+import random
+import time
+
+from moatless.file_context import ContextFile
+from moatless.repository.repository import InMemRepository
+
+
+def generate_content(lines: int, seed: int) -> str:
+    """Generate code with many repeated lines, the worst case for difflib."""
+    rng = random.Random(seed)
+    content = []
+    while len(content) < lines:
+        content.append(f"def function_{len(content)}(self, value):")
+        for _ in range(rng.randint(3, 8)):
+            content.append(rng.choice(["    if value is None:", "        return None", "    value += 1", "    pass"]))
+        content.append("    return value")
+        content.append("")
+    return "\n".join(content[:lines]) + "\n"
+
+
+def generate_edits(content: str, edits: int, seed: int) -> list[tuple[int, int, list[str]]]:
+    rng = random.Random(seed)
+    line_count = content.count("\n")
+    result = []
+    for _ in range(edits):
+        start_line = rng.randrange(line_count)
+        end_line = min(line_count, start_line + rng.randint(0, 3))
+        new_lines = [rng.choice(["    value += 1\n", "    return None\n", f"    # edit {start_line}\n"])]
+        result.append((start_line, end_line, new_lines))
+        line_count += len(new_lines) - (end_line - start_line)
+    return result
+
+
+def difflib_patch(file_path: str, old_content: str, new_content: str) -> str:
+    return "".join(
+        difflib.unified_diff(
+            old_content.splitlines(keepends=True),
+            new_content.splitlines(keepends=True),
+            fromfile="a/" + file_path,
+            tofile="b/" + file_path,
+        )
+    )
+
+
+def benchmark(lines: int, edits: int, seed: int) -> dict:
+    content = generate_content(lines, seed)
+    repository = InMemRepository({"file.txt": content})
+    edit_list = generate_edits(content, edits, seed)
+
+    timings = {"difflib": 0.0, "myers": 0.0, "replaced_lines": 0.0}
+    context_file = ContextFile(file_path="file.txt", repo=repository)
+    for start_line, end_line, new_lines in edit_list:
+        current_lines = context_file.content.splitlines(keepends=True)
+        updated_content = "".join(current_lines[:start_line] + new_lines + current_lines[end_line:])
+
+        start = time.perf_counter()
+        difflib_patch("file.txt", content, updated_content)
+        timings["difflib"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        full_patch = context_file.generate_patch(content, updated_content)
+        timings["myers"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        patch = context_file._generate_replacement_patch(content, updated_content, start_line, end_line)
+        timings["replaced_lines"] += time.perf_counter() - start
+
+        assert patch is not None
+        context_file.set_patch(patch)
+        assert context_file.content == updated_content
+        assert context_file.apply_patch_to_content(content, full_patch) == updated_content
+
+    return {
+        "lines": lines,
+        "edits": edits,
+        **{f"{name}_ms_per_edit": round(seconds / edits * 1000, 3) for name, seconds in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark patch generation on large files")
+    parser.add_argument("--lines", type=int, nargs="+", default=[2000, 10000, 20000], help="Lines per file")
+    parser.add_argument("--edits", type=int, default=20, help="Edits per file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [benchmark(lines, args.edits, args.seed) for lines in args.lines]
+    for result in results:
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
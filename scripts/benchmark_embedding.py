@@ -0,0 +1,153 @@
+"""
+Benchmark embedding throughput of `VoyageEmbeddingWithRetry` against a local stand-in for the Voyage API.
+
+The stand-in adds latency per request and per token, rejects batches over the token limit and answers every
+n-th request with a rate limit error. Texts are generated with a long tail of large chunks.
+
+    python scripts/benchmark_embedding.py --texts 5000 --concurrency 1 4 8
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from moatless.index.retry_voyage_embedding import VoyageEmbeddingWithRetry
+
+
+class StandInVoyageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, token_limit: int, rate_limit_every: int, request_latency: float, token_latency: float):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.token_limit = token_limit
+        self.rate_limit_every = rate_limit_every
+        self.request_latency = request_latency
+        self.token_latency = token_latency
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "too_many_tokens": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+
+        # Count more tokens than tiktoken to trigger token limit errors on full batches
+        tokens = sum(int(len(text.split()) * 1.5) for text in texts)
+
+        with server.lock:
+            server.stats["requests"] += 1
+            rate_limited = server.rate_limit_every and server.stats["requests"] % server.rate_limit_every == 0
+            if rate_limited:
+                server.stats["rate_limited"] += 1
+            elif tokens > server.token_limit:
+                server.stats["too_many_tokens"] += 1
+
+        if rate_limited:
+            status, body = 429, {"detail": "Rate limit exceeded"}
+        elif tokens > server.token_limit:
+            status, body = 400, {
+                "detail": f"The max allowed tokens per submitted batch is {server.token_limit}. "
+                f"Your batch has {tokens} tokens after truncation. Please lower the number of tokens in the batch."
+            }
+        else:
+            time.sleep(server.request_latency + tokens * server.token_latency)
+            status, body = 200, {
+                "object": "list",
+                "data": [{"object": "embedding", "embedding": [0.0] * 8, "index": i} for i in range(len(texts))],
+                "model": "voyage-code-3",
+                "usage": {"total_tokens": tokens},
+            }
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def generate_texts(count: int, seed: int) -> list[str]:
+    """Generate code like texts where most are small chunks and a few are close to the hard token limit."""
+    rng = random.Random(seed)
+    words = ["def", "self", "return", "value", "if", "else", "for", "in", "import", "class", "None", "True"]
+    texts = []
+    for _ in range(count):
+        length = int(min(rng.paretovariate(1.5) * 150, 6000))
+        texts.append(" ".join(rng.choice(words) for _ in range(length)))
+    return texts
+
+
+def benchmark(server: StandInVoyageServer, texts: list[str], concurrency: int, embed_batch_size: int) -> dict:
+    embed_model = VoyageEmbeddingWithRetry(
+        model_name="voyage-code-3",
+        voyage_api_key="benchmark",
+        base_url=server.url,
+        truncation=True,
+        embed_batch_size=embed_batch_size,
+        max_concurrent_requests=concurrency,
+        retry_max_wait=0.5,
+    )
+
+    server.stats = {key: 0 for key in server.stats}
+    start = time.perf_counter()
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    elapsed = time.perf_counter() - start
+    assert len(embeddings) == len(texts)
+
+    return {
+        "concurrency": concurrency,
+        "embed_batch_size": embed_batch_size,
+        "seconds": round(elapsed, 3),
+        "embeddings_per_second": round(len(texts) / elapsed, 1),
+        **server.stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput against a local Voyage stand-in")
+    parser.add_argument("--texts", type=int, default=3000, help="Number of texts to embed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Max concurrent requests")
+    parser.add_argument("--token-limit", type=int, default=120_000, help="Max tokens per request on the server")
+    parser.add_argument("--rate-limit-every", type=int, default=20, help="Answer every n-th request with HTTP 429")
+    parser.add_argument("--request-latency", type=float, default=0.05, help="Seconds of latency per request")
+    parser.add_argument("--token-latency", type=float, default=2e-6, help="Seconds of latency per token")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    server = StandInVoyageServer(args.token_limit, args.rate_limit_every, args.request_latency, args.token_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    texts = generate_texts(args.texts, args.seed)
+
+    # Fixed batches of 60 texts sent one by one, as before token aware packing was added
+    results = [benchmark(server, texts, concurrency=1, embed_batch_size=60)]
+    for concurrency in args.concurrency:
+        results.append(benchmark(server, texts, concurrency=concurrency, embed_batch_size=1000))
+
+    for result in results:
+        print(json.dumps(result))
+
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
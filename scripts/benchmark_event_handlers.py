@@ -0,0 +1,103 @@
+"""
+Benchmark the overhead of tree events per search iteration.
+
+The events emitted when an iteration completes are measured on a synthetic tree, with no handlers, a handler that
+does nothing, and a slow handler called when the event is emitted or through an event queue. Without handlers the
+payloads are not created, creating them as before is measured as the eager baseline.
+
+    python scripts/benchmark_event_handlers.py --nodes 1000
+"""
+
+import argparse
+import json
+import logging
+import time
+
+from benchmark_selector import create_tree
+
+from moatless.actions import Finish
+from moatless.agent.agent import ActionAgent
+from moatless.completion.base import BaseCompletionModel, LLMResponseFormat
+from moatless.events import EventQueue
+from moatless.search_tree import SearchTree
+from moatless.selector.uct import UCTSelector
+
+
+def timed_iterations(search_tree: SearchTree, iterations: int) -> float:
+    """Complete iterations on the last nodes of the tree, and return the mean time in microseconds."""
+    nodes = search_tree.root.get_all_nodes()[-iterations:]
+    start = time.perf_counter()
+    for node in nodes:
+        search_tree._complete_iteration(node, 0.0)
+    return round((time.perf_counter() - start) / len(nodes) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event handler overhead per iteration")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--handler-latency", type=float, default=0.002, help="Seconds the slow handler sleeps")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("moatless.search_tree").setLevel(logging.WARNING)
+
+    def create_search_tree(*handlers, event_queue_size=None) -> SearchTree:
+        agent = ActionAgent(
+            completion=BaseCompletionModel.create(response_format=LLMResponseFormat.TOOLS, model="test-model"),
+            system_prompt="You're an AI assistant",
+            actions=[Finish()],
+        )
+        search_tree = SearchTree.create(
+            root=create_tree(args.nodes, args.seed),
+            agent=agent,
+            selector=UCTSelector(),
+            event_queue_size=event_queue_size,
+        )
+        for handler in handlers:
+            search_tree.add_event_handler(handler)
+        if event_queue_size:
+            # Started by run_search
+            search_tree._event_queue = EventQueue(search_tree.event_handlers, max_size=event_queue_size)
+        return search_tree
+
+    def slow_handler(event):
+        time.sleep(args.handler_latency)
+
+    def eager_payloads(search_tree: SearchTree) -> float:
+        nodes = search_tree.root.get_all_nodes()[-args.iterations :]
+        start = time.perf_counter()
+        for node in nodes:
+            search_tree._complete_iteration(node, 0.0)
+            search_tree._iteration_delta_data(node)
+            search_tree._iteration_data(node, 0.0)
+        return round((time.perf_counter() - start) / len(nodes) * 1e6, 1)
+
+    result = {
+        "nodes": args.nodes,
+        "no_handlers_us": timed_iterations(create_search_tree(), args.iterations),
+        "no_handlers_eager_payloads_us": eager_payloads(create_search_tree()),
+        "noop_handler_us": timed_iterations(create_search_tree(lambda event: None), args.iterations),
+        "slow_handler_us": timed_iterations(create_search_tree(slow_handler), args.iterations),
+    }
+
+    # The queue is drained when closed, so measure the time until the search loop could continue
+    search_tree = create_search_tree(slow_handler, event_queue_size=1000)
+    nodes = search_tree.root.get_all_nodes()[-args.iterations :]
+    start = time.perf_counter()
+    for node in nodes:
+        search_tree._complete_iteration(node, 0.0)
+    result["slow_handler_queued_us"] = round((time.perf_counter() - start) / len(nodes) * 1e6, 1)
+    search_tree._event_queue.close()
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark memory of the file contexts in a stored trajectory when all file contents are loaded.
+
+Without a trajectory a search tree is generated where every node views some of the same large files and a few nodes
+edit them, like in an MCTS run.
+
+    python scripts/benchmark_file_context_memory.py --nodes 200 --files 30
+    python scripts/benchmark_file_context_memory.py --trajectory trajectory.json --repo-dir /path/to/repo
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from moatless.file_context import FileContext
+from moatless.node import Node
+from moatless.repository import FileRepository
+
+
+def generate_repository(repo_dir: str, files: int, lines: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    file_paths = []
+    for i in range(files):
+        file_path = f"package/module_{i}.py"
+        content = []
+        for j in range(lines // 5):
+            content.append(f"def function_{j}(value):")
+            content.append(f"    result = value * {rng.randint(0, 1000)}")
+            content.append(f"    result += {rng.randint(0, 1000)}")
+            content.append("    return result")
+            content.append("")
+        os.makedirs(os.path.join(repo_dir, "package"), exist_ok=True)
+        with open(os.path.join(repo_dir, file_path), "w") as f:
+            f.write("\n".join(content) + "\n")
+        file_paths.append(file_path)
+    return file_paths
+
+
+def generate_trajectory(repository: FileRepository, file_paths: list[str], nodes: int, seed: int) -> dict:
+    """Generate a search tree where each node views a file or edits a function in a file in context."""
+    rng = random.Random(seed)
+    root = Node(node_id=0, file_context=FileContext(repo=repository))
+    all_nodes = [root]
+    for node_id in range(1, nodes):
+        parent = rng.choice(all_nodes)
+        node = Node(node_id=node_id, parent=parent, file_context=parent.file_context.clone())
+        parent.add_child(node)
+
+        context_files = node.file_context.files
+        if context_files and rng.random() < 0.2:
+            context_file = rng.choice(context_files)
+            function = rng.randrange(len(context_file.module.children) // 2)
+            content = context_file.content.replace(
+                f"def function_{function}(value):\n", f"def function_{function}(value):\n    value += 1\n", 1
+            )
+            context_file.apply_changes(content)
+        else:
+            file_path = rng.choice(file_paths)
+            node.file_context.add_span_to_context(file_path, f"function_{rng.randrange(10)}")
+
+        all_nodes.append(node)
+
+    return root.model_dump()
+
+
+def load_trajectory(data: dict, repository: FileRepository) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    root = Node.reconstruct(data, repo=repository)
+    nodes = root.get_all_nodes()
+    context_files = 0
+    content_characters = 0
+    for node in nodes:
+        if not node.file_context:
+            continue
+        for context_file in node.file_context.files:
+            content_characters += len(context_file.content)
+            context_files += 1
+
+    load_seconds = time.perf_counter() - start
+    gc.collect()
+    memory, peak = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    updated_files = 0
+    for node in nodes:
+        if node.parent and node.file_context and node.parent.file_context:
+            updated_files += len(node.file_context.get_updated_files(node.parent.file_context))
+    diff_seconds = time.perf_counter() - start
+    tracemalloc.stop()
+
+    return {
+        "nodes": len(nodes),
+        "context_files": context_files,
+        "content_mb": round(content_characters / 1024**2, 1),
+        "traced_memory_mb": round(memory / 1024**2, 1),
+        "peak_memory_mb": round(peak / 1024**2, 1),
+        "load_seconds": round(load_seconds, 3),
+        "updated_files": updated_files,
+        "get_updated_files_seconds": round(diff_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory of file contexts in a stored trajectory")
+    parser.add_argument("--trajectory", help="Stored search tree or node tree, generated if not set")
+    parser.add_argument("--repo-dir", help="Repository of the stored trajectory")
+    parser.add_argument("--nodes", type=int, default=200, help="Nodes in the generated trajectory")
+    parser.add_argument("--files", type=int, default=30, help="Files in the generated repository")
+    parser.add_argument("--lines", type=int, default=2000, help="Lines per file in the generated repository")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.trajectory:
+            with open(args.trajectory) as f:
+                data = json.load(f)
+            data = data.get("root", data)
+            repository = FileRepository(repo_path=args.repo_dir)
+        else:
+            file_paths = generate_repository(temp_dir, args.files, args.lines, args.seed)
+            repository = FileRepository(repo_path=temp_dir)
+            data = generate_trajectory(repository, file_paths, args.nodes, args.seed)
+            # Round trip through JSON like a stored trajectory
+            data = json.loads(json.dumps(data))
+
+        result = load_trajectory(data, repository)
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Benchmark index build and search for local repositories.
+
+Runs offline with the `local-hash` embedding model by default. Results are written as JSON and can be compared
+against a stored baseline, the script exits with status 1 if any metric regressed more than the tolerance.
+
+    python scripts/benchmark_index.py --repo /path/to/repo@<commit> --output results.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import mimetypes
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+
+from moatless.index import CodeIndex, IndexSettings
+from moatless.index.embed_model import get_embed_model
+from moatless.index.epic_split import EpicSplitter
+from moatless.index.settings import StorageFormat
+from moatless.repository import FileRepository
+from moatless.utils.file import is_test
+from moatless.utils.tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Metrics where a higher value is better, all other metrics are timings or sizes where lower is better
+HIGHER_IS_BETTER = {"files_per_second", "nodes_per_second", "tokens_per_second", "embeddings_per_second"}
+
+
+def checkout(repo: str, work_dir: str) -> str:
+    """Export `path@commit` to a temporary directory, or return the path as is if no commit is given."""
+    repo_path, _, commit = repo.partition("@")
+    if not commit:
+        return repo_path
+
+    target_dir = os.path.join(work_dir, f"{os.path.basename(repo_path.rstrip('/'))}-{commit[:12]}")
+    os.makedirs(target_dir)
+    archive = subprocess.run(["git", "-C", repo_path, "archive", commit], check=True, capture_output=True)
+    subprocess.run(["tar", "-x", "-C", target_dir], input=archive.stdout, check=True)
+    return target_dir
+
+
+def percentiles(latencies: list[float]) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+    }
+
+
+def read_documents(repo_path: str):
+    def file_metadata_func(file_path: str) -> dict:
+        file_path = os.path.relpath(file_path, repo_path)
+        return {
+            "file_path": file_path,
+            "file_name": os.path.basename(file_path),
+            "file_type": mimetypes.guess_type(file_path)[0],
+            "category": "test" if is_test(file_path) else "implementation",
+        }
+
+    reader = SimpleDirectoryReader(
+        input_dir=repo_path,
+        file_metadata=file_metadata_func,
+        filename_as_id=True,
+        required_exts=[".py"],
+        recursive=True,
+    )
+    return reader.load_data()
+
+
+def benchmark_split(repo_path: str, settings: IndexSettings) -> tuple[dict, list]:
+    docs = read_documents(repo_path)
+    splitter = EpicSplitter(
+        language=settings.language,
+        min_chunk_size=settings.min_chunk_size,
+        chunk_size=settings.chunk_size,
+        hard_token_limit=settings.hard_token_limit,
+        max_chunks=settings.max_chunks,
+        comment_strategy=settings.comment_strategy,
+        repo_path=repo_path,
+    )
+
+    start = time.perf_counter()
+    nodes = splitter.get_nodes_from_documents(docs)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": len(docs),
+        "nodes": len(nodes),
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(docs) / elapsed, 1),
+        "nodes_per_second": round(len(nodes) / elapsed, 1),
+    }, nodes
+
+
+def benchmark_token_counting(nodes: list, settings: IndexSettings) -> dict:
+    start = time.perf_counter()
+    tokens = sum(count_tokens(node.get_content(), settings.embed_model) for node in nodes)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "tokens": tokens,
+        "seconds": round(elapsed, 3),
+        "tokens_per_second": round(tokens / elapsed, 1),
+    }
+
+
+def benchmark_embedding(nodes: list, settings: IndexSettings) -> dict:
+    embed_model = get_embed_model(settings.embed_model, settings.dimensions)
+    texts = [node.get_content() for node in nodes]
+
+    start = time.perf_counter()
+    embed_model.get_text_embedding_batch(texts)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "batch_size": embed_model.embed_batch_size,
+        "seconds": round(elapsed, 3),
+        "embeddings_per_second": round(len(texts) / elapsed, 1),
+    }
+
+
+def benchmark_index(repo_path: str, settings: IndexSettings, work_dir: str, queries: int, seed: int) -> dict:
+    repository = FileRepository(repo_path=repo_path)
+
+    code_index = CodeIndex(file_repo=repository, settings=settings)
+    start = time.perf_counter()
+    code_index.run_ingestion()
+    ingestion_time = time.perf_counter() - start
+
+    persist_dir = tempfile.mkdtemp(dir=work_dir)
+    start = time.perf_counter()
+    code_index.persist(persist_dir)
+    persist_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    code_index = CodeIndex.from_persist_dir(persist_dir, file_repo=repository)
+    load_time = time.perf_counter() - start
+
+    persist_size = sum(os.path.getsize(os.path.join(persist_dir, f)) for f in os.listdir(persist_dir))
+
+    # Use the indexed class and function names as queries to get results for both search types
+    rng = random.Random(seed)
+    class_names = sorted(code_index._blocks_by_class_name)
+    function_names = sorted(code_index._blocks_by_function_name)
+    names = rng.sample(class_names, min(queries, len(class_names))) + rng.sample(
+        function_names, min(queries, len(function_names))
+    )
+
+    # Warm up the file repository cache to not measure file parsing in the first queries
+    for name in names[:5]:
+        code_index.semantic_search(name.replace("_", " "))
+    code_index.invalidate_search_cache()
+
+    semantic_latencies = []
+    for name in names:
+        start = time.perf_counter()
+        code_index.semantic_search(name.replace("_", " "))
+        semantic_latencies.append(time.perf_counter() - start)
+
+    # Repeat the same searches as sibling nodes in a search tree would, these should be served from the cache
+    cached_latencies = []
+    for name in names:
+        start = time.perf_counter()
+        code_index.semantic_search(name.replace("_", " "))
+        cached_latencies.append(time.perf_counter() - start)
+
+    find_latencies = []
+    for name in names:
+        start = time.perf_counter()
+        if name in code_index._blocks_by_class_name:
+            code_index.find_by_name(class_name=name)
+        else:
+            code_index.find_by_name(function_name=name)
+        find_latencies.append(time.perf_counter() - start)
+
+    # Neighborhood queries for the spans of the found classes and functions
+    spans = [
+        (file_path, ".".join(block_path))
+        for name in names
+        for file_path, block_path in (
+            code_index._blocks_by_class_name.get(name) or code_index._blocks_by_function_name.get(name, [])
+        )
+    ]
+    related_latencies = []
+    for file_path, span_id in spans:
+        start = time.perf_counter()
+        code_index.find_related_spans(file_path, span_id)
+        related_latencies.append(time.perf_counter() - start)
+
+    return {
+        "ingestion_seconds": round(ingestion_time, 3),
+        "persist_seconds": round(persist_time, 3),
+        "load_seconds": round(load_time, 3),
+        "persist_size_mb": round(persist_size / 1024**2, 2),
+        "semantic_search": percentiles(semantic_latencies),
+        "semantic_search_cached": percentiles(cached_latencies),
+        "find_by_name": percentiles(find_latencies),
+        "find_related_spans": percentiles(related_latencies),
+        "code_graph_edges": code_index._code_graph.edge_count,
+    }
+
+
+def run_benchmark(repo: str, settings: IndexSettings, work_dir: str, queries: int, seed: int) -> dict:
+    repo_path = checkout(repo, work_dir)
+    logger.info(f"Benchmarking {repo} at {repo_path}")
+
+    split, nodes = benchmark_split(repo_path, settings)
+    return {
+        "split": split,
+        "token_counting": benchmark_token_counting(nodes, settings),
+        "embedding": benchmark_embedding(nodes, settings),
+        "index": benchmark_index(repo_path, settings, work_dir, queries, seed),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the metrics that are more than `tolerance` worse than the baseline."""
+    current = flatten(results)
+    previous = flatten(baseline)
+
+    regressions = []
+    for metric, value in current.items():
+        baseline_value = previous.get(metric)
+        if not baseline_value or metric.endswith(("files", "nodes", "tokens", "batch_size", "edges")):
+            continue
+
+        name = metric.rsplit(".", 1)[-1]
+        if name in HIGHER_IS_BETTER:
+            change = (baseline_value - value) / baseline_value
+        else:
+            change = (value - baseline_value) / baseline_value
+
+        if change > tolerance:
+            regressions.append(f"{metric}: {baseline_value} -> {value} ({change:+.0%} worse)")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index build and search")
+    parser.add_argument("--repo", action="append", required=True, help="Repository path, optionally as path@commit")
+    parser.add_argument("--embed-model", default="local-hash", help="Embedding model to use")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Dimensions of the vectors")
+    parser.add_argument("--storage-format", choices=[f.value for f in StorageFormat], default="json")
+    parser.add_argument("--queries", type=int, default=50, help="Number of class and function names to search for")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare the results with a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression from the baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    settings = IndexSettings(
+        embed_model=args.embed_model,
+        dimensions=args.dimensions,
+        storage_format=StorageFormat(args.storage_format),
+    )
+
+    work_dir = tempfile.mkdtemp(prefix="moatless_benchmark_")
+    try:
+        results = {
+            "settings": settings.to_serializable_dict(),
+            "repositories": {
+                repo: run_benchmark(repo, settings, work_dir, args.queries, args.seed) for repo in args.repo
+            },
+        }
+    finally:
+        shutil.rmtree(work_dir)
+
+    # ru_maxrss is in kilobytes on Linux
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed more than {args.tolerance:.0%} from {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+        print(f"No regressions compared to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from moatless.index.binary_store import load_docstore, persist_docstore
+from moatless.index.simple_faiss import SimpleFaissVectorStore
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def persist_json(vector_store, docstore, persist_dir: str):
+    vector_store.storage_format = "json"
+    vector_store.persist(persist_dir)
+    docstore.persist(os.path.join(persist_dir, "docstore.json"))
+
+
+def persist_binary(vector_store, docstore, persist_dir: str, compress: bool):
+    vector_store.storage_format = "binary"
+    vector_store.compress = compress
+    vector_store.persist(persist_dir)
+    persist_docstore(docstore, persist_dir, compress=compress)
+
+
+def load_json(persist_dir: str):
+    return SimpleFaissVectorStore.from_persist_dir(persist_dir), SimpleDocumentStore.from_persist_dir(persist_dir)
+
+
+def load_binary(persist_dir: str):
+    return SimpleFaissVectorStore.from_persist_dir(persist_dir), load_docstore(persist_dir)
+
+
+def read_documents(docstore, doc_ids: list[str]):
+    for doc_id in doc_ids:
+        docstore.get_document(doc_id)
+
+
+def benchmark(persist_dir: str, reads: int, seed: int) -> list[dict]:
+    vector_store, docstore = load_json(persist_dir)
+    doc_ids = list(docstore.get_all_document_hashes().values())
+    sample_ids = random.Random(seed).sample(doc_ids, min(reads, len(doc_ids)))
+    print(f"Benchmarking {len(doc_ids)} documents from {persist_dir}")
+
+    # Decode all nodes up front to not measure lazy decoding when persisting
+    docstore._kvstore.get_all(collection=docstore._node_collection)
+
+    formats = [
+        ("json", lambda d: persist_json(vector_store, docstore, d), load_json),
+        ("binary", lambda d: persist_binary(vector_store, docstore, d, compress=False), load_binary),
+        ("binary+zlib", lambda d: persist_binary(vector_store, docstore, d, compress=True), load_binary),
+    ]
+
+    results = []
+    for name, persist, load in formats:
+        target_dir = tempfile.mkdtemp(prefix=f"index_{name}_")
+        try:
+            _, persist_time = timed(persist, target_dir)
+            (_, loaded_docstore), load_time = timed(load, target_dir)
+            _, read_time = timed(read_documents, loaded_docstore, sample_ids)
+
+            results.append(
+                {
+                    "format": name,
+                    "size_mb": round(dir_size(target_dir) / 1024**2, 2),
+                    "persist_seconds": round(persist_time, 3),
+                    "load_seconds": round(load_time, 3),
+                    f"read_{len(sample_ids)}_docs_seconds": round(read_time, 3),
+                }
+            )
+            print(json.dumps(results[-1]))
+        finally:
+            shutil.rmtree(target_dir)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark persist and load of the JSON and binary index formats")
+    parser.add_argument("--persist-dir", required=True, help="Directory with an index persisted in the JSON format")
+    parser.add_argument("--reads", type=int, default=500, help="Number of random documents to read after load")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = benchmark(args.persist_dir, args.reads, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark eager and lazy loading of trajectories for analysis, like in reports and the trajectory viewer.
+
+The nodes are loaded from JSON and the binary trajectory format, and then the rewards, usage, leaves and finished
+nodes are read from the tree, which doesn't need the action steps, completions or file contexts of the nodes. Load
+time, peak memory and the memory retained by the loaded tree are measured.
+
+    python scripts/benchmark_lazy_loading.py --nodes 200
+    python scripts/benchmark_lazy_loading.py --trajectory trajectory.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmark_trajectory_format import generate_nodes, load_json
+from moatless.node import Node
+from moatless.utils.trajectory_file import write_trajectory
+
+
+def analyze(root: Node) -> dict:
+    stats = root.get_tree_stats()
+    return {
+        "nodes": stats.node_count,
+        "max_reward": stats.max_reward(),
+        "leaves": stats.leaf_count,
+        "finished": stats.finished_count,
+        "prompt_tokens": stats.total_usage().prompt_tokens,
+    }
+
+
+def measure(file_path: str, lazy: bool, repeat: int = 3) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = analyze(Node.load_from_file(file_path, lazy=lazy))
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    tracemalloc.start()
+    root = Node.load_from_file(file_path, lazy=lazy)
+    analyze(root)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ms": round(best * 1000, 1),
+        "peak_mb": round(peak / 1024**2, 1),
+        "retained_mb": round(retained / 1024**2, 1),
+        "result": result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark eager and lazy trajectory loading")
+    parser.add_argument("--trajectory", help="Stored search tree or node list, generated if not set")
+    parser.add_argument("--nodes", type=int, default=200, help="Nodes in the generated trajectory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        nodes = load_json(args.trajectory) if args.trajectory else generate_nodes(args.nodes, args.seed)
+        json_path = os.path.join(temp_dir, "trajectory.json")
+        with open(json_path, "w") as f:
+            json.dump(nodes, f, indent=2)
+
+        binary_path = os.path.join(temp_dir, "trajectory.trajz")
+        write_trajectory(binary_path, nodes)
+
+        result = {"nodes": len(nodes)}
+        for name, file_path in [("json", json_path), ("binary", binary_path)]:
+            eager = measure(file_path, lazy=False)
+            lazy = measure(file_path, lazy=True)
+            assert eager.pop("result") == lazy.pop("result")
+            result[f"{name}_eager"] = eager
+            result[f"{name}_lazy"] = lazy
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark search throughput with parallel simulations.
+
+The agent uses a fake completion model that sleeps for a fixed latency and returns a note or finish action
+picked from a hash of the messages and the number of times the same messages were seen before, so siblings get
+different actions. Siblings are simulated in the order they were expanded in a parallel search as well, so this is
+deterministic. The value function sleeps and returns a reward picked from the node id. The
+same search is run with an increasing number of workers and the number of nodes per second is measured. The searches
+with more than one worker are run twice to check that they are deterministic.
+
+    python scripts/benchmark_parallel_search.py --iterations 60 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, ClassVar, List, Type
+
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from moatless.actions import Finish
+from moatless.actions.action import Action
+from moatless.actions.finish import FinishArgs
+from moatless.actions.schema import ActionArguments
+from moatless.agent.agent import ActionAgent
+from moatless.completion.base import BaseCompletionModel, CompletionResponse, LLMResponseFormat
+from moatless.completion.model import Completion, Usage
+from moatless.file_context import FileContext
+from moatless.node import Node, Reward
+from moatless.repository.repository import InMemRepository
+from moatless.search_tree import SearchTree
+from moatless.selector.uct import UCTSelector
+from moatless.value_function.base import BaseValueFunction
+
+NOTES = 50
+
+
+class NoteArgs(ActionArguments):
+    """Take a note."""
+
+    note: str = Field(..., description="The note")
+
+    model_config = ConfigDict(title="Note")
+
+
+class Note(Action):
+    """An action without side effects, so the simulations are bound by the latency of the fake models."""
+
+    args_schema: ClassVar[Type[ActionArguments]] = NoteArgs
+
+    def _execute(self, args: NoteArgs, file_context=None, workspace=None) -> str:
+        return f"Noted {args.note}"
+
+
+class FakeCompletionModel(BaseCompletionModel):
+    latency: float = Field(0.05, description="Seconds to sleep for each completion")
+
+    _seen: Counter = PrivateAttr(default_factory=Counter)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def create_completion(self, messages: List[dict]) -> CompletionResponse:
+        time.sleep(self.latency)
+        messages_hash = zlib.crc32(json.dumps(messages, default=str).encode())
+        with self._lock:
+            self._seen[messages_hash] += 1
+            rng = random.Random(messages_hash + self._seen[messages_hash])
+
+        if rng.random() < 0.1:
+            action = FinishArgs(thoughts="Done", finish_reason="The issue is fixed")
+        else:
+            action = NoteArgs(thoughts="Take a note", note=f"note {rng.randint(0, NOTES - 1)}")
+
+        completion = Completion(model=self.model, usage=Usage(prompt_tokens=1000, completion_tokens=100))
+        return CompletionResponse.create(output=action, completion=completion)
+
+    def _validate_completion(self, completion_response: Any):
+        raise NotImplementedError()
+
+
+class FakeValueFunction(BaseValueFunction):
+    latency: float = Field(0.02, description="Seconds to sleep for each reward")
+
+    def get_reward(self, node: Node):
+        time.sleep(self.latency)
+        return Reward(value=random.Random(node.node_id).randint(-100, 100)), None
+
+
+def create_search_tree(iterations: int, workers: int, latency: float) -> SearchTree:
+    repository = InMemRepository({"module.py": "def function():\n    pass\n"})
+    completion = FakeCompletionModel(response_format=LLMResponseFormat.TOOLS, model="fake-model", latency=latency)
+    agent = ActionAgent(
+        completion=completion,
+        system_prompt="You're an AI assistant",
+        actions=[Note(), Finish()],
+    )
+    return SearchTree.create(
+        message="Fix the bug",
+        file_context=FileContext(repo=repository),
+        repository=repository,
+        agent=agent,
+        selector=UCTSelector(),
+        value_function=FakeValueFunction(latency=latency / 2),
+        max_expansions=3,
+        max_iterations=iterations,
+        max_depth=10,
+        max_workers=workers,
+    )
+
+
+def run(iterations: int, workers: int, latency: float):
+    search_tree = create_search_tree(iterations, workers, latency)
+    start = time.perf_counter()
+    search_tree.run_search()
+    seconds = time.perf_counter() - start
+    nodes = [node.model_dump(exclude={"parent", "children"}) for node in search_tree.root.get_all_nodes()]
+    return nodes, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel search throughput")
+    parser.add_argument("--iterations", type=int, default=60)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per completion")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("moatless.search_tree").setLevel(logging.WARNING)
+
+    results = []
+    baseline = None
+    for workers in args.workers:
+        nodes, seconds = run(args.iterations, workers, args.latency)
+        deterministic = None
+        if workers > 1:
+            deterministic = run(args.iterations, workers, args.latency)[0] == nodes
+
+        baseline = baseline or seconds
+        results.append(
+            {
+                "workers": workers,
+                "nodes": len(nodes),
+                "seconds": round(seconds, 2),
+                "nodes_per_second": round(len(nodes) / seconds, 1),
+                "speedup": round(baseline / seconds, 2),
+                "deterministic": deterministic,
+            }
+        )
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark selection on large synthetic trees.
+
+Selection with `UCTSelector.select_from_tree`, which scores the node arrays in the tree stats, is compared to scoring
+the nodes returned by a traversal with `get_expandable_descendants`, and to the `SimpleSelector` on the traversal.
+
+    python scripts/benchmark_selector.py --nodes 10000
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+
+from moatless.node import Node
+from moatless.selector.simple import SimpleSelector
+from moatless.selector.uct import UCTSelector
+
+
+def create_tree(nodes: int, seed: int) -> Node:
+    rng = random.Random(seed)
+    root = Node(node_id=0, max_expansions=5, visits=1)
+    stats = root.get_tree_stats()
+    expandable = [root]
+    for node_id in range(1, nodes):
+        parent = rng.choice(expandable)
+        node = Node(node_id=node_id, max_expansions=5, visits=rng.randint(1, 20), is_duplicate=rng.random() < 0.05)
+        node.value = rng.uniform(-100, 100) * node.visits
+        parent.add_child(node)
+        stats.refresh(node)
+        if not parent.is_expandable():
+            expandable.remove(parent)
+        if node.is_expandable():
+            expandable.append(node)
+    return root
+
+
+def timed(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return round((time.perf_counter() - start) / repeat * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark node selection")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    root = create_tree(args.nodes, args.seed)
+    uct = UCTSelector(depth_penalty=0.01, duplicate_penalty=0.1)
+    puct = UCTSelector(algorithm="puct")
+
+    assert uct.select_from_tree(root) is uct.select(root.get_expandable_descendants())
+
+    result = {
+        "nodes": args.nodes,
+        "expandable_nodes": len(root.get_expandable_descendants()),
+        "uct_select_ms": timed(lambda: uct.select_from_tree(root), args.repeat),
+        "puct_select_ms": timed(lambda: puct.select_from_tree(root), args.repeat),
+        "uct_traversal_select_ms": timed(lambda: uct.select(root.get_expandable_descendants()), 5),
+        "simple_traversal_select_ms": timed(lambda: SimpleSelector().select(root.get_expandable_descendants()), 5),
+    }
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark size and load time of trajectories stored as JSON and in the binary trajectory format.
+
+Without a trajectory a search tree is generated where every node has a completion with the message history of its
+trajectory, like in an MCTS run.
+
+    python scripts/benchmark_trajectory_format.py --nodes 200
+    python scripts/benchmark_trajectory_format.py --trajectory trajectory.json
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from moatless.tree_journal import flatten_nodes
+from moatless.utils.trajectory_file import TrajectoryReader, summarize_node, write_trajectory
+
+
+def generate_nodes(nodes: int, seed: int) -> list[dict]:
+    """Generate nodes in list format with completions, observations and file contexts."""
+    rng = random.Random(seed)
+    node_list = []
+    messages_by_node = {}
+    for node_id in range(nodes):
+        parent = rng.choice(node_list) if node_list else None
+        messages = list(messages_by_node[parent["node_id"]]) if parent else [{"role": "system", "content": "You are an autonomous AI assistant. " * 200}]
+        observation = "\n".join(f"    line {i}: result = value * {rng.randint(0, 1000)}" for i in range(rng.randint(20, 200)))
+        messages.append({"role": "user", "content": observation})
+        messages_by_node[node_id] = messages
+
+        completion = {
+            "model": "claude-3-5-sonnet-20241022",
+            "input": messages,
+            "response": {"choices": [{"message": {"content": f"I will look at function_{rng.randint(0, 100)}" * 20}}]},
+            "usage": {"completion_cost": 0.01, "prompt_tokens": 1000 * len(messages), "completion_tokens": 300},
+        }
+        node_list.append(
+            {
+                "node_id": node_id,
+                "parent_id": parent["node_id"] if parent else None,
+                "visits": rng.randint(1, 10),
+                "value": float(rng.randint(-100, 100)),
+                "reward": {"value": rng.randint(-100, 100), "explanation": "The change looks correct. " * 20},
+                "terminal": False,
+                "action_steps": [
+                    {
+                        "action": {
+                            "thoughts": "Let me look at the code. " * 10,
+                            "files": [{"file_path": "package/module_0.py", "span_ids": ["function_0"]}],
+                            "action_args_class": "moatless.actions.view_code.ViewCodeArgs",
+                        },
+                        "observation": {"message": observation, "properties": {}},
+                        "completion": completion,
+                    }
+                ],
+                "completions": {"value_function": dict(completion, input=messages[-3:])},
+                "file_context": {
+                    "files": [
+                        {
+                            "file_path": f"package/module_{i}.py",
+                            "spans": [{"span_id": f"function_{j}"} for j in range(rng.randint(1, 10))],
+                            "patch": None,
+                        }
+                        for i in range(rng.randint(1, 5))
+                    ]
+                },
+            }
+        )
+    return node_list
+
+
+def load_json(file_path: str) -> list[dict]:
+    with open(file_path) as f:
+        data = json.load(f)
+    return flatten_nodes(data.get("root", data) if isinstance(data, dict) else data)
+
+
+def timed(function, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return result, round(best * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON and binary trajectory files")
+    parser.add_argument("--trajectory", help="Stored search tree or node list, generated if not set")
+    parser.add_argument("--nodes", type=int, default=200, help="Nodes in the generated trajectory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.trajectory:
+            json_path = args.trajectory
+            nodes = load_json(json_path)
+        else:
+            nodes = generate_nodes(args.nodes, args.seed)
+            json_path = os.path.join(temp_dir, "trajectory.json")
+            with open(json_path, "w") as f:
+                json.dump(nodes, f, indent=2)
+
+        binary_path = os.path.join(temp_dir, "trajectory.trajz")
+        _, write_ms = timed(lambda: write_trajectory(binary_path, nodes), repeat=1)
+
+        json_nodes, json_load_ms = timed(lambda: load_json(json_path))
+
+        def read_binary(**kwargs):
+            with TrajectoryReader(binary_path) as reader:
+                return reader.read_nodes(**kwargs)
+
+        def read_summaries():
+            with TrajectoryReader(binary_path) as reader:
+                return reader.read_summaries()
+
+        binary_nodes, binary_load_ms = timed(read_binary)
+        assert binary_nodes == json_nodes
+
+        _, json_summary_ms = timed(lambda: [summarize_node(node) for node in load_json(json_path)])
+        _, headers_ms = timed(lambda: read_binary(fields=[]))
+        _, summaries_ms = timed(read_summaries)
+        _, file_context_ms = timed(lambda: read_binary(fields=["file_context"]))
+
+        result = {
+            "nodes": len(nodes),
+            "json_mb": round(os.path.getsize(json_path) / 1024**2, 2),
+            "binary_mb": round(os.path.getsize(binary_path) / 1024**2, 2),
+            "binary_write_ms": write_ms,
+            "json_load_ms": json_load_ms,
+            "binary_load_ms": binary_load_ms,
+            "json_summaries_ms": json_summary_ms,
+            "binary_summaries_ms": summaries_ms,
+            "binary_headers_ms": headers_ms,
+            "binary_file_contexts_ms": file_context_ms,
+        }
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
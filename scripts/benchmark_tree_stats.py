@@ -0,0 +1,158 @@
+"""
+Benchmark the per iteration bookkeeping of `SearchTree.run_search` on large synthetic trees.
+
+Each iteration adds a node, executes and rewards it, and then runs the queries of one search iteration: the finish
+checks, the iteration event and the best trajectory. The queries are timed with the incrementally maintained tree
+stats and with the full tree traversals used before.
+
+    python scripts/benchmark_tree_stats.py --nodes 5000 --checkpoints 1000 2000 5000
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+
+from moatless.actions.finish import FinishArgs
+from moatless.completion.model import Completion, Usage
+from moatless.node import Node, Reward
+from moatless.search_tree import SearchTree
+
+
+def traversal_iteration(tree: SearchTree):
+    """The queries of one iteration computed by traversing the tree."""
+
+    def finished_nodes():
+        parent_ids = set()
+        result = []
+        for node in tree.root.get_all_nodes():
+            if node.is_finished() and node.parent.node_id not in parent_ids:
+                parent_ids.add(node.parent.node_id)
+                result.append(node)
+        return result
+
+    def best_trajectory():
+        nodes = finished_nodes() or tree.root.get_leaf_nodes()
+        return nodes[-1]
+
+    total_cost = tree.root.total_usage().completion_cost
+    if tree.max_cost and tree.root.total_usage().completion_cost and total_cost >= tree.max_cost:
+        return
+    if len(tree.root.get_all_nodes()) >= tree.max_iterations:
+        return
+    finished = finished_nodes()
+    {node.parent.node_id for node in finished}
+    tree.root.get_expandable_descendants()
+
+    total_cost = tree.root.total_usage().completion_cost
+    len(tree.root.get_all_nodes())
+    {
+        "iteration": len(tree.root.get_all_nodes()),
+        "total_cost": total_cost,
+        "best_reward": max((n.reward.value if n.reward else 0) for n in tree.root.get_all_nodes()),
+        "finished_nodes": len(finished_nodes()),
+        "total_nodes": len(tree.root.get_all_nodes()),
+        "best_node_id": best_trajectory().node_id if best_trajectory() else None,
+    }
+
+
+def stats_iteration(tree: SearchTree):
+    """The queries of one iteration as done by `SearchTree.run_search`."""
+    if tree.is_finished():
+        return
+
+    stats = tree.root.get_tree_stats()
+    total_cost = stats.total_usage().completion_cost
+    best_trajectory = tree.get_best_trajectory()
+    {
+        "iteration": stats.node_count,
+        "total_cost": total_cost,
+        "best_reward": stats.max_reward(),
+        "finished_nodes": len(stats.finished_nodes()),
+        "total_nodes": stats.node_count,
+        "best_node_id": best_trajectory.node_id if best_trajectory else None,
+    }
+
+
+def benchmark(mode: str, nodes: int, checkpoints: list[int], seed: int) -> dict:
+    rng = random.Random(seed)
+    root = Node(node_id=0, max_expansions=3)
+    tree = SearchTree.model_construct(
+        root=root,
+        max_iterations=nodes + 1,
+        max_cost=None,
+        max_finished_nodes=None,
+        min_finished_nodes=None,
+        reward_threshold=None,
+        discriminator=None,
+        metadata={},
+    )
+    iteration = stats_iteration if mode == "stats" else traversal_iteration
+
+    all_nodes = [root]
+    expandable = [root]
+    timings = {}
+    window_start = time.perf_counter()
+    window_seconds = 0.0
+    window_iterations = 0
+    for node_id in range(1, nodes):
+        parent = rng.choice(expandable)
+        node = Node(node_id=node_id, max_expansions=3)
+        parent.add_child(node)
+        if len(parent.children) >= 3:
+            expandable.remove(parent)
+
+        node.completions["build_action"] = Completion(
+            model="test", usage=Usage(completion_cost=0.001, prompt_tokens=1000, completion_tokens=100)
+        )
+        node.reward = Reward(value=rng.randint(-100, 100))
+        if rng.random() < 0.05:
+            node.action = FinishArgs(thoughts="", finish_reason="done")
+        else:
+            expandable.append(node)
+        if mode == "stats":
+            root.get_tree_stats().refresh(node)
+        all_nodes.append(node)
+
+        start = time.perf_counter()
+        iteration(tree)
+        window_seconds += time.perf_counter() - start
+        window_iterations += 1
+
+        if node_id + 1 in checkpoints:
+            timings[node_id + 1] = round(window_seconds / window_iterations * 1000, 3)
+            window_seconds = 0.0
+            window_iterations = 0
+
+    return {
+        "mode": mode,
+        "ms_per_iteration_at_nodes": timings,
+        "total_seconds": round(time.perf_counter() - window_start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per iteration search tree bookkeeping")
+    parser.add_argument("--nodes", type=int, default=5000, help="Nodes in the generated tree")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[100, 1000, 2000, 3000, 4000, 5000])
+    parser.add_argument("--modes", nargs="+", default=["traversal", "stats"], choices=["traversal", "stats"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("moatless").setLevel(logging.WARNING)
+    logging.getLogger("moatless.search_tree").setLevel(logging.WARNING)
+
+    results = [benchmark(mode, args.nodes, args.checkpoints, args.seed) for mode in args.modes]
+    for result in results:
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import time
+
+import faiss
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from moatless.index.simple_faiss import SimpleFaissVectorStore
+
+
+def load_vectors(persist_dir: str) -> np.ndarray:
+    """Read the vectors from a persisted flat vector index."""
+    faiss_index = faiss.read_index(f"{persist_dir}/vector_index.faiss")
+    return faiss.downcast_index(faiss_index.index).reconstruct_n(0, faiss_index.ntotal)
+
+
+def generate_vectors(count: int, dimensions: int, seed: int) -> np.ndarray:
+    """Generate clustered vectors, uniformly random vectors are unrealistically hard for quantization."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(max(count // 100, 1), dimensions))
+    assignments = rng.integers(0, len(centroids), size=count)
+    vectors = centroids[assignments] + rng.normal(scale=0.3, size=(count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def build_store(vectors: np.ndarray, quantization: str, pq_m: int, rerank_top_k: int) -> tuple[SimpleFaissVectorStore, float]:
+    vector_store = SimpleFaissVectorStore.from_defaults(
+        d=vectors.shape[1], quantization=quantization, pq_m=pq_m, rerank_top_k=rerank_top_k
+    )
+    nodes = [TextNode(id_=str(i), text="", embedding=vector.tolist()) for i, vector in enumerate(vectors)]
+
+    start = time.perf_counter()
+    vector_store.add(nodes)
+    vector_store._flush_pending()
+    return vector_store, time.perf_counter() - start
+
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, configs: list[dict]) -> list[dict]:
+    ground_truth = None
+    results = []
+
+    for config in configs:
+        vector_store, build_time = build_store(vectors, **config)
+
+        latencies = []
+        hits = []
+        for query_vector in queries:
+            start = time.perf_counter()
+            result = vector_store.query(VectorStoreQuery(query_embedding=query_vector.tolist(), similarity_top_k=k))
+            latencies.append(time.perf_counter() - start)
+            hits.append(result.ids)
+
+        # The first config is the flat index and used as ground truth
+        if ground_truth is None:
+            ground_truth = hits
+
+        recall = np.mean([len(set(hit) & set(truth)) / k for hit, truth in zip(hits, ground_truth)])
+        index_bytes = faiss.serialize_index(vector_store.client).nbytes
+        sidecar_bytes = sum(vector.nbytes for vector in vector_store._rerank_vectors.values())
+
+        results.append(
+            {
+                **config,
+                "build_seconds": round(build_time, 3),
+                "index_mb": round(index_bytes / 1024**2, 2),
+                "sidecar_mb": round(sidecar_bytes / 1024**2, 2),
+                f"recall@{k}": round(float(recall), 4),
+                "query_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                "query_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            }
+        )
+        print(json.dumps(results[-1]))
+
+    return results
+
+
+def benchmark_updates(vectors: np.ndarray, batch_size: int, deletes: int, queries: int, k: int) -> dict:
+    """Measure incremental adds, deletes by ref doc id and filtered queries on a growing index."""
+    vector_store = SimpleFaissVectorStore.from_defaults(d=vectors.shape[1])
+    nodes = [
+        TextNode(id_=str(i), text="", embedding=vector.tolist(), metadata={"category": "test" if i % 2 else "impl"})
+        for i, vector in enumerate(vectors)
+    ]
+
+    add_times = []
+    for start in range(0, len(nodes), batch_size):
+        batch_start = time.perf_counter()
+        vector_store.add(nodes[start : start + batch_size])
+        add_times.append(time.perf_counter() - batch_start)
+
+    rng = np.random.default_rng(0)
+    delete_ids = rng.choice(len(nodes), size=deletes, replace=False)
+    start = time.perf_counter()
+    for node_id in delete_ids:
+        vector_store.delete(str(node_id))
+    delete_time = time.perf_counter() - start
+
+    filters = MetadataFilters(filters=[MetadataFilter(key="category", value="impl")])
+    query_times = []
+    for query_idx in rng.choice(len(vectors), size=queries, replace=False):
+        start = time.perf_counter()
+        vector_store.query(
+            VectorStoreQuery(query_embedding=vectors[query_idx].tolist(), similarity_top_k=k, filters=filters)
+        )
+        query_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    vector_store._remove_deleted_vectors()
+    remove_time = time.perf_counter() - start
+
+    return {
+        "vectors": len(vectors),
+        "add_batch_ms_first": round(add_times[0] * 1000, 3),
+        "add_batch_ms_last": round(add_times[-1] * 1000, 3),
+        "add_total_seconds": round(sum(add_times), 3),
+        "delete_us_per_ref_doc": round(delete_time / deletes * 1e6, 3),
+        "remove_ids_seconds": round(remove_time, 3),
+        f"filtered_query_ms_p50_top{k}": round(float(np.percentile(query_times, 50)) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector stores and incremental index updates")
+    parser.add_argument("--mode", choices=["quantization", "updates"], default="quantization")
+    parser.add_argument("--persist-dir", help="Use vectors from a persisted flat index instead of synthetic vectors")
+    parser.add_argument("--count", type=int, default=20000, help="Number of synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Dimensions of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Number of results per query")
+    parser.add_argument("--pq-m", type=int, default=64, help="Number of sub-quantizers for product quantization")
+    parser.add_argument("--rerank-top-k", type=int, default=100, help="Candidates to re-rank for the re-ranked configs")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Nodes per add call in updates mode")
+    parser.add_argument("--deletes", type=int, default=1000, help="Ref docs to delete in updates mode")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.persist_dir:
+        vectors = load_vectors(args.persist_dir)
+    else:
+        vectors = generate_vectors(args.count, args.dimensions, args.seed)
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.choice(len(vectors), size=args.queries, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+
+    print(f"Benchmarking {len(vectors)} vectors with {vectors.shape[1]} dimensions and {len(queries)} queries")
+
+    if args.mode == "updates":
+        results = benchmark_updates(vectors, args.batch_size, args.deletes, args.queries, args.k)
+        print(json.dumps(results))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    configs = [
+        {"quantization": "flat", "pq_m": args.pq_m, "rerank_top_k": 0},
+        {"quantization": "fp16", "pq_m": args.pq_m, "rerank_top_k": 0},
+        {"quantization": "int8", "pq_m": args.pq_m, "rerank_top_k": 0},
+        {"quantization": "int8", "pq_m": args.pq_m, "rerank_top_k": args.rerank_top_k},
+        {"quantization": "pq", "pq_m": args.pq_m, "rerank_top_k": 0},
+        {"quantization": "pq", "pq_m": args.pq_m, "rerank_top_k": args.rerank_top_k},
+    ]
+
+    results = benchmark(vectors, queries, args.k, configs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
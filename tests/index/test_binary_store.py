@@ -0,0 +1,83 @@
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from moatless.index.binary_store import (
+    is_binary_docstore,
+    load_docstore,
+    persist_docstore,
+    read_columns,
+    read_strings,
+    write_columns,
+    write_strings,
+)
+
+
+def create_docstore() -> SimpleDocumentStore:
+    docstore = SimpleDocumentStore()
+    nodes = []
+    for i in range(20):
+        node = TextNode(
+            id_=f"file_{i % 4}.py_{i}",
+            text=f"def foo_{i}():\n    return 'ö{i}'\n",
+            metadata={"file_path": f"file_{i % 4}.py", "span_ids": [f"foo_{i}"], "tokens": i},
+        )
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=f"file_{i % 4}.py")
+        nodes.append(node)
+    docstore.add_documents(nodes)
+    return docstore
+
+
+def test_columns_round_trip(tmp_path):
+    rows = [{"a": 1, "b": None}, {"b": [1, 2]}, {}, {"c": "x", "a": 2}]
+    write_columns(str(tmp_path / "columns.bin"), rows, compress=True)
+    assert read_columns(str(tmp_path / "columns.bin"), compressed=True) == rows
+
+
+def test_strings_round_trip(tmp_path):
+    values = ["a", "", "line\nbreak", "ö\r\n", "last"]
+    write_strings(str(tmp_path / "strings.bin"), values)
+    assert read_strings(str(tmp_path / "strings.bin")) == values
+
+    write_strings(str(tmp_path / "empty.bin"), [])
+    assert read_strings(str(tmp_path / "empty.bin")) == []
+
+
+def test_docstore_with_line_break_in_id(tmp_path):
+    docstore = create_docstore()
+    docstore.add_documents([TextNode(id_="multi\nline", text="multi line id")])
+    persist_docstore(docstore, str(tmp_path))
+
+    loaded = load_docstore(str(tmp_path))
+    assert loaded.get_document("multi\nline").text == "multi line id"
+    for doc_id, doc in docstore.docs.items():
+        assert loaded.get_document(doc_id).text == doc.text
+
+
+def test_docstore_round_trip(tmp_path):
+    docstore = create_docstore()
+    persist_docstore(docstore, str(tmp_path), compress=True)
+
+    assert is_binary_docstore(str(tmp_path))
+
+    loaded = load_docstore(str(tmp_path))
+    assert loaded.get_all_document_hashes() == docstore.get_all_document_hashes()
+    assert loaded.get_all_ref_doc_info() == docstore.get_all_ref_doc_info()
+
+    for doc_id, doc in docstore.docs.items():
+        loaded_doc = loaded.get_document(doc_id)
+        assert loaded_doc.text == doc.text
+        assert loaded_doc.metadata == doc.metadata
+        assert loaded_doc.hash == doc.hash
+        assert loaded_doc.ref_doc_id == doc.ref_doc_id
+
+
+def test_loaded_docstore_is_updatable(tmp_path):
+    persist_docstore(create_docstore(), str(tmp_path))
+    loaded = load_docstore(str(tmp_path))
+
+    loaded.delete_document("file_0.py_0")
+    loaded.add_documents([TextNode(id_="new", text="new node")])
+
+    assert not loaded.document_exists("file_0.py_0")
+    assert loaded.get_document("new").text == "new node"
+    assert len(loaded.docs) == 20
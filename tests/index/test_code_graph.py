@@ -0,0 +1,102 @@
+import time
+
+from moatless.codeblocks.codeblocks import RelationshipType
+from moatless.codeblocks.parser.python import PythonParser
+from moatless.index import CodeIndex, IndexSettings
+from moatless.index.code_graph import CodeGraph, CodeGraphBuilder
+from moatless.repository import FileRepository
+
+FILES = {
+    "shop/models.py": """class Product:
+    def price(self):
+        return 10
+
+
+def create_product():
+    return Product()
+""",
+    "shop/billing.py": """from shop.models import Product, create_product
+
+
+def invoice_total():
+    product = create_product()
+    return product.price()
+
+
+class DiscountedProduct(Product):
+    def price(self):
+        return 5
+""",
+    "shop/__init__.py": "",
+    "shop/api.py": """from .billing import invoice_total
+
+
+def total_view():
+    return invoice_total()
+""",
+}
+
+
+def build_graph() -> CodeGraph:
+    builder = CodeGraphBuilder()
+    parser = PythonParser(enable_code_graph=True, index_callback=builder.add_block)
+    for file_path, content in FILES.items():
+        parser.parse(content, file_path=file_path)
+    return builder.build()
+
+
+def test_references_are_resolved_across_files():
+    graph = build_graph()
+
+    assert ("shop/models.py", "create_product") in graph.successors("shop/billing.py", "invoice_total")
+    assert ("shop/models.py", "Product") in graph.successors("shop/billing.py", "DiscountedProduct")
+    assert ("shop/billing.py", "invoice_total") in graph.successors("shop/api.py", "total_view")
+
+    # Imports point to the imported definitions
+    assert set(graph.successors("shop/billing.py", "imports", [RelationshipType.IMPORTS])) == {
+        ("shop/models.py", "Product"),
+        ("shop/models.py", "create_product"),
+    }
+
+    assert set(graph.predecessors("shop/models.py", "Product")) == {
+        ("shop/billing.py", "imports"),
+        ("shop/billing.py", "DiscountedProduct"),
+        ("shop/models.py", "create_product"),
+    }
+
+    assert graph.successors("shop/models.py", "Product", [RelationshipType.CALLS]) == []
+    assert graph.successors("unknown.py", "foo") == []
+
+
+def test_persist_and_load(tmp_path):
+    graph = build_graph()
+    graph.persist(str(tmp_path))
+
+    loaded = CodeGraph.from_persist_dir(str(tmp_path))
+    assert len(loaded) == len(graph)
+    assert loaded.edge_count == graph.edge_count
+    assert loaded.predecessors("shop/models.py", "Product") == graph.predecessors("shop/models.py", "Product")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        loaded.successors("shop/billing.py", "invoice_total")
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+
+def test_code_graph_is_built_on_ingestion(tmp_path):
+    repo_dir = tmp_path / "repo"
+    for file_path, content in FILES.items():
+        (repo_dir / file_path).parent.mkdir(parents=True, exist_ok=True)
+        (repo_dir / file_path).write_text(content)
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    code_index = CodeIndex(file_repo=repository, settings=IndexSettings(embed_model="local-hash", dimensions=64))
+    code_index.run_ingestion()
+
+    assert ("shop/billing.py", "invoice_total") in code_index.find_related_spans("shop/models.py", "create_product")
+
+    code_index.persist(str(tmp_path / "index"))
+    loaded = CodeIndex.from_persist_dir(str(tmp_path / "index"), file_repo=repository)
+    assert loaded.find_related_spans("shop/models.py", "create_product") == code_index.find_related_spans(
+        "shop/models.py", "create_product"
+    )
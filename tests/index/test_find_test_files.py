@@ -0,0 +1,89 @@
+from moatless.index import CodeIndex, IndexSettings
+from moatless.index.code_index import _rerank_files
+from moatless.repository import FileRepository
+from moatless.repository.repository import InMemRepository
+
+
+def create_repo(repo_dir):
+    files = {
+        "requests/models.py": "class Response:\n    pass\n",
+        "requests/sessions.py": "class Session:\n    pass\n",
+        "tests/test_models.py": "def test_response():\n    assert True\n",
+        "tests/unit/test_models.py": "def test_response_unit():\n    assert True\n",
+        "requests/sessions_test.py": "def test_session():\n    assert True\n",
+        ".hidden/test_models.py": "def test_hidden():\n    assert True\n",
+    }
+    for path, content in files.items():
+        (repo_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo_dir / path).write_text(content)
+
+
+def test_rerank_files_keeps_order_of_equal_scores():
+    file_paths = ["b/other.py", "a/other.py", "django/db/models/query.py", "c/other.py"]
+    assert _rerank_files(file_paths, "django/db/models/query.py") == [
+        "django/db/models/query.py",
+        "b/other.py",
+        "a/other.py",
+        "c/other.py",
+    ]
+
+
+def test_find_test_files_by_name(tmp_path):
+    repo_dir = tmp_path / "repo"
+    create_repo(repo_dir)
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    settings = IndexSettings(embed_model="local-hash", dimensions=64)
+    code_index = CodeIndex(file_repo=repository, settings=settings)
+    code_index.run_ingestion()
+
+    assert code_index._test_files_by_name == {
+        "sessions_test.py": ["requests/sessions_test.py"],
+        "test_models.py": ["tests/test_models.py", "tests/unit/test_models.py"],
+    }
+
+    test_files = code_index.find_test_files("requests/models.py", max_results=1)
+    assert test_files[0].file_path == "tests/test_models.py"
+
+    code_index.persist(str(tmp_path / "index"))
+    loaded = CodeIndex.from_persist_dir(str(tmp_path / "index"), file_repo=repository)
+    assert loaded._test_files_by_name == code_index._test_files_by_name
+
+
+def test_created_test_files_are_not_registered_in_the_index(tmp_path):
+    repo_dir = tmp_path / "repo"
+    create_repo(repo_dir)
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    code_index = CodeIndex(file_repo=repository, settings=IndexSettings(embed_model="local-hash", dimensions=64))
+
+    created_files = ["requests/helpers.py", "tests/test_utils.py"]
+    assert code_index._find_by_test_pattern("requests/utils.py", created_files) == "tests/test_utils.py"
+
+    # Other branches of a search don't see the created file
+    assert code_index._find_by_test_pattern("requests/utils.py") is None
+    assert "test_utils.py" not in code_index._test_files_by_name
+
+
+class ListedInMemRepository(InMemRepository):
+    def list_directory(self, directory_path: str = "") -> dict[str, list[str]]:
+        prefix = f"{directory_path}/" if directory_path else ""
+        entries = [path[len(prefix) :].split("/", 1) for path in self.files if path.startswith(prefix)]
+        return {
+            "files": sorted(prefix + entry[0] for entry in entries if len(entry) == 1),
+            "directories": sorted({prefix + entry[0] for entry in entries if len(entry) == 2}),
+        }
+
+
+def test_find_test_files_by_name_without_repo_dir():
+    repository = ListedInMemRepository(
+        files={
+            "requests/models.py": "class Response:\n    pass\n",
+            "tests/test_models.py": "def test_response():\n    assert True\n",
+            ".hidden/test_models.py": "def test_hidden():\n    assert True\n",
+        }
+    )
+    code_index = CodeIndex(file_repo=repository, settings=IndexSettings(embed_model="local-hash", dimensions=64))
+
+    assert code_index._find_by_test_pattern("requests/models.py") == "tests/test_models.py"
+    assert code_index._test_files_by_name == {"test_models.py": ["tests/test_models.py"]}
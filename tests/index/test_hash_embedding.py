@@ -0,0 +1,66 @@
+import numpy as np
+
+from moatless.index import CodeIndex, IndexSettings
+from moatless.index.embed_model import get_embed_model
+from moatless.index.hash_embedding import HashEmbedding, tokenize_identifiers
+from moatless.repository import FileRepository
+
+
+def test_tokenize_identifiers():
+    assert tokenize_identifiers("def getHTTPResponse(self, max_retries=3):") == [
+        "def",
+        "gethttpresponse",
+        "get",
+        "http",
+        "response",
+        "self",
+        "max_retries",
+        "max",
+        "retries",
+        "3",
+    ]
+
+
+def test_embeddings_are_deterministic_and_normalized():
+    embed_model = HashEmbedding(dimensions=64)
+    texts = ["class FileRepository:", "def find_by_pattern(self, patterns):", ""]
+
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    assert embeddings == HashEmbedding(dimensions=64).get_text_embedding_batch(texts)
+
+    assert all(len(embedding) == 64 for embedding in embeddings)
+    assert np.isclose(np.linalg.norm(embeddings[0]), 1.0)
+    assert np.linalg.norm(embeddings[2]) == 0.0
+
+
+def test_similar_code_is_closer():
+    embed_model = get_embed_model("local-hash", dimensions=256)
+    query = np.array(embed_model.get_query_embedding("find test files by pattern"))
+    related = np.array(embed_model.get_text_embedding("def find_test_files(self, file_pattern): ..."))
+    unrelated = np.array(embed_model.get_text_embedding("class TokenCounter:\n    total_tokens = 0"))
+
+    assert query @ related > query @ unrelated
+
+
+def test_index_and_search_offline(tmp_path):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    (repo_dir / "shapes.py").write_text(
+        "class Circle:\n    def area(self):\n        return 3.14 * self.radius ** 2\n"
+    )
+    (repo_dir / "billing.py").write_text(
+        "def calculate_invoice_total(invoice):\n    return sum(line.amount for line in invoice.lines)\n"
+    )
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    settings = IndexSettings(embed_model="local-hash", dimensions=256)
+    code_index = CodeIndex(file_repo=repository, settings=settings)
+    vectors, _ = code_index.run_ingestion()
+    assert vectors > 0
+
+    response = code_index.semantic_search("calculate invoice total")
+    assert response.hits[0].file_path == "billing.py"
+
+    code_index.persist(str(tmp_path / "index"))
+    loaded = CodeIndex.from_persist_dir(str(tmp_path / "index"), file_repo=repository)
+    assert loaded.semantic_search("circle area").hits[0].file_path == "shapes.py"
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from moatless.index import CodeIndex, IndexSettings
+from moatless.repository import FileRepository
+
+
+@pytest.fixture
+def code_index(tmp_path):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    (repo_dir / "shapes.py").write_text("class Circle:\n    def area(self):\n        return 3.14 * self.radius ** 2\n")
+    (repo_dir / "billing.py").write_text(
+        "def calculate_invoice_total(invoice):\n    return sum(line.amount for line in invoice.lines)\n"
+    )
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    code_index = CodeIndex(
+        file_repo=repository,
+        settings=IndexSettings(embed_model="local-hash", dimensions=64),
+        search_cache_size=2,
+    )
+    code_index.run_ingestion()
+    return code_index
+
+
+def test_repeated_search_is_cached(code_index):
+    first = code_index.semantic_search("calculate invoice total", category="implementation")
+    second = code_index.semantic_search("  calculate invoice total ", category="implementation")
+
+    assert second == first
+    assert code_index.search_cache_stats()["hits"] == 1
+    assert code_index.search_cache_stats()["misses"] == 1
+
+    # Cached responses are copied so callers can't modify the cache
+    second.hits.clear()
+    assert code_index.semantic_search("calculate invoice total", category="implementation").hits
+
+    # Different arguments are cached separately
+    code_index.semantic_search("calculate invoice total", max_results=5, category="implementation")
+    assert code_index.search_cache_stats()["misses"] == 2
+
+
+def test_cache_is_bounded(code_index):
+    code_index.semantic_search("circle")
+    code_index.semantic_search("invoice")
+    code_index.semantic_search("area")
+
+    assert code_index.search_cache_stats()["size"] == 2
+
+    # The least recently used query was evicted
+    code_index.semantic_search("circle")
+    assert code_index.search_cache_stats()["hits"] == 0
+
+
+def test_cache_is_invalidated_on_ingestion(code_index):
+    code_index.semantic_search("circle area")
+    version = code_index.search_cache_stats()["index_version"]
+
+    code_index.run_ingestion()
+
+    assert code_index.search_cache_stats()["index_version"] == version + 1
+    assert code_index.search_cache_stats()["size"] == 0
+
+    code_index.semantic_search("circle area")
+    assert code_index.search_cache_stats()["hits"] == 0
+    assert code_index.search_cache_stats()["hit_rate"] == 0.0
+
+
+class _SlowOrderedDict(OrderedDict):
+    """Yields to other threads after a lookup, like a thread switch between finding and refreshing an entry."""
+
+    def get(self, *args):
+        value = super().get(*args)
+        time.sleep(0.001)
+        return value
+
+
+def test_shared_cache_is_thread_safe(code_index):
+    # Searches return the same response, so the test exercises the cache and not the search
+    response = code_index.semantic_search("circle")
+    code_index._semantic_search = lambda *args: response
+    code_index.invalidate_search_cache()
+    code_index._search_cache = _SlowOrderedDict()
+    stats = code_index.search_cache_stats()
+    queries = ["circle", "invoice", "area", "total"]
+    errors = []
+
+    def search(thread_id: int):
+        try:
+            for i in range(20):
+                code_index.semantic_search(queries[(thread_id + i) % len(queries)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    lookups = code_index.search_cache_stats()
+    assert lookups["hits"] + lookups["misses"] - stats["hits"] - stats["misses"] == 8 * 20
+    assert lookups["size"] <= 2
@@ -0,0 +1,61 @@
+from unittest.mock import patch
+
+from moatless.index import CodeIndex, IndexSettings
+from moatless.index.simple_faiss import SimpleFaissVectorStore
+from moatless.repository import FileRepository
+
+
+def create_code_index(tmp_path, files: int = 30):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    for i in range(files):
+        (repo_dir / f"module_{i}.py").write_text(f"def compute_value_{i}(value):\n    return value * {i}\n")
+
+    repository = FileRepository(repo_path=str(repo_dir))
+    code_index = CodeIndex(
+        file_repo=repository,
+        settings=IndexSettings(embed_model="local-hash", dimensions=64),
+        search_cache_size=0,
+    )
+    code_index.run_ingestion()
+    return code_index
+
+
+def test_vector_search_pages_until_exhausted(tmp_path):
+    code_index = create_code_index(tmp_path)
+
+    with patch.object(
+        SimpleFaissVectorStore, "query", autospec=True, side_effect=SimpleFaissVectorStore.query
+    ) as query:
+        results = list(code_index._iter_vector_search("compute value", page_size=4))
+
+    assert len(results) == 30
+    assert len({result.id for result in results}) == 30
+    assert [call.args[1].similarity_top_k for call in query.call_args_list] == [4, 16, 64]
+
+    # Results are in the same order as a single query
+    assert [result.id for result in results] == [result.id for result in code_index._vector_search("compute value")]
+
+
+def test_vector_search_pages_past_deleted_vectors(tmp_path):
+    code_index = create_code_index(tmp_path)
+    vector_store = code_index._vector_store
+
+    # Vectors of a re-indexed file are filtered from results until they are removed in a batch
+    top_hit = next(code_index._iter_vector_search("compute value", page_size=4))
+    vector_store.delete(vector_store._data.text_id_to_ref_doc_id[top_hit.id])
+    assert vector_store._vector_ids_to_delete
+
+    results = list(code_index._iter_vector_search("compute value", page_size=4))
+    assert len(results) == 29
+    assert top_hit.id not in {result.id for result in results}
+
+
+def test_semantic_search_stops_at_max_results(tmp_path):
+    code_index = create_code_index(tmp_path)
+
+    with patch.object(FileRepository, "get_file", autospec=True, side_effect=FileRepository.get_file) as get_file:
+        response = code_index.semantic_search("compute value", max_results=2)
+
+    assert len(response.hits) == 3
+    assert get_file.call_count == 3
@@ -0,0 +1,170 @@
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import VectorStoreQuery
+
+from moatless.index.simple_faiss import SimpleFaissVectorStore
+
+
+def create_nodes(count: int, d: int, seed: int = 42) -> list[TextNode]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, d)).astype(np.float32)
+    return [
+        TextNode(id_=f"node_{i}", text=f"text {i}", embedding=vectors[i].tolist(), metadata={"file_path": f"file_{i}.py"})
+        for i in range(count)
+    ]
+
+
+def query(vector_store: SimpleFaissVectorStore, embedding: list[float], top_k: int = 5):
+    return vector_store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=top_k))
+
+
+@pytest.mark.parametrize("quantization", ["flat", "fp16", "int8"])
+def test_scalar_quantization_finds_nearest(quantization):
+    nodes = create_nodes(200, 32)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization=quantization)
+    vector_store.add(nodes)
+
+    result = query(vector_store, nodes[17].embedding)
+    assert result.ids[0] == "node_17"
+
+
+def test_pq_trains_when_enough_vectors_are_added():
+    nodes = create_nodes(700, 32)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization="pq", pq_m=8, pq_nbits=4)
+
+    vector_store.add(nodes[:300])
+    assert not vector_store.client.is_trained
+
+    vector_store.add(nodes[300:])
+    assert vector_store.client.is_trained
+    assert vector_store.client.ntotal == 700
+
+
+def test_pq_uses_exact_index_until_there_are_enough_vectors_to_train(tmp_path):
+    nodes = create_nodes(700, 32)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization="pq", pq_m=8, pq_nbits=8)
+
+    # 50 vectors are too few to train 256 centroids, but can be searched and persisted
+    vector_store.add(nodes[:50])
+    assert query(vector_store, nodes[17].embedding).ids[0] == "node_17"
+    vector_store.persist(str(tmp_path))
+    assert query(SimpleFaissVectorStore.from_persist_dir(str(tmp_path)), nodes[17].embedding).ids[0] == "node_17"
+
+    # The quantized index is trained when enough vectors are added
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization="pq", pq_m=8, pq_nbits=4)
+    vector_store.add(nodes[:10])
+    assert query(vector_store, nodes[3].embedding).ids[0] == "node_3"
+    assert vector_store.client.is_trained
+
+    vector_store.add(nodes[10:])
+    assert vector_store._untrained_index is None
+    assert isinstance(faiss.downcast_index(vector_store.client.index), faiss.IndexPQ)
+    assert vector_store.client.ntotal == 700
+
+
+def test_int8_trains_on_enough_vectors_added_in_small_batches():
+    nodes = create_nodes(1200, 32)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization="int8")
+
+    # A single vector would fix the value range of every dimension, it's searched exactly instead
+    vector_store.add(nodes[:1])
+    assert query(vector_store, nodes[0].embedding).ids[0] == "node_0"
+    for start in range(1, 200, 7):
+        vector_store.add(nodes[start : start + 7])
+    assert all(query(vector_store, node.embedding, top_k=1).ids[0] == node.id_ for node in nodes[:200])
+
+    for start in range(200, 1200, 7):
+        vector_store.add(nodes[start : start + 7])
+    assert vector_store._untrained_index is None
+    assert isinstance(faiss.downcast_index(vector_store.client.index), faiss.IndexScalarQuantizer)
+    assert all(query(vector_store, node.embedding, top_k=1).ids[0] == node.id_ for node in nodes)
+
+
+def test_pq_with_rerank_returns_exact_order():
+    nodes = create_nodes(300, 32)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=32, quantization="pq", pq_m=4, pq_nbits=4, rerank_top_k=50)
+    vector_store.add(nodes)
+
+    result = query(vector_store, nodes[42].embedding)
+    assert result.ids[0] == "node_42"
+    assert result.similarities == sorted(result.similarities)
+
+
+def test_persist_and_load_rerank_sidecar(tmp_path):
+    nodes = create_nodes(100, 16)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=16, quantization="fp16", rerank_top_k=20)
+    vector_store.add(nodes)
+    vector_store.persist(str(tmp_path))
+
+    loaded = SimpleFaissVectorStore.from_persist_dir(str(tmp_path), rerank_top_k=20)
+    assert loaded.d == 16
+    assert query(loaded, nodes[3].embedding).ids[0] == "node_3"
+    assert len(loaded._rerank_vectors) == 100
+
+
+def test_persist_and_load_binary(tmp_path):
+    nodes = create_nodes(50, 16)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=16)
+    vector_store.storage_format = "binary"
+    vector_store.add(nodes)
+    vector_store.persist(str(tmp_path))
+
+    assert not (tmp_path / "vector_index.json").exists()
+
+    loaded = SimpleFaissVectorStore.from_persist_dir(str(tmp_path))
+    assert loaded.storage_format == "binary"
+    assert loaded.to_dict() == vector_store.to_dict()
+    assert query(loaded, nodes[7].embedding).ids[0] == "node_7"
+
+
+def test_persist_removes_files_of_previous_format(tmp_path):
+    nodes = create_nodes(50, 16)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=16, quantization="fp16", rerank_top_k=20)
+    vector_store.storage_format = "binary"
+    vector_store.add(nodes[:30])
+    vector_store.persist(str(tmp_path))
+
+    vector_store = SimpleFaissVectorStore.from_defaults(d=16)
+    vector_store.add(nodes)
+    vector_store.persist(str(tmp_path))
+
+    assert not (tmp_path / "vector_index.ids.npy").exists()
+    assert not (tmp_path / "vector_index.header.json").exists()
+    assert not (tmp_path / "vector_index_rerank.npz").exists()
+
+    loaded = SimpleFaissVectorStore.from_persist_dir(str(tmp_path))
+    assert loaded.storage_format == "json"
+    assert loaded.to_dict() == vector_store.to_dict()
+    assert query(loaded, nodes[40].embedding).ids[0] == "node_40"
+
+
+def test_delete_and_readd_ref_doc(tmp_path):
+    nodes = create_nodes(10, 8)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=8)
+    vector_store.add(nodes)
+
+    vector_store.delete("node_3")
+    assert "node_3" not in query(vector_store, nodes[3].embedding, top_k=10).ids
+
+    vector_store.add([nodes[3]])
+    vector_store.persist(str(tmp_path))
+
+    assert vector_store.client.ntotal == 10
+    assert query(vector_store, nodes[3].embedding).ids[0] == "node_3"
+    assert "node_3" in vector_store.to_dict()["metadata_dict"]
+    assert set(vector_store.to_dict()["vector_id_to_text_id"]) == set(range(11)) - {3}
+
+
+def test_vector_ids_continue_after_load(tmp_path):
+    nodes = create_nodes(10, 8)
+    vector_store = SimpleFaissVectorStore.from_defaults(d=8)
+    vector_store.add(nodes[:5])
+    vector_store.persist(str(tmp_path))
+
+    loaded = SimpleFaissVectorStore.from_persist_dir(str(tmp_path))
+    loaded.add(nodes[5:])
+
+    assert set(loaded.to_dict()["vector_id_to_text_id"]) == set(range(10))
+    assert loaded.client.ntotal == 10
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from voyageai.error import InvalidRequestError
+
+from moatless.index.retry_voyage_embedding import VoyageEmbeddingWithRetry
+
+
+class StandInVoyageServer(ThreadingHTTPServer):
+    """Local stand-in for the Voyage embeddings endpoint that counts a fixed number of tokens per word."""
+
+    def __init__(self, token_limit: int, tokens_per_word: int = 1, rate_limit_every: int = 0, latency: float = 0.01):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.token_limit = token_limit
+        self.tokens_per_word = tokens_per_word
+        self.rate_limit_every = rate_limit_every
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+
+        with server.lock:
+            server.requests += 1
+            request_number = server.requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+        time.sleep(server.latency)
+
+        tokens = sum(len(text.split()) * server.tokens_per_word for text in texts)
+        if server.rate_limit_every and request_number % server.rate_limit_every == 0:
+            status, body = 429, {"detail": "Rate limit exceeded"}
+        elif tokens > server.token_limit:
+            status, body = 400, {
+                "detail": f"The max allowed tokens per submitted batch is {server.token_limit}. "
+                f"Your batch has {tokens} tokens after truncation. Please lower the number of tokens in the batch."
+            }
+        else:
+            with server.lock:
+                server.batch_sizes.append(len(texts))
+            status, body = 200, {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "embedding": [float(len(text.split())), 1.0], "index": i}
+                    for i, text in enumerate(texts)
+                ],
+                "model": "voyage-code-3",
+                "usage": {"total_tokens": tokens},
+            }
+
+        with server.lock:
+            server.in_flight -= 1
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(**kwargs):
+        server = StandInVoyageServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def create_embed_model(server, **kwargs):
+    return VoyageEmbeddingWithRetry(
+        model_name="voyage-code-3",
+        voyage_api_key="test",
+        base_url=server.url,
+        truncation=True,
+        embed_batch_size=1000,
+        retry_max_wait=0.01,
+        **kwargs,
+    )
+
+
+def test_batches_are_packed_by_tokens_and_sent_concurrently(start_server):
+    server = start_server(token_limit=1000)
+    embed_model = create_embed_model(server, max_batch_tokens=200, max_concurrent_requests=3)
+
+    texts = [" ".join(["word"] * (i % 20 + 1)) for i in range(200)]
+    embeddings = embed_model.get_text_embedding_batch(texts)
+
+    # Embeddings are returned in the order of the texts
+    assert [embedding[0] for embedding in embeddings] == [float(i % 20 + 1) for i in range(200)]
+    assert len(server.batch_sizes) > 1
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_only_failing_batch_is_split(start_server):
+    # The server counts more tokens than the tokenizer, so the first batch is rejected
+    server = start_server(token_limit=100, tokens_per_word=10)
+    embed_model = create_embed_model(server, max_batch_tokens=24, max_concurrent_requests=2)
+
+    texts = ["one two three"] * 8 + ["one"] * 8
+    embeddings = embed_model.get_text_embedding_batch(texts)
+
+    assert [embedding[0] for embedding in embeddings] == [3.0] * 8 + [1.0] * 8
+    assert sorted(server.batch_sizes) == [2, 2, 2, 2, 8]
+
+
+def test_rate_limited_requests_are_retried(start_server):
+    server = start_server(token_limit=1000, rate_limit_every=3)
+    embed_model = create_embed_model(server, max_batch_tokens=10, max_concurrent_requests=4)
+
+    embeddings = embed_model.get_text_embedding_batch(["one two three"] * 30)
+
+    assert len(embeddings) == 30
+    assert server.requests > len(server.batch_sizes)
+    assert embed_model.get_query_embedding("one two") == [2.0, 1.0]
+
+
+def test_single_text_over_token_limit_raises(start_server):
+    server = start_server(token_limit=5)
+    embed_model = create_embed_model(server)
+
+    with pytest.raises(InvalidRequestError):
+        embed_model.get_text_embedding_batch(["this text has more than five words"])
+
+
+@pytest.mark.parametrize(
+    "model_name,token_limit",
+    [
+        ("voyage-3", 320_000),
+        ("voyage-3-large", 120_000),
+        ("voyage-3-lite", 1_000_000),
+        ("voyage-3.5", 320_000),
+        ("voyage-3.5-lite", 1_000_000),
+        ("voyage-code-3", 120_000),
+        ("voyage-unknown", 120_000),
+    ],
+)
+def test_default_max_batch_tokens_by_model(model_name, token_limit):
+    embed_model = VoyageEmbeddingWithRetry(model_name=model_name, voyage_api_key="test")
+    assert embed_model.max_batch_tokens == int(token_limit * 0.8)
@@ -0,0 +1,28 @@
+import gc
+
+from moatless.utils.blob_store import BlobStore, content_hash
+
+
+def test_blobs_are_interned_by_content():
+    store = BlobStore()
+
+    blob = store.put("def foo():\n    pass\n")
+    other = store.put("".join(["def foo():\n", "    pass\n"]))
+
+    assert other is blob
+    assert blob.hash == content_hash("def foo():\n    pass\n")
+    assert store.get(blob.hash) is blob
+    assert store.put("def bar():\n    pass\n") != blob
+
+
+def test_unreferenced_blobs_are_dropped():
+    store = BlobStore()
+
+    blob = store.put("content")
+    blob_hash = blob.hash
+    assert len(store) == 1
+
+    del blob
+    gc.collect()
+    assert store.get(blob_hash) is None
+    assert len(store) == 0
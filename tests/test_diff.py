@@ -0,0 +1,60 @@
+import difflib
+import random
+
+from moatless.utils.diff import diff_changes, replace_changes, unified_diff
+
+
+def apply_changes(a, b, changes):
+    result = []
+    i = 0
+    for i1, i2, j1, j2 in changes:
+        result.extend(a[i:i1])
+        result.extend(b[j1:j2])
+        i = i2
+    return result + a[i:]
+
+
+def test_diff_changes_are_minimal():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.choice("abc") + "\n" for _ in range(rng.randint(0, 30))]
+        b = [rng.choice("abc") + "\n" for _ in range(rng.randint(0, 30))]
+
+        changes = diff_changes(a, b)
+
+        assert apply_changes(a, b, changes) == b
+        # Myers finds a longest common subsequence
+        matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+        unchanged = len(a) - sum(i2 - i1 for i1, i2, _, _ in changes)
+        assert unchanged >= sum(block.size for block in matcher.get_matching_blocks())
+
+
+def test_unified_diff_format():
+    a = [f"line {i}\n" for i in range(50)]
+    b = list(a)
+    b[10] = "line 10 modified\n"
+    b.insert(30, "inserted\n")
+    del b[45]
+
+    assert "".join(unified_diff(a, b, "a/file.py", "b/file.py")) == "".join(
+        difflib.unified_diff(a, b, "a/file.py", "b/file.py")
+    )
+    assert "".join(unified_diff(a, a)) == ""
+
+
+def test_replace_changes():
+    rng = random.Random(1)
+    base = [f"line {i}\n" for i in range(100)]
+    current = list(base)
+    changes = []
+    for _ in range(50):
+        start = rng.randint(0, len(current))
+        end = min(len(current), start + rng.randint(0, 5))
+        replacement = [rng.choice(["new\n", "line 1\n", f"line {start}\n"]) for _ in range(rng.randint(0, 5))]
+        updated = current[:start] + replacement + current[end:]
+
+        changes = replace_changes(base, updated, changes, start, end, start + len(replacement))
+
+        assert apply_changes(base, updated, changes) == updated
+        assert changes == sorted(changes)
+        current = updated
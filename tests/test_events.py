@@ -0,0 +1,119 @@
+import threading
+import time
+
+from moatless.events import EventQueue, create_event
+
+
+def test_create_event_from_payload_factory():
+    calls = []
+
+    def payload():
+        calls.append(1)
+        return {"value": 1}
+
+    assert create_event("test", payload)["data"] == {"value": 1}
+    assert create_event("test", {"value": 2})["data"] == {"value": 2}
+    assert len(calls) == 1
+
+
+def test_event_queue_dispatches_in_order_without_blocking():
+    received = []
+    release = threading.Event()
+
+    def slow_handler(event):
+        release.wait()
+        received.append(event["data"]["i"])
+
+    event_queue = EventQueue([slow_handler], max_size=10)
+    start = time.perf_counter()
+    for i in range(5):
+        event_queue.put(create_event("test", {"i": i}))
+    assert time.perf_counter() - start < 0.5
+
+    release.set()
+    event_queue.close()
+    assert received == [0, 1, 2, 3, 4]
+
+
+def test_event_queue_drops_oldest_when_full():
+    received = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_handler(event):
+        started.set()
+        release.wait()
+        received.append(event["data"]["i"])
+
+    event_queue = EventQueue([slow_handler], max_size=2)
+    event_queue.put(create_event("test", {"i": 0}))
+    started.wait()
+
+    # Event 0 is being handled, so events 1 and 2 fill the queue and event 1 is dropped for event 3
+    for i in range(1, 4):
+        event_queue.put(create_event("test", {"i": i}))
+
+    release.set()
+    event_queue.close()
+    assert received == [0, 2, 3]
+    assert event_queue.dropped == 1
+
+
+def test_event_queue_never_drops_lifecycle_events():
+    received = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_handler(event):
+        started.set()
+        release.wait()
+        received.append(event["event_type"])
+
+    event_queue = EventQueue([slow_handler], max_size=2)
+    event_queue.put(create_event("tree_started", {}))
+    started.wait()
+
+    # The queued lifecycle event is kept and the iteration events are dropped for the completed event
+    for event_type in ["tree_completed", "tree_iteration", "tree_iteration", "tree_completed"]:
+        event_queue.put(create_event(event_type, {}))
+
+    release.set()
+    event_queue.close()
+    assert received == ["tree_started", "tree_completed", "tree_completed"]
+    assert event_queue.dropped == 2
+
+
+def test_event_queue_waits_when_full_of_lifecycle_events():
+    received = []
+    release = threading.Event()
+
+    def slow_handler(event):
+        release.wait()
+        received.append(event["event_type"])
+
+    event_queue = EventQueue([slow_handler], max_size=1)
+    event_queue.put(create_event("loop_started", {}))
+    event_queue.put(create_event("loop_error", {}))
+
+    put_thread = threading.Thread(target=event_queue.put, args=(create_event("loop_completed", {}),))
+    put_thread.start()
+    put_thread.join(0.05)
+    assert put_thread.is_alive()
+
+    release.set()
+    put_thread.join()
+    event_queue.close()
+    assert received == ["loop_started", "loop_error", "loop_completed"]
+    assert event_queue.dropped == 0
+
+
+def test_event_queue_continues_after_handler_error():
+    received = []
+
+    def failing_handler(event):
+        raise ValueError("Handler failed")
+
+    event_queue = EventQueue([failing_handler, lambda event: received.append(event)])
+    event_queue.put(create_event("test", {}))
+    event_queue.close()
+    assert len(received) == 1
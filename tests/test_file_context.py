@@ -2,7 +2,9 @@ import os
 import subprocess
 import tempfile
 import textwrap
-from unittest.mock import Mock
+import threading
+import time
+from unittest.mock import Mock, patch
 
 import pytest
 from git import Repo
@@ -11,7 +13,7 @@ from moatless.benchmark.swebench import setup_swebench_repo
 from moatless.benchmark.utils import get_moatless_instance
 from moatless.codeblocks import CodeBlock, CodeBlockType
 from moatless.codeblocks.module import Module
-from moatless.file_context import FileContext, ContextFile
+from moatless.file_context import FileContext, ContextFile, ContextSpan
 from moatless.repository.repository import InMemRepository
 
 
@@ -472,3 +474,183 @@ def test_context_file_status_indicators():
     dump = context_file.model_dump()
     assert "was_edited" not in dump
     assert "was_viewed" not in dump
+
+
+def test_contents_are_shared_between_file_contexts():
+    repo = InMemRepository({"test_file.txt": "Line 1\nLine 2\n"})
+    data = {"files": [{"file_path": "test_file.txt", "spans": [], "show_all_spans": True}]}
+
+    # Contents read separately are interned to the same string
+    context = FileContext.from_dict(data, repo=InMemRepository({"test_file.txt": "".join(["Line 1\n", "Line 2\n"])}))
+    other_context = FileContext.from_dict(data, repo=repo)
+    assert context.get_file("test_file.txt").content is other_context.get_file("test_file.txt").content
+
+    cloned_context = other_context.clone()
+    assert cloned_context.get_file("test_file.txt")._content_blob is other_context.get_file("test_file.txt")._content_blob
+    assert cloned_context.get_updated_files(other_context) == set()
+
+    cloned_context.get_file("test_file.txt").apply_changes("Line 1\nLine 2 modified\n")
+    assert cloned_context.get_updated_files(other_context) == {"test_file.txt"}
+    assert (
+        cloned_context.get_file("test_file.txt").content_hash != other_context.get_file("test_file.txt").content_hash
+    )
+
+    # The same change in another context results in the same content
+    cloned_context2 = other_context.clone()
+    cloned_context2.get_file("test_file.txt").apply_changes("Line 1\nLine 2 modified\n")
+    assert cloned_context2.get_updated_files(cloned_context) == set()
+    assert cloned_context2.get_file("test_file.txt").content is cloned_context.get_file("test_file.txt").content
+
+
+def test_patched_contents_are_derived_once():
+    content = "".join(f"line {i}\n" for i in range(100))
+    repo = InMemRepository({"test_file.txt": content})
+
+    context = FileContext(repo=repo)
+    context_file = context.add_file("test_file.txt", show_all_spans=True)
+    context_file.apply_changes(content.replace("line 10\n", "line 10 modified\n").replace("line 90\n", ""))
+    data = context.model_dump()
+
+    with patch.object(ContextFile, "_apply_hunks", autospec=True, side_effect=ContextFile._apply_hunks) as apply_hunks:
+        reloaded = [FileContext.from_dict(data, repo=repo) for _ in range(5)]
+        contents = [reloaded_context.get_file("test_file.txt").content for reloaded_context in reloaded]
+
+    assert apply_hunks.call_count == 1
+    assert all(reloaded_content is contents[0] for reloaded_content in contents)
+    assert contents[0] == context_file.content
+    assert "line 10 modified\n" in contents[0] and "line 90\n" not in contents[0]
+
+
+def test_apply_changes_with_replaced_lines():
+    content = "".join(f"line {i}\n" for i in range(200))
+    repo = InMemRepository({"test_file.txt": content})
+    context_file = ContextFile(file_path="test_file.txt", repo=repo)
+
+    edits = [(10, 12, ["line 10 modified\n"]), (150, 150, ["inserted\n", "inserted\n"]), (9, 11, ["replaced\n"])]
+    with patch.object(ContextFile, "generate_patch", autospec=True) as generate_patch:
+        for start_line, end_line, new_lines in edits:
+            lines = context_file.content.splitlines(keepends=True)
+            updated_content = "".join(lines[:start_line] + new_lines + lines[end_line:])
+            context_file.apply_changes(updated_content, replaced_lines=(start_line, end_line))
+            assert context_file.content == updated_content
+
+    generate_patch.assert_not_called()
+    assert context_file.patch == context_file.generate_patch(content, context_file.content)
+
+    # Falls back to diffing the full content if the rest of the content was changed
+    context_file.apply_changes(updated_content.replace("line 1\n", ""), replaced_lines=(100, 101))
+    assert context_file.content == updated_content.replace("line 1\n", "")
+
+
+def test_to_prompt_is_cached_until_spans_or_content_change():
+    content = "def foo():\n    return 1\n\n\ndef bar():\n    return 2\n"
+    repo = InMemRepository({"test_file.py": content})
+    file_context = FileContext(repo=repo)
+    file_context.add_span_to_context("test_file.py", "foo")
+    context_file = file_context.get_file("test_file.py")
+
+    with patch.object(ContextFile, "_render_prompt", autospec=True, side_effect=ContextFile._render_prompt) as render:
+        prompt = context_file.to_prompt(show_outcommented_code=True)
+        assert context_file.to_prompt(show_outcommented_code=True) == prompt
+        assert render.call_count == 1
+
+        assert "def foo():" in prompt and "def bar():" not in prompt
+
+        context_file.to_prompt(show_outcommented_code=True, show_line_numbers=True)
+        assert render.call_count == 2
+
+        file_context.add_span_to_context("test_file.py", "bar")
+        assert "def bar():" in context_file.to_prompt(show_outcommented_code=True)
+        assert render.call_count == 3
+
+        context_file.apply_changes(content.replace("return 2", "return 3"))
+        assert "return 3" in context_file.to_prompt(show_outcommented_code=True)
+        assert render.call_count == 4
+
+        # Clones with the same content and spans reuse the rendered prompt
+        assert file_context.clone().get_file("test_file.py").to_prompt(show_outcommented_code=True) == (
+            context_file.to_prompt(show_outcommented_code=True)
+        )
+        assert render.call_count == 4
+
+
+def test_span_index():
+    content = "".join(f"def function_{i}():\n    return {i}\n\n\n" for i in range(50))
+    repo = InMemRepository({"test_file.py": content})
+    context_file = ContextFile(file_path="test_file.py", repo=repo)
+
+    assert context_file.add_span("function_1")
+    assert not context_file.add_span("function_1", tokens=10)
+    assert context_file.get_span("function_1").tokens == 10
+    assert context_file.add_span("function_3")
+    assert context_file.span_ids == {"function_1", "function_3"}
+
+    # Lines 5-6 are function_1 and lines 13-14 function_3
+    assert context_file.lines_is_in_context(5, 6)
+    assert context_file.lines_is_in_context(5, 13)
+    assert not context_file.lines_is_in_context(5, 9)
+
+    # The index follows changes made directly to the spans list
+    context_file.spans.append(ContextSpan(span_id="function_2"))
+    assert context_file.has_span("function_2")
+    assert context_file.lines_is_in_context(9, 10)
+
+    context_file.remove_span("function_1")
+    assert not context_file.has_span("function_1")
+    assert not context_file.lines_is_in_context(5, 6)
+    assert [span.span_id for span in context_file.spans] == ["function_3", "function_2"]
+
+
+def test_state_hash():
+    repo = InMemRepository({"a.py": "def foo():\n    pass\n", "b.py": "def bar():\n    pass\n"})
+
+    file_context = FileContext(repo=repo)
+    file_context.add_span_to_context("a.py", "foo")
+    file_context.add_span_to_context("b.py", "bar")
+
+    other_context = FileContext(repo=repo)
+    other_context.add_span_to_context("b.py", "bar")
+    other_context.add_span_to_context("a.py", "foo")
+    assert file_context.state_hash() == other_context.state_hash()
+
+    other_context.get_file("b.py").remove_span("bar")
+    assert file_context.state_hash() != other_context.state_hash()
+
+
+
+class _SlowPopDict(dict):
+    """Yields to other threads before popping, like a thread switch between picking and evicting an entry."""
+
+    def pop(self, *args):
+        time.sleep(0.001)
+        return super().pop(*args)
+
+
+def test_shared_prompt_cache_is_thread_safe():
+    file_context = FileContext(repo=InMemRepository({"test_file.py": "def foo():\n    return 1\n"}))
+    file_context.add_span_to_context("test_file.py", "foo")
+    clones = [file_context.clone().get_file("test_file.py") for _ in range(8)]
+    assert all(clone._prompt_cache is clones[0]._prompt_cache for clone in clones)
+
+    prompt_cache = _SlowPopDict()
+    for clone in clones:
+        clone._prompt_cache = prompt_cache
+
+    errors = []
+
+    def render(thread_id: int, context_file: ContextFile):
+        try:
+            # Different max tokens render different prompts, so the cache keeps evicting entries
+            for i in range(50):
+                context_file.to_prompt(max_tokens=1000 * (thread_id + 1) + i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render, args=(i, clone)) for i, clone in enumerate(clones)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(prompt_cache) <= 16
@@ -6,7 +6,7 @@ from moatless.actions.action import Action
 from moatless.actions.finish import FinishArgs
 from moatless.actions.schema import Observation, ActionArguments
 from moatless.file_context import FileContext
-from moatless.node import ActionStep, Node
+from moatless.node import ActionStep, Node, generate_ascii_node, generate_ascii_tree
 from moatless.message_history import MessageHistoryType
 from moatless.repository.repository import InMemRepository
 
@@ -195,3 +195,19 @@ def method3():
     assert "def method3()" in messages[8].content
 
     print("\n".join([m.model_dump_json(indent=2) for m in messages]))
+
+
+def test_generate_ascii_node():
+    root = Node(node_id=0, max_expansions=3)
+    child = Node(node_id=1, max_expansions=2)
+    grandchild = Node(node_id=2, max_expansions=2)
+    root.add_child(child)
+    child.add_child(grandchild)
+
+    line = generate_ascii_node(grandchild, use_color=False)
+    assert line.startswith("    └── Node2 ()")
+    assert line.endswith("<- Node1")
+
+    # The node is rendered as in the full tree
+    tree_line = generate_ascii_tree(root, use_color=False).splitlines()[-1]
+    assert tree_line.split("└──   ")[1] in line
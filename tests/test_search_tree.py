@@ -0,0 +1,414 @@
+import copy
+import json
+import logging
+import random
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from pydantic import PrivateAttr
+
+from moatless.actions import Finish
+from moatless.actions.finish import FinishArgs
+from moatless.agent.agent import ActionAgent
+from moatless.completion.base import BaseCompletionModel, LLMResponseFormat
+from moatless.completion.model import Completion, Usage
+from moatless.file_context import FileContext
+from moatless.node import Node, Reward
+from moatless.actions.schema import Observation
+from moatless.repository.repository import InMemRepository
+from moatless.search_tree import SearchTree
+from moatless.selector import BaseSelector
+from moatless.selector.uct import UCTSelector
+from moatless.tree_journal import get_journal_path, read_journal
+from moatless.value_function.base import BaseValueFunction
+
+
+class StopSearch(Exception):
+    pass
+
+
+class RandomValueFunction(BaseValueFunction):
+    _rng: random.Random = PrivateAttr(default_factory=lambda: random.Random(3))
+
+    def get_reward(self, node: Node):
+        completion = Completion(model="test-model", usage=Usage(prompt_tokens=5, completion_tokens=1))
+        return Reward(value=self._rng.randint(-100, 100)), completion
+
+
+class NodeSeededValueFunction(BaseValueFunction):
+    """Rewards that only depend on the node id, so they don't depend on the order nodes are evaluated in."""
+
+    def get_reward(self, node: Node):
+        return Reward(value=random.Random(node.node_id).randint(-100, 100)), None
+
+
+def _create_search_tree(
+    persist_path: str,
+    max_iterations: int = 30,
+    selector: BaseSelector | None = None,
+    value_function: BaseValueFunction | None = None,
+    max_workers: int = 1,
+    use_transpositions: bool = False,
+) -> SearchTree:
+    repository = InMemRepository({"file.py": "def foo():\n    pass\n"})
+    agent = ActionAgent(
+        completion=BaseCompletionModel.create(response_format=LLMResponseFormat.TOOLS, model="test-model"),
+        system_prompt="You're an AI assistant",
+        actions=[Finish()],
+    )
+    return SearchTree.create(
+        message="Fix the bug",
+        file_context=FileContext(repo=repository),
+        repository=repository,
+        agent=agent,
+        selector=selector or BaseSelector(),
+        value_function=value_function or RandomValueFunction(),
+        max_expansions=3,
+        max_iterations=max_iterations,
+        max_depth=10,
+        persist_path=persist_path,
+        max_workers=max_workers,
+        use_transpositions=use_transpositions,
+    )
+
+
+def _run(search_tree: SearchTree, stop_after: int | None = None):
+    rng = random.Random(3)
+    executed = []
+
+    def run(node: Node):
+        if stop_after is not None and len(executed) >= stop_after:
+            raise StopSearch()
+        executed.append(node)
+        node.action = FinishArgs(thoughts="done", finish_reason=f"node {node.node_id}")
+        node.observation = Observation(message=f"Executed node {node.node_id}", terminal=rng.random() < 0.3)
+        node.terminal = node.observation.terminal
+        node.action_steps[-1].completion = Completion(model="test-model", usage=Usage(prompt_tokens=10))
+        node.file_context.add_span_to_context("file.py", "foo")
+
+    with patch.object(ActionAgent, "run", side_effect=run):
+        return search_tree.run_search()
+
+
+def _dump_nodes(root: Node) -> list:
+    return [node.model_dump(exclude={"parent", "children"}) for node in root.get_all_nodes()]
+
+
+def test_journal_is_replayed_on_snapshot(tmp_path):
+    persist_path = str(tmp_path / "trajectory.json")
+    search_tree = _create_search_tree(persist_path)
+
+    with pytest.raises(StopSearch):
+        _run(search_tree, stop_after=12)
+
+    records = read_journal(get_journal_path(persist_path))
+    assert records[0]["type"] == "snapshot"
+    assert any(record["type"] == "node" for record in records)
+    assert any(record["type"] == "update" for record in records)
+
+    # The last expanded node was not executed and persisted when the search stopped
+    search_tree.root.truncate_children_by_id(search_tree.unique_id - 1)
+
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository)
+    assert restored.unique_id == search_tree.unique_id - 1
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
+    assert [node.node_id for node in restored.root.get_all_nodes()] == [
+        node.node_id for node in search_tree.root.get_all_nodes()
+    ]
+
+    # The node tree can be reconstructed from the snapshot and journal as well
+    with open(persist_path) as f:
+        root_data = json.load(f)["root"]
+    root = Node.reconstruct(root_data, repo=search_tree.repository, journal=records[1:])
+    assert _dump_nodes(root) == _dump_nodes(search_tree.root)
+
+
+def test_journal_is_compacted_when_search_is_done(tmp_path):
+    persist_path = str(tmp_path / "trajectory.json")
+    search_tree = _create_search_tree(persist_path)
+    _run(search_tree)
+
+    assert len(read_journal(get_journal_path(persist_path))) == 1
+    with open(persist_path) as f:
+        tree_data = json.load(f)
+
+    full_tree = search_tree.model_dump()
+    assert tree_data["root"] == json.loads(json.dumps(full_tree["root"]))
+
+
+def test_journal_from_another_snapshot_is_ignored(tmp_path):
+    persist_path = str(tmp_path / "trajectory.json")
+    search_tree = _create_search_tree(persist_path)
+
+    with pytest.raises(StopSearch):
+        _run(search_tree, stop_after=8)
+
+    journal_path = get_journal_path(persist_path)
+    with open(journal_path) as f:
+        journal = f.read()
+
+    # Like when the process stopped after a new snapshot was written but before the journal was truncated
+    search_tree.persist(persist_path)
+    with open(journal_path, "w") as f:
+        f.write(journal)
+
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository)
+    assert restored.unique_id == search_tree.unique_id
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
+
+
+def test_persist_binary_trajectory(tmp_path):
+    persist_path = str(tmp_path / "trajectory.trajz")
+    search_tree = _create_search_tree(persist_path)
+    _run(search_tree)
+
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository)
+    assert restored.unique_id == search_tree.unique_id
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
+
+
+@pytest.mark.parametrize("file_name", ["trajectory.json", "trajectory.trajz"])
+def test_lazy_load(tmp_path, file_name):
+    persist_path = str(tmp_path / file_name)
+    search_tree = _create_search_tree(persist_path)
+    _run(search_tree)
+
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository, lazy=True)
+    assert restored.total_usage().prompt_tokens == search_tree.total_usage().prompt_tokens
+
+    node = restored.get_node_by_id(3)
+    assert "file_context" not in node.__dict__
+    assert node.terminal == search_tree.get_node_by_id(3).terminal
+
+    # Fields are parsed on first access
+    assert node.file_context.has_file("file.py")
+    assert "file_context" in node.__dict__
+    assert "completions" not in node.__dict__
+    assert node.observation.message == "Executed node 3"
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
+
+
+@pytest.mark.parametrize("file_name", ["trajectory.json", "trajectory.trajz"])
+def test_copy_lazy_node(tmp_path, file_name):
+    persist_path = str(tmp_path / file_name)
+    search_tree = _create_search_tree(persist_path)
+    _run(search_tree)
+
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository, lazy=True)
+    node = restored.get_node_by_id(3)
+    assert "file_context" not in node.__dict__
+    node_copy = node.model_copy()
+    assert node_copy.file_context.has_file("file.py")
+    assert node.file_context.has_file("file.py")
+
+    deep_copy = copy.deepcopy(restored.get_node_by_id(4))
+    assert deep_copy.file_context.has_file("file.py")
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
+
+
+def test_search_with_uct_selector(tmp_path):
+    search_tree = _create_search_tree(str(tmp_path / "trajectory.json"), selector=UCTSelector(algorithm="puct"))
+    _run(search_tree)
+
+    nodes = search_tree.root.get_all_nodes()
+    assert len(nodes) == search_tree.unique_id + 1
+    assert len(search_tree.root.children) == 3
+    assert max(node.get_depth() for node in nodes) > 1
+
+
+def _run_parallel(search_tree: SearchTree) -> int:
+    """Run the search with an agent that sleeps for a random time, and return the max number of concurrent runs."""
+    lock = threading.Lock()
+    running = []
+    max_running = 0
+
+    def run(node: Node):
+        nonlocal max_running
+        with lock:
+            running.append(node)
+            max_running = max(max_running, len(running))
+
+        rng = random.Random(node.node_id)
+        time.sleep(random.random() * 0.01)
+        node.action = FinishArgs(thoughts="done", finish_reason=f"node {node.node_id}")
+        node.observation = Observation(message=f"Executed node {node.node_id}", terminal=rng.random() < 0.3)
+        node.terminal = node.observation.terminal
+        node.file_context.add_span_to_context("file.py", "foo")
+
+        with lock:
+            running.remove(node)
+
+    with patch.object(ActionAgent, "run", side_effect=run):
+        search_tree.run_search()
+    return max_running
+
+
+def test_parallel_search_is_deterministic(tmp_path):
+    dumps = []
+    for i in range(2):
+        persist_path = str(tmp_path / f"trajectory_{i}.json")
+        search_tree = _create_search_tree(
+            persist_path,
+            max_iterations=40,
+            selector=UCTSelector(),
+            value_function=NodeSeededValueFunction(),
+            max_workers=4,
+        )
+        assert _run_parallel(search_tree) > 1
+
+        assert search_tree.root.get_tree_stats().in_flight_count == 0
+        assert len(search_tree.root.get_all_nodes()) == 40
+        dumps.append(_dump_nodes(search_tree.root))
+
+        restored = SearchTree.from_file(persist_path, repository=search_tree.repository)
+        assert _dump_nodes(restored.root) == dumps[-1]
+
+    assert dumps[0] == dumps[1]
+
+
+class CountingValueFunction(NodeSeededValueFunction):
+    evaluated: list = []
+
+    def get_reward(self, node: Node):
+        self.evaluated.append(node.node_id)
+        return super().get_reward(node)
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_search_with_transpositions(tmp_path, max_workers):
+    value_function = CountingValueFunction()
+    search_tree = _create_search_tree(
+        str(tmp_path / "trajectory.json"),
+        selector=UCTSelector(),
+        value_function=value_function,
+        max_workers=max_workers,
+        use_transpositions=True,
+    )
+    events = []
+    search_tree.add_event_handler(lambda event: events.append(event))
+
+    def run(node: Node):
+        # Two of the four actions lead to the same state
+        span_id = ["foo", "foo", "bar", None][node.node_id % 4]
+        node.action = FinishArgs(thoughts="done", finish_reason=f"node {node.node_id}")
+        node.observation = Observation(message=f"Viewed {span_id}")
+        if span_id:
+            node.file_context.add_span_to_context("file.py", span_id)
+
+    with patch.object(ActionAgent, "run", side_effect=run):
+        search_tree.run_search()
+
+    nodes = search_tree.root.get_all_nodes()[1:]
+    transposed = [node for node in nodes if node.is_duplicate]
+    assert transposed
+    assert len(value_function.evaluated) == len(nodes) - len(transposed)
+
+    for node in transposed:
+        assert node.node_id not in value_function.evaluated
+        assert not node.children
+        equivalent_nodes = [
+            other for other in nodes if other.node_id in value_function.evaluated and other.state_hash() == node.state_hash()
+        ]
+        assert node.reward == equivalent_nodes[0].reward
+
+    completed = [event for event in events if event["event_type"] == "tree_completed"][0]
+    assert completed["data"]["transpositions"] == len(transposed)
+    assert completed["data"]["saved_evaluations"] == len(transposed)
+
+
+def test_tree_is_only_rendered_when_logged(tmp_path):
+    search_tree = _create_search_tree(str(tmp_path / "trajectory.json"), max_iterations=10)
+    events = []
+    search_tree.add_event_handler(lambda event: events.append(event))
+
+    search_logger = logging.getLogger("moatless.search_tree")
+    level = search_logger.level
+    search_logger.setLevel(logging.WARNING)
+    try:
+        with patch("moatless.search_tree.generate_ascii_tree") as generate_tree:
+            _run(search_tree)
+    finally:
+        search_logger.setLevel(level)
+    generate_tree.assert_not_called()
+
+    deltas = [event["data"] for event in events if event["event_type"] == "tree_iteration_delta"]
+    assert len(deltas) == search_tree.unique_id
+    for delta in deltas:
+        node = search_tree.get_node_by_id(delta["node"]["node_id"])
+        assert delta["node"]["parent_id"] == node.parent.node_id
+        assert [updated["node_id"] for updated in delta["updated_nodes"]] == [n.node_id for n in node.get_trajectory()]
+
+
+def test_event_payloads_are_only_created_with_handlers(tmp_path):
+    search_tree = _create_search_tree(str(tmp_path / "trajectory.json"), max_iterations=10)
+    with patch.object(SearchTree, "_iteration_data") as iteration_data:
+        _run(search_tree)
+    iteration_data.assert_not_called()
+
+
+def test_events_are_dispatched_through_queue(tmp_path):
+    event_types = {}
+    for event_queue_size in [None, 1000]:
+        search_tree = _create_search_tree(str(tmp_path / f"trajectory_{event_queue_size}.json"))
+        search_tree.event_queue_size = event_queue_size
+        events = []
+
+        def slow_handler(event):
+            time.sleep(0.001)
+            events.append(event)
+
+        search_tree.add_event_handler(slow_handler)
+        _run(search_tree)
+        event_types[event_queue_size] = [event["event_type"] for event in events]
+
+    # All events are dispatched in order before the search returns
+    assert event_types[1000] == event_types[None]
+    assert event_types[1000][-1] == "tree_completed"
+
+
+def test_parallel_search_calls_event_handlers_without_the_tree_lock(tmp_path):
+    search_tree = _create_search_tree(
+        str(tmp_path / "trajectory.json"), selector=UCTSelector(), value_function=NodeSeededValueFunction(), max_workers=4
+    )
+    locked_events = []
+
+    def handler(event):
+        # Another thread can take the lock only if the thread calling the handler doesn't hold it
+        def try_lock():
+            if search_tree._lock.acquire(timeout=1):
+                search_tree._lock.release()
+            else:
+                locked_events.append(event["event_type"])
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    search_tree.add_event_handler(handler)
+    assert _run_parallel(search_tree) > 1
+    assert not locked_events
+
+
+def test_parallel_search_without_journal_persists_when_no_simulations_are_in_flight(tmp_path):
+    persist_path = str(tmp_path / "trajectory.json")
+    search_tree = _create_search_tree(
+        persist_path, selector=UCTSelector(), value_function=NodeSeededValueFunction(), max_workers=4
+    )
+    search_tree.persist_journal = False
+
+    stats = search_tree.root.get_tree_stats()
+    in_flight_counts = []
+    persist = SearchTree.persist
+
+    def persist_tree(self, *args, **kwargs):
+        in_flight_counts.append(stats.in_flight_count)
+        return persist(self, *args, **kwargs)
+
+    with patch.object(SearchTree, "persist", persist_tree):
+        assert _run_parallel(search_tree) > 1
+
+    assert in_flight_counts and set(in_flight_counts) == {0}
+    restored = SearchTree.from_file(persist_path, repository=search_tree.repository)
+    assert _dump_nodes(restored.root) == _dump_nodes(search_tree.root)
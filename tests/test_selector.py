@@ -0,0 +1,124 @@
+import math
+import random
+
+import pytest
+
+from moatless.node import Node
+from moatless.selector import BaseSelector
+from moatless.selector.uct import UCTSelector
+
+
+def _create_tree(nodes: int = 300, seed: int = 5) -> Node:
+    rng = random.Random(seed)
+    root = Node(node_id=0, max_expansions=3, visits=1, value=rng.uniform(-100, 100))
+    stats = root.get_tree_stats()
+    all_nodes = [root]
+    for node_id in range(1, nodes):
+        parent = rng.choice([node for node in all_nodes if node.is_expandable()])
+        node = Node(node_id=node_id, max_expansions=3, is_duplicate=rng.random() < 0.1)
+        parent.add_child(node)
+        all_nodes.append(node)
+
+        if rng.random() < 0.8:
+            node.visits = rng.randint(1, 20)
+            node.value = rng.uniform(-100, 100) * node.visits
+        stats.refresh(node)
+    return root
+
+
+def _reference_score(selector: UCTSelector, node: Node) -> float:
+    parent_visits = node.parent.visits if node.parent else node.visits
+    score = (node.value / node.visits if node.visits else 0) / selector.reward_scale
+    if selector.algorithm == "puct":
+        prior = 1 / node.parent.max_expansions if node.parent else 1
+        score += selector.exploration_weight * prior * math.sqrt(parent_visits) / (node.visits + 1)
+    else:
+        score += selector.exploration_weight * math.sqrt(math.log(parent_visits + 1) / (node.visits + 1))
+    score -= selector.depth_penalty * node.get_depth()
+    score -= selector.duplicate_penalty * sum(1 for child in node.children if child.is_duplicate)
+    return score
+
+
+@pytest.mark.parametrize("algorithm", ["uct", "puct"])
+def test_uct_selector_matches_reference(algorithm):
+    root = _create_tree()
+    selector = UCTSelector(algorithm=algorithm, exploration_weight=1.5, depth_penalty=0.01, duplicate_penalty=0.2)
+
+    expandable_nodes = root.get_expandable_descendants()
+    expected = max(expandable_nodes, key=lambda node: _reference_score(selector, node))
+    assert selector.select_from_tree(root) is expected
+    assert selector.select(expandable_nodes) is expected
+
+
+def test_uct_selector_follows_backpropagation():
+    root = _create_tree()
+    selector = UCTSelector()
+    stats = root.get_tree_stats()
+
+    selected = selector.select_from_tree(root)
+    while selected is not None and selected is selector.select_from_tree(root):
+        # A low reward on the selected node makes another node score higher
+        selected.visits += 5
+        selected.value -= 500
+        stats.refresh_visits(selected)
+
+    expandable_nodes = root.get_expandable_descendants()
+    expected = max(expandable_nodes, key=lambda node: _reference_score(selector, node))
+    assert selector.select_from_tree(root) is expected
+
+
+def test_uct_selector_round_trip():
+    selector = UCTSelector(algorithm="puct", exploration_weight=2.0)
+    data = selector.model_dump()
+    assert data["selector_class"] == "moatless.selector.uct.UCTSelector"
+    assert BaseSelector.model_validate(data) == selector
+
+
+def test_uct_selector_skips_nodes_in_flight():
+    root = _create_tree()
+    selector = UCTSelector(virtual_loss=1.0)
+    stats = root.get_tree_stats()
+
+    selected = []
+    for _ in range(5):
+        node = selector.select_from_tree(root)
+        child = Node(node_id=1000 + len(selected), max_expansions=3)
+        node.add_child(child)
+        stats.start_simulation(child)
+        selected.append((node, child))
+
+    # Neither the nodes in flight nor their parents are selected again
+    assert len({node.node_id for node, _ in selected}) == 5
+    assert stats.arrays.virtual_losses[stats.arrays.row(0)] == 5
+
+    for node, child in selected:
+        stats.finish_simulation(child)
+    assert stats.in_flight_count == 0
+    assert stats.arrays.virtual_losses[: stats.arrays.size].sum() == 0
+    assert BaseSelector().select_from_tree(root) is root.get_expandable_descendants()[0]
+
+
+
+def test_uct_selector_ties_go_to_first_created_node():
+    root = Node(node_id=0, max_expansions=2, visits=1)
+    stats = root.get_tree_stats()
+    selector = UCTSelector()
+    first, second = Node(node_id=1, max_expansions=2, visits=1), Node(node_id=2, max_expansions=2, visits=1)
+    root.add_child(first)
+    root.add_child(second)
+
+    # Both children have the same score
+    for rebuild in (False, True):
+        if rebuild:
+            stats.invalidate()
+        assert selector.select_from_tree(root) is first
+        assert selector.select([second, first]) is first
+
+    # A child added to the first node after its sibling is registered before the sibling on a rebuild
+    first.max_expansions = 1
+    first.add_child(Node(node_id=3, max_expansions=2, visits=1))
+    stats.refresh(first)
+    for rebuild in (False, True):
+        if rebuild:
+            stats.invalidate()
+        assert selector.select_from_tree(root) is second
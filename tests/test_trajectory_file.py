@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from moatless.utils.trajectory_file import TrajectoryReader, is_binary_trajectory, write_trajectory
+
+
+def _nodes():
+    completion = {
+        "model": "test-model",
+        "input": [{"role": "user", "content": "Fix the bug"}],
+        "usage": {"completion_cost": 0.5, "prompt_tokens": 100, "completion_tokens": 10},
+    }
+    return [
+        {"node_id": 0, "parent_id": None, "visits": 2, "value": 50.0, "user_message": "Fix the bug"},
+        {
+            "node_id": 1,
+            "parent_id": 0,
+            "visits": 1,
+            "value": 50.0,
+            "reward": {"value": 50, "explanation": "Good"},
+            "action_steps": [
+                {
+                    "action": {"finish_reason": "done", "action_args_class": "moatless.actions.finish.FinishArgs"},
+                    "observation": {"message": "Finished"},
+                    "completion": completion,
+                }
+            ],
+            "completions": {"value_function": completion},
+            "file_context": {"files": [{"file_path": "file.py", "spans": [], "patch": None}]},
+        },
+    ]
+
+
+def test_write_and_read_trajectory(tmp_path):
+    file_path = str(tmp_path / "trajectory.trajz")
+    write_trajectory(file_path, _nodes(), metadata={"metadata": {"instance_id": "test"}})
+
+    assert is_binary_trajectory(file_path)
+    with TrajectoryReader(file_path) as reader:
+        assert reader.metadata == {"metadata": {"instance_id": "test"}}
+        assert reader.node_ids == [0, 1]
+        assert reader.read_nodes() == _nodes()
+
+        header = reader.read_node(1, fields=[])
+        assert header["reward"] == {"value": 50, "explanation": "Good"}
+        assert "action_steps" not in header and "completions" not in header
+
+        node = reader.read_node(1, fields=["file_context"])
+        assert node["file_context"] == _nodes()[1]["file_context"]
+        assert "completions" not in node
+
+        summaries = reader.read_summaries()
+        assert summaries[0]["parent_id"] is None
+        assert summaries[1]["reward"] == 50
+        assert summaries[1]["action_args_class"] == "FinishArgs"
+        assert summaries[1]["usage"]["prompt_tokens"] == 200
+        assert summaries[1]["usage"]["completion_cost"] == 1.0
+
+
+def test_incomplete_trajectory_is_rejected(tmp_path):
+    file_path = str(tmp_path / "trajectory.trajz")
+    write_trajectory(file_path, _nodes())
+
+    with open(file_path, "rb") as f:
+        data = f.read()
+    with open(file_path, "wb") as f:
+        f.write(data[:-10])
+
+    with pytest.raises(ValueError):
+        TrajectoryReader(file_path)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="Counts open files in /proc")
+def test_lazy_sections_are_read_after_reader_is_closed(tmp_path):
+    file_path = str(tmp_path / "trajectory.trajz")
+    write_trajectory(file_path, _nodes())
+
+    with TrajectoryReader(file_path) as reader:
+        node_data = reader.read_node(1, lazy=True)
+
+    open_files = len(os.listdir("/proc/self/fd"))
+    assert node_data["file_context"].load() == _nodes()[1]["file_context"]
+    assert node_data["action_steps"].load() == _nodes()[1]["action_steps"]
+    assert len(os.listdir("/proc/self/fd")) == open_files
+
+    # Offsets in a replaced file are not valid anymore
+    write_trajectory(file_path, list(reversed(_nodes())))
+    with pytest.raises(ValueError, match="replaced"):
+        node_data["completions"].load()
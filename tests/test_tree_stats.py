@@ -0,0 +1,75 @@
+import random
+
+from moatless.actions.finish import FinishArgs
+from moatless.completion.model import Completion, Usage
+from moatless.node import Node, Reward
+
+
+def _finished_nodes_by_traversal(root: Node) -> list[Node]:
+    parent_ids = set()
+    finished_nodes = []
+    for node in root.get_all_nodes():
+        if node.is_finished() and node.parent.node_id not in parent_ids:
+            parent_ids.add(node.parent.node_id)
+            finished_nodes.append(node)
+    return finished_nodes
+
+
+def test_tree_stats_match_traversal():
+    rng = random.Random(7)
+    root = Node(node_id=0, max_expansions=3)
+    stats = root.get_tree_stats()
+    nodes = [root]
+
+    for node_id in range(1, 200):
+        parent = rng.choice([node for node in nodes if not node.is_finished()])
+        node = Node(node_id=node_id, max_expansions=3)
+        parent.add_child(node)
+        nodes.append(node)
+
+        if rng.random() < 0.2:
+            node.action = FinishArgs(thoughts="", finish_reason="done")
+        node.completions["build_action"] = Completion(
+            model="test", usage=Usage(completion_cost=0.01, prompt_tokens=100, completion_tokens=rng.randint(1, 50))
+        )
+        if rng.random() < 0.7:
+            node.reward = Reward(value=rng.randint(-100, 100))
+        stats.refresh(node)
+
+        assert stats.node_count == len(root.get_all_nodes())
+        finished_nodes = _finished_nodes_by_traversal(root)
+        assert stats.finished_nodes() == finished_nodes
+        assert stats.finished_count == len(finished_nodes)
+        assert stats.max_finished_reward() == max((n.reward.value for n in finished_nodes if n.reward), default=None)
+        assert stats.max_reward() == max((n.reward.value if n.reward else 0) for n in root.get_all_nodes())
+        assert stats.leaf_count == len(root.get_leaf_nodes())
+        assert stats.has_expandable_nodes() == bool(root.get_expandable_descendants())
+
+    total_usage = root.total_usage()
+    assert stats.total_usage().prompt_tokens == total_usage.prompt_tokens
+    assert stats.total_usage().completion_tokens == total_usage.completion_tokens
+    assert abs(stats.total_usage().completion_cost - total_usage.completion_cost) < 1e-9
+    assert stats.get_node(42) is nodes[42]
+
+    # Lowering the best reward and removing nodes are picked up
+    best = max(nodes, key=lambda n: n.reward.value if n.reward else 0)
+    best.reward = Reward(value=-100)
+    stats.refresh(best)
+    assert stats.max_reward() == max((n.reward.value if n.reward else 0) for n in root.get_all_nodes())
+
+    root.truncate_children_by_id(100)
+    assert stats.node_count == len(root.get_all_nodes())
+    assert stats.finished_nodes() == _finished_nodes_by_traversal(root)
+    assert stats.get_node(150) is None
+
+
+def test_rebuilt_tree_stats_keep_sibling_order():
+    root = Node(node_id=0, max_expansions=3)
+    stats = root.get_tree_stats()
+    for node_id in range(1, 4):
+        root.add_child(Node(node_id=node_id, max_expansions=3))
+        root.children[-1].add_child(Node(node_id=node_id + 10, max_expansions=3))
+
+    node_ids = list(stats.arrays.node_ids[: stats.arrays.size])
+    stats.invalidate()
+    assert list(stats.arrays.node_ids[: stats.arrays.size]) == node_ids == [0, 1, 11, 2, 12, 3, 13]
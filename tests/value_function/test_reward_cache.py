@@ -0,0 +1,139 @@
+from unittest.mock import patch
+
+from moatless.actions.finish import FinishArgs
+from moatless.actions.schema import Observation
+from moatless.completion.base import BaseCompletionModel, CompletionResponse, LLMResponseFormat
+from moatless.completion.model import Completion, Usage
+from moatless.file_context import FileContext
+from moatless.node import Node, Reward
+from moatless.repository.repository import InMemRepository
+from moatless.value_function.base import BaseValueFunction
+from moatless.value_function.cache import CACHED_FLAG, CachedValueFunction, reward_cache_key
+
+
+class LLMValueFunction(BaseValueFunction):
+    completion_model: BaseCompletionModel
+
+    def _create_messages(self, node: Node) -> list[dict]:
+        return [{"role": "user", "content": f"Rate the result: {node.observation.message}"}]
+
+    def get_cache_key(self, node: Node):
+        return reward_cache_key(self._create_messages(node), self.completion_model)
+
+    def get_reward(self, node: Node):
+        response = self.completion_model.create_completion(self._create_messages(node))
+        return Reward(value=int(response.text_response)), response.completion
+
+
+class StateValueFunction(BaseValueFunction):
+    """A completion based value function using the default cache key."""
+
+    completion_model: BaseCompletionModel
+
+    def get_reward(self, node: Node):
+        messages = [{"role": "user", "content": f"Rate the result: {node.observation.message}"}]
+        response = self.completion_model.create_completion(messages)
+        return Reward(value=int(response.text_response)), response.completion
+
+
+class FixedValueFunction(BaseValueFunction):
+    def get_reward(self, node: Node):
+        return Reward(value=50), None
+
+
+def _create_node(node_id: int, message: str) -> Node:
+    node = Node(node_id=node_id)
+    node.action = FinishArgs(thoughts="done", finish_reason="done")
+    node.observation = Observation(message=message)
+    return node
+
+
+def _create_value_function(cache_path: str, temperature: float = 0.0) -> CachedValueFunction:
+    completion_model = BaseCompletionModel.create(
+        response_format=LLMResponseFormat.TOOLS, model="test-model", temperature=temperature
+    )
+    return CachedValueFunction(
+        value_function=LLMValueFunction(completion_model=completion_model), cache_path=cache_path
+    )
+
+
+def _completion_response(*args, **kwargs) -> CompletionResponse:
+    completion = Completion(model="test-model", usage=Usage(completion_cost=0.01, prompt_tokens=100))
+    return CompletionResponse(text_response="75", completion=completion)
+
+
+def test_cached_reward(tmp_path):
+    cache_path = str(tmp_path / "rewards.jsonl")
+    value_function = _create_value_function(cache_path)
+
+    with patch.object(type(value_function.value_function.completion_model), "create_completion") as create_completion:
+        create_completion.side_effect = _completion_response
+
+        reward, completion = value_function.get_reward(_create_node(1, "Tests passed"))
+        assert reward.value == 75
+        assert completion.usage.completion_cost == 0.01
+
+        # Another node with the same prompt gets the cached reward without any cost
+        reward, completion = value_function.get_reward(_create_node(2, "Tests passed"))
+        assert reward.value == 75
+        assert completion.usage.completion_cost == 0
+        assert CACHED_FLAG in completion.flags
+
+        value_function.get_reward(_create_node(3, "Tests failed"))
+        assert create_completion.call_count == 2
+        assert value_function.hit_rate == 1 / 3
+
+        # The cache is persisted, and the completion model config is part of the key
+        restored = _create_value_function(cache_path)
+        assert restored.get_reward(_create_node(4, "Tests failed"))[0].value == 75
+        assert create_completion.call_count == 2
+
+        _create_value_function(cache_path, temperature=0.5).get_reward(_create_node(5, "Tests failed"))
+        assert create_completion.call_count == 3
+
+
+def test_dump_and_validate_cached_value_function(tmp_path):
+    value_function = _create_value_function(str(tmp_path / "rewards.jsonl"))
+    data = value_function.model_dump()
+    assert data["value_function"]["value_function_class"].endswith("LLMValueFunction")
+
+    restored = BaseValueFunction.model_validate(data)
+    assert isinstance(restored, CachedValueFunction)
+    assert isinstance(restored.value_function, LLMValueFunction)
+    assert restored.cache_path == value_function.cache_path
+
+
+def _create_node_with_state(node_id: int, span_id: str, finish_reason: str = "done") -> Node:
+    node = Node(node_id=node_id, file_context=FileContext(repo=InMemRepository({"file.py": "def foo():\n    pass\n"})))
+    node.action = FinishArgs(thoughts=f"thoughts {node_id}", finish_reason=finish_reason)
+    node.observation = Observation(message="Tests passed")
+    node.file_context.add_span_to_context("file.py", span_id)
+    return node
+
+
+def test_default_cache_key_of_completion_value_function(tmp_path):
+    completion_model = BaseCompletionModel.create(response_format=LLMResponseFormat.TOOLS, model="test-model")
+    value_function = CachedValueFunction(
+        value_function=StateValueFunction(completion_model=completion_model), cache_path=str(tmp_path / "rewards.jsonl")
+    )
+
+    with patch.object(type(completion_model), "create_completion") as create_completion:
+        create_completion.side_effect = _completion_response
+
+        assert value_function.get_reward(_create_node_with_state(1, "foo"))[0].value == 75
+
+        # The same action reaching the same state is a cache hit, without a completion
+        reward, completion = value_function.get_reward(_create_node_with_state(2, "foo"))
+        assert reward.value == 75
+        assert CACHED_FLAG in completion.flags
+        assert create_completion.call_count == 1
+
+        # Another state or action is evaluated
+        value_function.get_reward(_create_node_with_state(3, "bar"))
+        value_function.get_reward(_create_node_with_state(4, "foo", finish_reason="other"))
+        assert create_completion.call_count == 3
+        assert value_function.cache.hits == 1
+
+    # Value functions without a completion model or nodes without state are not cached
+    assert FixedValueFunction().get_cache_key(_create_node_with_state(5, "foo")) is None
+    assert StateValueFunction(completion_model=completion_model).get_cache_key(_create_node(6, "Tests passed")) is None